@@ -0,0 +1,159 @@
+"""
+Packed test data bundles.
+
+A bundle holds every test data file of a judge spec in a single object, so
+that workers fetch one object instead of hundreds of tiny ones. Layout:
+
+    magic (8 bytes) | index size (8 bytes, BE) | index (JSON) | members
+
+The index maps each S3 key to the offset and length of its member (relative
+to the end of the index), its uncompressed size, sha1 and compression
+method. Members are compressed one by one, so any of them can be read
+without touching the others.
+
+Bundles are built when test data is published:
+
+    python -m treadmill.bundle <test data dir> <S3 prefix> <bundle file>
+"""
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+
+__all__ = [
+    'Bundle',
+    'BundleError',
+    'write_bundle'
+]
+
+
+MAGIC = b'TMBUNDL1'
+_HEADER = struct.Struct('>8sQ')
+_CHUNK_SIZE = 1 << 16
+
+
+class BundleError(Exception):
+    pass
+
+
+def _compress_member(src_path, dest):
+    """Appends the compressed file to `dest`. Returns (length, size, sha1, method)."""
+    start = dest.tell()
+    sha1 = hashlib.sha1()
+    compressor = zlib.compressobj(6)
+    size = 0
+    with open(src_path, 'rb') as src:
+        for chunk in iter(lambda: src.read(_CHUNK_SIZE), b''):
+            size += len(chunk)
+            sha1.update(chunk)
+            dest.write(compressor.compress(chunk))
+    dest.write(compressor.flush())
+    length = dest.tell() - start
+
+    if length < size:
+        return length, size, sha1.hexdigest(), 'zlib'
+
+    # Incompressible data is stored as is
+    dest.seek(start)
+    dest.truncate()
+    with open(src_path, 'rb') as src:
+        shutil.copyfileobj(src, dest)
+    return size, size, sha1.hexdigest(), 'stored'
+
+
+def write_bundle(files, bundle_path):
+    """Packs `files` (a dict of S3 keys to local paths) into `bundle_path`"""
+    members = {}
+    with tempfile.TemporaryFile() as data:
+        for key, src_path in sorted(files.items()):
+            offset = data.tell()
+            length, size, sha1, method = _compress_member(src_path, data)
+            members[key] = {
+                'offset': offset,
+                'length': length,
+                'size': size,
+                'sha1': sha1,
+                'method': method
+            }
+
+        index = json.dumps({'members': members}, sort_keys=True).encode('utf-8')
+        with open(bundle_path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(index)))
+            f.write(index)
+            data.seek(0)
+            shutil.copyfileobj(data, f)
+
+
+class Bundle(object):
+    """
+    Memory-mapped bundle. Members are extracted on demand and can be used in
+    place of an S3 fetcher (see `treadmill.services.fetchers`).
+    """
+
+    def __init__(self, bundle_path):
+        with open(bundle_path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, index_size = _HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise BundleError(f'{bundle_path} is not a bundle')
+            index_end = _HEADER.size + index_size
+            index = json.loads(self._mmap[_HEADER.size:index_end].decode('utf-8'))
+        except (struct.error, ValueError) as e:
+            self._mmap.close()
+            raise BundleError(f'Corrupted bundle {bundle_path}: {e}')
+        except BundleError:
+            self._mmap.close()
+            raise
+        self._data_offset = index_end
+        self._members = index['members']
+
+    def __contains__(self, key):
+        return key in self._members
+
+    def _chunks(self, key):
+        member = self._members[key]
+        start = self._data_offset + member['offset']
+        end = start + member['length']
+        decompressor = zlib.decompressobj() if member['method'] == 'zlib' else None
+        for chunk_start in range(start, end, _CHUNK_SIZE):
+            chunk = self._mmap[chunk_start:min(chunk_start + _CHUNK_SIZE, end)]
+            yield decompressor.decompress(chunk) if decompressor else chunk
+        if decompressor:
+            yield decompressor.flush()
+
+    def fetch(self, key, dest_path, etag=None):
+        """Extracts the member of `key` to `dest_path`, checking its sha1"""
+        sha1 = hashlib.sha1()
+        with open(dest_path, 'wb') as f:
+            for chunk in self._chunks(key):
+                sha1.update(chunk)
+                f.write(chunk)
+        if sha1.hexdigest() != self._members[key]['sha1']:
+            os.unlink(dest_path)
+            raise BundleError(f'Member {key} does not match its sha1')
+        return True, None
+
+    def close(self):
+        self._mmap.close()
+
+
+def main():
+    data_dir, prefix, bundle_path = sys.argv[1:4]
+    files = {
+        f'{prefix.rstrip("/")}/{name}': os.path.join(data_dir, name)
+        for name in os.listdir(data_dir)
+        if os.path.isfile(os.path.join(data_dir, name))
+    }
+    write_bundle(files, bundle_path)
+    print(f'Packed {len(files)} files into {bundle_path}')
+
+
+if __name__ == '__main__':
+    main()
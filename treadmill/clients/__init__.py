@@ -1 +1,3 @@
 from .api import APIClient
+from .engine import EngineClient, EngineContainer
+from .s3 import S3Client
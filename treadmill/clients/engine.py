@@ -0,0 +1,280 @@
+import asyncio
+import json
+import struct
+import threading
+
+import aiohttp
+import docker.auth
+import docker.errors
+from docker.models.containers import ExecResult
+
+from treadmill.config import BaseConfig
+
+
+__all__ = [
+    'AsyncDockerEngine',
+    'EngineClient',
+    'EngineContainer',
+    'read_multiplexed_stream'
+]
+
+
+# Docker multiplexes stdout/stderr of non-tty execs into frames of
+# [stream type (1 byte), padding (3 bytes), payload size (4 bytes, BE)]
+_FRAME_HEADER = struct.Struct('>BxxxL')
+
+
+async def read_multiplexed_stream(reader, on_output):
+    """Reads docker stream frames from `reader` until EOF"""
+    while True:
+        try:
+            header = await reader.readexactly(_FRAME_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return
+        _, size = _FRAME_HEADER.unpack(header)
+        if size:
+            on_output(await reader.readexactly(size))
+
+
+class AsyncDockerEngine(object):
+    """
+    Minimal asyncio client of the Docker Engine API over the local unix
+    socket. Connections are pooled by the underlying aiohttp session.
+    """
+
+    api_version = 'v1.30'
+
+    def __init__(self, socket_path, max_connections):
+        connector = aiohttp.UnixConnector(path=socket_path, limit=max_connections)
+        self._session = aiohttp.ClientSession(connector=connector)
+
+    def _url(self, path):
+        return f'http://docker/{self.api_version}{path}'
+
+    @staticmethod
+    async def _raise_for_status(resp):
+        if resp.status < 400:
+            return
+        explanation = await resp.text()
+        if resp.status == 404:
+            raise docker.errors.NotFound(explanation, explanation=explanation)
+        raise docker.errors.APIError(f'{resp.status} {resp.reason}',
+                                     explanation=explanation)
+
+    async def _request(self, method, path, **kwargs):
+        async with self._session.request(method, self._url(path), **kwargs) as resp:
+            await self._raise_for_status(resp)
+            if resp.content_type == 'application/json':
+                return await resp.json()
+
+    async def run_container(self, image, *, command=None, stdin_open=False, auto_remove=False,
+                            volumes=None, privileged=False, labels=None,
+                            cpuset_cpus=None, cpuset_mems=None):
+        binds = [
+            f'{host_path}:{bind["bind"]}:{bind.get("mode", "rw")}'
+            for host_path, bind in (volumes or {}).items()
+        ]
+        body = {
+            'Image': image,
+            'OpenStdin': stdin_open,
+            'Labels': labels or {},
+            'HostConfig': {
+                'AutoRemove': auto_remove,
+                'Privileged': privileged,
+                'Binds': binds,
+                'CpusetCpus': cpuset_cpus or '',
+                'CpusetMems': cpuset_mems or ''
+            }
+        }
+        if command is not None:
+            body['Cmd'] = [command] if isinstance(command, str) else command
+        created = await self._request('POST', '/containers/create', json=body)
+        container_id = created['Id']
+        await self._request('POST', f'/containers/{container_id}/start')
+        return container_id
+
+    async def inspect_container(self, container_id):
+        return await self._request('GET', f'/containers/{container_id}/json')
+
+    async def list_containers(self, filters=None):
+        params = {'filters': json.dumps(filters)} if filters else {}
+        return await self._request('GET', '/containers/json', params=params)
+
+    async def update_container(self, container_id, *, cpuset_cpus=None, cpuset_mems=None):
+        await self._request('POST', f'/containers/{container_id}/update', json={
+            'CpusetCpus': cpuset_cpus or '',
+            'CpusetMems': cpuset_mems or ''
+        })
+
+    async def kill_container(self, container_id):
+        await self._request('POST', f'/containers/{container_id}/kill')
+
+    async def inspect_image(self, name):
+        return await self._request('GET', f'/images/{name}/json')
+
+    async def pull_image(self, repository, tag, *, auth_header=None):
+        headers = {'X-Registry-Auth': auth_header} if auth_header else {}
+        params = {'fromImage': repository, 'tag': tag}
+        async with self._session.post(self._url('/images/create'),
+                                      params=params, headers=headers) as resp:
+            await self._raise_for_status(resp)
+            # Progress is streamed as JSON lines; errors show up in the stream
+            async for line in resp.content:
+                if line.strip():
+                    progress = json.loads(line.decode('utf-8'))
+                    if 'error' in progress:
+                        raise docker.errors.APIError(progress['error'])
+
+    async def exec(self, container_id, cmd, *, privileged=False, on_output=None):
+        """
+        Runs `cmd` in the container and streams its output to `on_output`
+        while it runs. Returns the exit code.
+        """
+        created = await self._request('POST', f'/containers/{container_id}/exec', json={
+            'Cmd': cmd,
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Privileged': privileged
+        })
+        exec_id = created['Id']
+        url = self._url(f'/exec/{exec_id}/start')
+        async with self._session.post(url, json={'Detach': False, 'Tty': False}) as resp:
+            await self._raise_for_status(resp)
+            await read_multiplexed_stream(resp.content, on_output or (lambda chunk: None))
+        inspected = await self._request('GET', f'/exec/{exec_id}/json')
+        return inspected['ExitCode']
+
+    async def close(self):
+        await self._session.close()
+
+
+class EngineContainer(object):
+    """Blocking container handle compatible with what treadmill uses of docker-py"""
+
+    def __init__(self, client: 'EngineClient', container_id, labels=None):
+        self.client = client
+        self.id = container_id
+        self.status = 'running'
+        self.labels = labels or {}
+
+    def exec_run(self, cmd, privileged=False, **kwargs):
+        chunks = []
+        exit_code = self.exec_stream(cmd, chunks.append, privileged=privileged)
+        return ExecResult(exit_code, b''.join(chunks))
+
+    def exec_stream(self, cmd, on_output, privileged=False):
+        """Runs `cmd`, calling `on_output` from the loop thread for each chunk"""
+        return self.client.call(self.client.engine.exec(
+            self.id, cmd, privileged=privileged, on_output=on_output
+        ))
+
+    def reload(self):
+        attrs = self.client.call(self.client.engine.inspect_container(self.id))
+        self.status = attrs['State']['Status']
+        self.labels = attrs['Config'].get('Labels') or {}
+
+    def update(self, cpuset_cpus=None, cpuset_mems=None, **kwargs):
+        self.client.call(self.client.engine.update_container(
+            self.id, cpuset_cpus=cpuset_cpus, cpuset_mems=cpuset_mems
+        ))
+
+    def kill(self):
+        self.client.call(self.client.engine.kill_container(self.id))
+        self.status = 'exited'
+
+
+class EngineImage(object):
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.id = attrs['Id']
+
+
+class _EngineImageCollection(object):
+    def __init__(self, client: 'EngineClient'):
+        self._client = client
+
+    def get(self, name):
+        try:
+            return EngineImage(self._client.call(self._client.engine.inspect_image(name)))
+        except docker.errors.NotFound as e:
+            raise docker.errors.ImageNotFound(str(e), explanation=e.explanation)
+
+    def pull(self, repository, tag=None, **kwargs):
+        # Reuse credentials stored by `docker login` (e.g. `aws ecr get-login`)
+        registry, _ = docker.auth.resolve_repository_name(repository)
+        authconfig = docker.auth.resolve_authconfig(docker.auth.load_config(), registry)
+        self._client.call(self._client.engine.pull_image(
+            repository, tag or 'latest',
+            auth_header=authconfig and docker.auth.encode_header(authconfig).decode('ascii')
+        ))
+        return self.get(f'{repository}:{tag or "latest"}')
+
+
+class _EngineContainerCollection(object):
+    def __init__(self, client: 'EngineClient'):
+        self._client = client
+
+    def run(self, image, command=None, *, detach=False, remove=False, stdin_open=False,
+            volumes=None, privileged=False, labels=None, cpuset_cpus=None, cpuset_mems=None,
+            **kwargs):
+        if kwargs:
+            raise TypeError(f'Unsupported arguments: {", ".join(sorted(kwargs))}')
+        if not detach:
+            # docker-py would wait for the container and return its logs
+            raise TypeError('Only detached containers are supported')
+        container_id = self._client.call(self._client.engine.run_container(
+            image, command=command, stdin_open=stdin_open, auto_remove=remove,
+            volumes=volumes, privileged=privileged, labels=labels,
+            cpuset_cpus=cpuset_cpus, cpuset_mems=cpuset_mems
+        ))
+        return EngineContainer(self._client, container_id, labels=labels)
+
+    def list(self, filters=None, **kwargs):
+        # The engine expects every filter value as a list
+        filters = {
+            key: value if isinstance(value, list) else [value]
+            for key, value in (filters or {}).items()
+        }
+        return [
+            EngineContainer(self._client, summary['Id'], labels=summary.get('Labels'))
+            for summary in self._client.call(self._client.engine.list_containers(filters))
+        ]
+
+    def get(self, container_id):
+        container = EngineContainer(self._client, container_id)
+        container.reload()
+        return container
+
+
+class EngineClient(object):
+    """
+    Blocking facade over `AsyncDockerEngine` with the subset of the docker-py
+    `DockerClient` interface used by treadmill. Every request runs on a
+    single event loop thread, so all judges of the worker process share
+    the pooled engine connections instead of blocking one socket each.
+    This only swaps the transport: tasks still run synchronously, so the
+    calling judge thread blocks until its request completes.
+    """
+
+    def __init__(self, config: BaseConfig):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        name='treadmill-docker-engine',
+                                        daemon=True)
+        self._thread.start()
+        self.engine = self.call(self._create_engine(config))
+        self.containers = _EngineContainerCollection(self)
+        self.images = _EngineImageCollection(self)
+
+    @staticmethod
+    async def _create_engine(config):
+        # aiohttp sessions must be created within the loop they run on
+        return AsyncDockerEngine(config.DOCKER_SOCKET_PATH, config.DOCKER_MAX_CONNECTIONS)
+
+    def call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def close(self):
+        self.call(self.engine.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,168 @@
+import hashlib
+import hmac
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from treadmill.config import BaseConfig
+from treadmill.signal import ObjectStoreError
+
+
+__all__ = [
+    'S3Client'
+]
+
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+def _hmac(key, msg):
+    return hmac.new(key, msg.encode('utf-8'), hashlib.sha256).digest()
+
+
+class S3Client(object):
+    """
+    Reads objects of `S3_BUCKET` directly from S3 (or any S3-compatible
+    store at `S3_ENDPOINT`, with path-style addressing) over pooled
+    connections. Requests are signed with AWS signature version 4 when
+    credentials are configured.
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, config: BaseConfig):
+        self._endpoint = config.S3_ENDPOINT.rstrip('/')
+        self._host = urlparse(self._endpoint).netloc
+        self._bucket = config.S3_BUCKET
+        self._region = config.S3_REGION
+        self._access_key_id = config.S3_ACCESS_KEY_ID
+        self._secret_access_key = config.S3_SECRET_ACCESS_KEY
+        self._part_bytes = config.S3_PART_BYTES
+        self._range_concurrency = config.S3_RANGE_CONCURRENCY
+        self._timeout = (config.S3_CONNECT_TIMEOUT_SECONDS, config.S3_READ_TIMEOUT_SECONDS)
+        self._sess = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.S3_MAX_CONNECTIONS)
+        self._sess.mount('http://', adapter)
+        self._sess.mount('https://', adapter)
+
+    def _object_path(self, key):
+        return quote(f'/{self._bucket}/{key}', safe='/~')
+
+    def _sign(self, method, path, headers):
+        now = datetime.utcnow()
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        datestamp = now.strftime('%Y%m%d')
+        headers.update({
+            'host': self._host,
+            'x-amz-date': amz_date,
+            'x-amz-content-sha256': 'UNSIGNED-PAYLOAD'
+        })
+        signed = sorted(key for key in headers if key == 'host' or key.startswith('x-amz-'))
+        canonical_request = '\n'.join([
+            method,
+            path,
+            '',  # No query string
+            ''.join(f'{key}:{headers[key].strip()}\n' for key in signed),
+            ';'.join(signed),
+            'UNSIGNED-PAYLOAD'
+        ])
+        scope = f'{datestamp}/{self._region}/s3/aws4_request'
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256',
+            amz_date,
+            scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()
+        ])
+        key = ('AWS4' + self._secret_access_key).encode('utf-8')
+        for part in (datestamp, self._region, 's3', 'aws4_request'):
+            key = _hmac(key, part)
+        signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['authorization'] = (
+            f'AWS4-HMAC-SHA256 Credential={self._access_key_id}/{scope}, '
+            f'SignedHeaders={";".join(signed)}, Signature={signature}'
+        )
+
+    def _get(self, key, headers):
+        path = self._object_path(key)
+        headers = {name.lower(): value for name, value in headers.items()}
+        if self._access_key_id:
+            self._sign('GET', path, headers)
+        try:
+            resp = self._sess.get(self._endpoint + path, headers=headers, stream=True,
+                                  timeout=self._timeout)
+        except requests.RequestException as e:
+            raise ObjectStoreError(f'GET {key} failed: {e}')
+        if resp.status_code == 404:
+            resp.close()
+            raise FileNotFoundError(f'No object {key} in bucket {self._bucket}')
+        if resp.status_code >= 400 and resp.status_code != 416:
+            message = f'GET {key} failed: {resp.status_code} {resp.text}'
+            resp.close()
+            raise ObjectStoreError(message)
+        return resp
+
+    def _write_body(self, resp, fd, offset):
+        with resp:
+            try:
+                for chunk in resp.iter_content(self.chunk_size):
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+            except requests.RequestException as e:
+                # e.g. the connection stalled for longer than the read timeout
+                raise ObjectStoreError(f'Reading {resp.url} failed: {e}')
+
+    def _get_part(self, key, etag, fd, start, end):
+        resp = self._get(key, {'Range': f'bytes={start}-{end}', 'If-Match': etag})
+        if resp.status_code != 206:
+            resp.close()
+            raise ObjectStoreError(f'Ranged GET of {key} failed: {resp.status_code}')
+        self._write_body(resp, fd, start)
+
+    def fetch(self, key, dest_path, etag=None):
+        """
+        Downloads the object to `dest_path`. With `etag`, nothing is downloaded
+        when the object is still the same. Objects larger than `S3_PART_BYTES`
+        are downloaded with concurrent ranged GETs.
+
+        Returns:
+            (whether `dest_path` was written, the ETag of the object)
+        """
+        headers = {'Range': f'bytes=0-{self._part_bytes - 1}'}
+        if etag:
+            headers['If-None-Match'] = etag
+        resp = self._get(key, headers)
+        if resp.status_code == 304:
+            resp.close()
+            return False, etag
+        if resp.status_code == 416:
+            # Empty objects cannot satisfy any range
+            resp.close()
+            resp = self._get(key, {})
+
+        etag = resp.headers.get('ETag')
+        match = _CONTENT_RANGE.match(resp.headers.get('Content-Range', ''))
+        size = int(match.group(3)) if resp.status_code == 206 and match else None
+
+        fd = os.open(dest_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if size is not None:
+                os.ftruncate(fd, size)
+            self._write_body(resp, fd, 0)
+            if size is not None and size > self._part_bytes:
+                parts = [
+                    (start, min(start + self._part_bytes, size) - 1)
+                    for start in range(self._part_bytes, size, self._part_bytes)
+                ]
+                with ThreadPoolExecutor(max_workers=self._range_concurrency) as executor:
+                    futures = [executor.submit(self._get_part, key, etag, fd, start, end)
+                               for start, end in parts]
+                    for future in futures:
+                        future.result()
+        finally:
+            os.close(fd)
+        return True, etag
@@ -1,4 +1,6 @@
 import os
+from typing import List
+
 from .models import Lang
 
 
@@ -15,9 +17,108 @@ class BaseConfig(object):
 
     SENTRY_DSN: str = None
 
+    # 'docker-py' (blocking client) or 'asyncio' (see treadmill.clients.engine)
+    DOCKER_BACKEND: str = 'docker-py'
+    DOCKER_SOCKET_PATH: str = '/var/run/docker.sock'
+    DOCKER_MAX_CONNECTIONS: int = 32
+
+    IMAGE_PULL_CONCURRENCY: int = 4
+    # Seconds between background re-pulls of every image tag (0 disables).
+    # Worker processes of a host take turns through IMAGE_REFRESH_LOCK_FILE,
+    # so that the tags are pulled once per interval per host
+    IMAGE_REFRESH_INTERVAL: float = 0
+    IMAGE_REFRESH_LOCK_FILE: str = '/tmp/treadmill/images.lock'
+
     HOST_WORKSPACE_ROOT: str = None
     S3FS_ROOT: str = None
 
+    # Where S3 objects are read from: 's3fs' (the FUSE mount at S3FS_ROOT)
+    # or 'native' (S3 API requests, see treadmill.clients.s3)
+    S3_BACKEND: str = 's3fs'
+    S3_ENDPOINT: str = 'https://s3.ap-northeast-1.amazonaws.com'
+    S3_REGION: str = 'ap-northeast-1'
+    S3_BUCKET: str = None
+    S3_ACCESS_KEY_ID: str = None
+    S3_SECRET_ACCESS_KEY: str = None
+    S3_MAX_CONNECTIONS: int = 32
+    # Objects larger than this are fetched with concurrent ranged GETs
+    S3_PART_BYTES: int = 8 * 1024 ** 2
+    S3_RANGE_CONCURRENCY: int = 4
+    # Seconds to connect, and to wait for each read, before a request fails
+    S3_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    S3_READ_TIMEOUT_SECONDS: float = 30.0
+
+    # tmpfs holding workspaces that fit into the budget (None disables);
+    # other workspaces stay under HOST_WORKSPACE_ROOT
+    TMPFS_WORKSPACE_ROOT: str = None
+    TMPFS_WORKSPACE_BUDGET_BYTES: int = 2 * 1024 ** 3
+    # Workspace bytes expected per testcase (data, outputs and logs), also
+    # the tmpfs space below which outputs may have been cut short
+    TMPFS_TESTCASE_ALLOWANCE_BYTES: int = 4 * 1024 ** 2
+    # Removed workspaces waiting for deletion in the background before
+    # judges wait for the cleaner on teardown
+    WORKSPACE_CLEANUP_BACKLOG: int = 16
+
+    # Node-local cache of test data shared by every request (None disables)
+    TESTDATA_CACHE_ROOT: str = None
+    TESTDATA_CACHE_MAX_BYTES: int = 10 * 1024 ** 3
+    # Read expected outputs in place from the cache, mounted read-only into
+    # every container (never into isolate boxes), instead of linking them
+    # into each workspace. Inputs are still linked into the workspace
+    SHARED_TESTDATA: bool = False
+
+    # Node-local store of build artifacts (e.g. compiled graders) shared by
+    # every request (None disables)
+    ARTIFACT_CACHE_ROOT: str = None
+    ARTIFACT_CACHE_MAX_BYTES: int = 2 * 1024 ** 3
+    # Store shared by every node (e.g. a network file system), on top of
+    # the local one (None disables)
+    ARTIFACT_SHARED_ROOT: str = None
+
+    # Locate the first difference of wrong outputs, which needs expected
+    # outputs staged even when they can be verified by digest
+    DETAILED_FEEDBACK: bool = False
+
+    # Number of test data files staged at the same time
+    STAGING_CONCURRENCY: int = 8
+    # Stage testcases on demand while judging instead of all of them
+    # (in the background) while compiling
+    LAZY_STAGING: bool = False
+    # Number of testcases staged ahead of the one being judged
+    STAGING_LOOKAHEAD: int = 2
+
+    # Number of idle containers kept per image tag (0 disables the pool).
+    # Pooled containers get workspaces bind-mounted on the host, which takes
+    # a root worker and HOST_WORKSPACE_ROOT on a shared mount
+    CONTAINER_POOL_SIZE: int = 0
+    CONTAINER_POOL_REFILL_INTERVAL: float = 1.0
+
+    # Bytes of exec output (e.g. compile errors) kept in memory; only the head
+    # and the tail are kept beyond it (0 disables truncation)
+    EXEC_OUTPUT_LIMIT_BYTES: int = 64 * 1024
+
+    # Number of isolate boxes initialized in each isolated sandbox container
+    ISOLATE_BOX_COUNT: int = 1
+
+    # Testcases of a testset judged concurrently (bounded by ISOLATE_BOX_COUNT)
+    TESTCASE_PARALLELISM: int = 1
+
+    # Host cpus handed out exclusively to isolated sandboxes; each box of a
+    # sandbox is pinned to one of its cpus (None disables cpu allocation)
+    SANDBOX_CPUS: List[int] = None
+    # Host cpus shared by builders and grader sandboxes
+    BUILDER_CPUS: List[int] = None
+    # Directory of the per-cpu lock files leasing SANDBOX_CPUS, shared by
+    # every worker process on the host
+    CPU_LOCK_DIR: str = '/tmp/treadmill/cpus'
+
+    # Run every testcase of a testset with a single docker exec
+    BATCHED_EXECUTION: bool = False
+
+    # Seconds a persistent grader may take to answer (or to start) before
+    # judges fall back to a grader execution per testcase
+    GRADER_CALL_TIMEOUT_SECONDS: float = 10.0
+
     GCC_BUILDER_TAG = reg('talk4u/treadmill-builder-gcc', '0.1.0')
     GO_BUILDER_TAG = reg('talk4u/treadmill-builder-go110', '0.1.0')
     JDK_BUILDER_TAG = reg('talk4u/treadmill-builder-jdk8', '0.1.0')
@@ -26,6 +127,14 @@ class BaseConfig(object):
     JRE_SANDBOX_TAG = reg('talk4u/treadmill-sandbox-jre8', '0.1.0')
     PY3_SANDBOX_TAG = reg('talk4u/treadmill-sandbox-py36', '0.1.1')
 
+    # Python 3.6 interpreter on the worker, to syntax-check Python sources
+    # without a builder container when the worker runs another version.
+    # When None, such workers check them in the builder container
+    PY3_HOST_PYTHON: str = None
+    # Seconds the host interpreter may take to check a source before the
+    # check falls back to the builder container
+    PY3_HOST_COMPILE_TIMEOUT_SECONDS: float = 10.0
+
     def __init__(self, **kwargs):
         for k, v in kwargs.items():
             setattr(self, k, v)
@@ -1,12 +1,18 @@
 import logging
 import threading
+from typing import Optional, Union
 
 import docker
 import raven
 
+from treadmill.bundle import Bundle
 from treadmill.models import JudgeRequest, Submission, JudgeSpec, Grader, Lang
-from treadmill.clients import APIClient
+from treadmill.clients import APIClient, EngineClient, S3Client
 from treadmill.config import BaseConfig
+from treadmill.services import (
+    ArtifactStore, ContainerPool, ContainerReaper, CpuAllocator, ImageRegistry, S3fsFetcher, TestDataCache,
+    TmpfsWorkspaces, WorkspaceCleaner, new_fetcher
+)
 from treadmill.utils import ReprMixin
 
 
@@ -31,9 +37,28 @@ class ContextMixin(object):
 class JudgeContextFactory(object):
     def __init__(self, config):
         self.config = config
-        self.docker_client = docker.from_env()
+        if config.DOCKER_BACKEND == 'asyncio':
+            self.docker_client = EngineClient(config)
+        else:
+            self.docker_client = docker.from_env()
+        self.image_registry = ImageRegistry(config, self.docker_client)
         self.api_client = APIClient(config)
         self.sentry_client = config.SENTRY_DSN and raven.Client(config.SENTRY_DSN)
+        self.container_reaper = ContainerReaper(config, self.docker_client)
+        self.container_pool = (
+            ContainerPool(config, self.docker_client, reaper=self.container_reaper)
+            if config.CONTAINER_POOL_SIZE > 0 else None
+        )
+        self.cpu_allocator = CpuAllocator(config) if config.SANDBOX_CPUS else None
+        self.s3_fetcher = new_fetcher(config)
+        self.testdata_cache = (
+            TestDataCache(config, self.s3_fetcher) if config.TESTDATA_CACHE_ROOT else None
+        )
+        self.tmpfs_workspaces = (
+            TmpfsWorkspaces(config) if config.TMPFS_WORKSPACE_ROOT else None
+        )
+        self.workspace_cleaner = WorkspaceCleaner(config)
+        self.artifact_store = ArtifactStore(config) if config.ARTIFACT_CACHE_ROOT else None
 
     def new(self, request):
         return JudgeContext(
@@ -41,7 +66,16 @@ class JudgeContextFactory(object):
             config=self.config,
             docker_client=self.docker_client,
             api_client=self.api_client,
-            sentry_client=self.sentry_client
+            s3_fetcher=self.s3_fetcher,
+            sentry_client=self.sentry_client,
+            container_pool=self.container_pool,
+            container_reaper=self.container_reaper,
+            image_registry=self.image_registry,
+            cpu_allocator=self.cpu_allocator,
+            testdata_cache=self.testdata_cache,
+            tmpfs_workspaces=self.tmpfs_workspaces,
+            workspace_cleaner=self.workspace_cleaner,
+            artifact_store=self.artifact_store
         )
 
 
@@ -60,14 +94,35 @@ class JudgeContext(ReprMixin):
 
     docker_client: docker.DockerClient
     api_client: APIClient
+    s3_fetcher: Union[S3Client, S3fsFetcher]
     sentry_client: raven.Client
+    container_pool: Optional[ContainerPool]
+    container_reaper: Optional[ContainerReaper]
+    image_registry: Optional[ImageRegistry]
+    cpu_allocator: Optional[CpuAllocator]
+    testdata_cache: Optional[TestDataCache]
+    testdata_stager: Optional['TestDataStager']
+    testdata_bundle: Optional[Bundle]
+    persistent_grader: Optional['PersistentGraderEnviron']
+    tmpfs_workspaces: Optional[TmpfsWorkspaces]
+    workspace_cleaner: Optional[WorkspaceCleaner]
+    artifact_store: Optional[ArtifactStore]
 
     def __init__(self, *,
                  request: JudgeRequest,
                  config: BaseConfig,
                  docker_client: docker.DockerClient,
                  api_client: APIClient,
-                 sentry_client: raven.Client):
+                 sentry_client: raven.Client,
+                 s3_fetcher: Union[S3Client, S3fsFetcher] = None,
+                 container_pool: Optional[ContainerPool] = None,
+                 container_reaper: Optional[ContainerReaper] = None,
+                 image_registry: Optional[ImageRegistry] = None,
+                 cpu_allocator: Optional[CpuAllocator] = None,
+                 testdata_cache: Optional[TestDataCache] = None,
+                 tmpfs_workspaces: Optional[TmpfsWorkspaces] = None,
+                 workspace_cleaner: Optional[WorkspaceCleaner] = None,
+                 artifact_store: Optional[ArtifactStore] = None):
         self.request = request
         self.config = config
 
@@ -77,7 +132,19 @@ class JudgeContext(ReprMixin):
 
         self.docker_client = docker_client
         self.api_client = api_client
+        self.s3_fetcher = s3_fetcher
         self.sentry_client = sentry_client
+        self.container_pool = container_pool
+        self.container_reaper = container_reaper
+        self.image_registry = image_registry
+        self.cpu_allocator = cpu_allocator
+        self.testdata_cache = testdata_cache
+        self.testdata_stager = None
+        self.testdata_bundle = None
+        self.persistent_grader = None
+        self.tmpfs_workspaces = tmpfs_workspaces
+        self.workspace_cleaner = workspace_cleaner
+        self.artifact_store = artifact_store
 
         self._logger = logging.getLogger('treadmill')
 
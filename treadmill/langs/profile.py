@@ -52,6 +52,14 @@ class LangProfile(ABC):
     def get_compile_cmd(self, src_file, out_file):
         pass
 
+    def compile_on_host(self, config, src_file, display_src_file):
+        """
+        Compiles `src_file` on the worker itself, as the compile command
+        would in the builder, with errors mentioning `display_src_file`.
+        Returns (exit code, output), or None when the worker cannot.
+        """
+        return None
+
     @abstractmethod
     def get_exec_cmd(self, bin_file, args=()):
         pass
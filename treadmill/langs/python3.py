@@ -1,6 +1,30 @@
+import logging
+import subprocess
+import sys
+
 from .profile import LangProfile
 
 
+_logger = logging.getLogger('treadmill.langs.python3')
+
+
+# Same as `python -m py_compile`, with errors mentioning the given file name
+_PY_COMPILE_SCRIPT = """
+import py_compile, sys
+try:
+    py_compile.compile(sys.argv[1], dfile=sys.argv[2], doraise=True)
+except py_compile.PyCompileError as error:
+    sys.stderr.write("%s\\n" % error.msg)
+    sys.exit(1)
+except OSError as error:
+    sys.stderr.write("%s\\n" % error)
+    sys.exit(1)
+"""
+
+# Whether each host interpreter turned out to be Python 3.6
+_host_pythons = {}
+
+
 class Python36(LangProfile, lang_name='python3'):
     @property
     def src_file_name(self):
@@ -23,5 +47,54 @@ class Python36(LangProfile, lang_name='python3'):
     def get_compile_cmd(self, src_file, out_file):
         return ['/usr/local/bin/python', '-m', 'py_compile', src_file]
 
+    def compile_on_host(self, config, src_file, display_src_file):
+        # Untrusted sources are compiled in a subprocess, bounded in time and
+        # isolated from crashes (e.g. parser stack overflows) of the parser
+        executable = self.host_python(config)
+        if executable is None:
+            return None
+        try:
+            process = subprocess.run(
+                [executable, '-c', _PY_COMPILE_SCRIPT, src_file, display_src_file],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                timeout=config.PY3_HOST_COMPILE_TIMEOUT_SECONDS
+            )
+        except subprocess.TimeoutExpired:
+            _logger.warning(f'{executable} timed out, checking {src_file} in builder')
+            return None
+        if process.returncode < 0:
+            # Killed by a signal, which says nothing about the source
+            _logger.warning(f'{executable} died of signal {-process.returncode}, '
+                            f'checking {src_file} in builder')
+            return None
+        return process.returncode, process.stdout
+
+    def host_python(self, config):
+        """
+        Returns the Python 3.6 interpreter of the worker (bytecode and error
+        messages depend on the version): its own when it runs 3.6, otherwise
+        PY3_HOST_PYTHON if that is 3.6, which is asked only the first time
+        (workers do so at startup). Returns None when there is none.
+        """
+        if sys.version_info[:2] == (3, 6):
+            return sys.executable
+        executable = config.PY3_HOST_PYTHON
+        if not executable:
+            return None
+        if executable not in _host_pythons:
+            try:
+                process = subprocess.run(
+                    [executable, '-c', 'import sys; print(*sys.version_info[:2])'],
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                    timeout=config.PY3_HOST_COMPILE_TIMEOUT_SECONDS
+                )
+                version = process.stdout.split() if process.returncode == 0 else None
+            except (OSError, subprocess.TimeoutExpired):
+                version = None
+            _host_pythons[executable] = version == [b'3', b'6']
+            if not _host_pythons[executable]:
+                _logger.warning(f'{executable} is not Python 3.6, checking sources in builder')
+        return executable if _host_pythons[executable] else None
+
     def get_exec_cmd(self, bin_file, args=()):
         return ['/usr/local/bin/python', bin_file, *args]
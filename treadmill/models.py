@@ -13,6 +13,10 @@ class TestCase(DataModel):
     id: int  # index from 0
     input_file: S3Key
     output_file: S3Key
+    # sha1 and length of the output file normalized as in
+    # `treadmill.utils.compare.normalized_digest`, if known
+    output_digest: Optional[str] = None
+    output_length: Optional[int] = None
     created_at: datetime
 
 
@@ -39,19 +43,37 @@ class Lang(enum.Enum):
 class Grader(DataModel):
     src_file: S3Key
     lang: Lang
+    persistent: bool = False  # Speaks the persistent protocol, see `treadmill.tasks.grader`
     created_at: datetime
     updated_at: datetime
 
 
+class CheckerType(enum.Enum):
+    EXACT = 'exact'
+    LINE = 'line'
+    TOKEN = 'token'
+    CASE_INSENSITIVE = 'case_insensitive'
+    FLOAT = 'float'
+
+
+class Checker(DataModel):
+    """Built-in checker of outputs, see `treadmill.utils.checkers`"""
+    type: CheckerType
+    abs_epsilon: float = 1e-6  # Only for FLOAT
+    rel_epsilon: float = 1e-6  # Only for FLOAT
+
+
 class JudgeSpec(DataModel):
     total_score: int = 100
     testsets: List[TestSet]
     grader: Optional[Grader]
+    checker: Optional[Checker] = None  # Ignored when there is a grader
     mem_limit_bytes: int
     time_limit_seconds: float
     file_size_limit_kilos: int = 0
     pid_limits: int = 1
     updated_at: datetime
+    bundle: Optional[S3Key] = None  # Packed test data, see `treadmill.bundle`
 
 
 class Problem(DataModel):
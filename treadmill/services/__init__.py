@@ -0,0 +1,9 @@
+from .artifacts import ArtifactStore
+from .cleaner import WorkspaceCleaner
+from .containers import ContainerPool
+from .cpus import CpuAllocator, CpuSet
+from .fetchers import S3fsFetcher, new_fetcher
+from .images import ImageRegistry
+from .reaper import ContainerReaper
+from .testdata import TestDataCache
+from .workspaces import TmpfsWorkspaces
@@ -0,0 +1,108 @@
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from treadmill.config import BaseConfig
+from treadmill.utils import ObjectDict
+from .lru import evict_lru
+
+
+__all__ = [
+    'ArtifactStore'
+]
+
+
+_logger = logging.getLogger('treadmill.services.artifacts')
+
+
+class ArtifactStore(object):
+    """
+    Content-addressed store of build artifacts (compiled graders and submissions).
+    Each entry is a directory of named files, stored under a key derived
+    from everything the build depends on, so entries never go stale: a
+    changed source or builder image simply yields another key.
+
+    Entries live in a node-local tier at `ARTIFACT_CACHE_ROOT`, trimmed to
+    `ARTIFACT_CACHE_MAX_BYTES` least recently used first, and in an
+    optional shared tier at `ARTIFACT_SHARED_ROOT` (e.g. a network file
+    system mounted on every node). Entries found in the shared tier only
+    are copied to the local tier.
+    """
+
+    def __init__(self, config: BaseConfig):
+        self._root = config.ARTIFACT_CACHE_ROOT
+        self._shared_root = config.ARTIFACT_SHARED_ROOT
+        self._max_bytes = config.ARTIFACT_CACHE_MAX_BYTES
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        os.makedirs(self._root, mode=0o755, exist_ok=True)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return ObjectDict(hits=self.hits, shared_hits=self.shared_hits, misses=self.misses)
+
+    @staticmethod
+    def _entry_path(root, key):
+        return os.path.join(root, key[:2], key)
+
+    @staticmethod
+    def _publish(root, key, files):
+        """Writes the files as the entry of `key` under `root`, atomically"""
+        entry_path = ArtifactStore._entry_path(root, key)
+        if os.path.isdir(entry_path):
+            return
+        os.makedirs(os.path.dirname(entry_path), mode=0o755, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(entry_path), prefix='.')
+        try:
+            for name, src_path in files.items():
+                shutil.copy2(src_path, os.path.join(tmp_path, name))
+            os.chmod(tmp_path, 0o755)
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(entry_path):  # Otherwise published concurrently
+                raise
+
+    def lookup(self, key):
+        """Returns the local entry directory of `key`, or None on a miss"""
+        entry_path = self._entry_path(self._root, key)
+        if os.path.isdir(entry_path):
+            os.utime(entry_path)  # Keeps the LRU order
+            with self._lock:
+                self.hits += 1
+            return entry_path
+
+        shared_path = self._shared_root and self._entry_path(self._shared_root, key)
+        if shared_path and os.path.isdir(shared_path):
+            files = {name: os.path.join(shared_path, name) for name in os.listdir(shared_path)}
+            try:
+                self._publish(self._root, key, files)
+            except OSError as e:
+                _logger.warning(f'Failed to copy shared artifact {key}: {e}')
+                return None
+            with self._lock:
+                self.shared_hits += 1
+            self._evict()
+            return entry_path
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, key, files):
+        """Stores `files`, a dict of names to paths, as the entry of `key`"""
+        self._publish(self._root, key, files)
+        if self._shared_root:
+            try:
+                self._publish(self._shared_root, key, files)
+            except OSError as e:
+                _logger.warning(f'Failed to share artifact {key}: {e}')
+        self._evict()
+
+    def _evict(self):
+        evict_lru(self._root, self._max_bytes)
@@ -0,0 +1,125 @@
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+from treadmill.config import BaseConfig
+from .reaper import is_alive as _is_alive
+
+
+__all__ = [
+    'WorkspaceCleaner'
+]
+
+
+_logger = logging.getLogger('treadmill.services.cleaner')
+
+
+OWNER_FILE_NAME = '.owner'
+TRASH_DIR_NAME = '.trash'
+
+# Workspaces without an owner file younger than this may be being created
+_UNCLAIMED_GRACE_SECONDS = 60
+
+
+class WorkspaceCleaner(object):
+    """
+    Removes workspaces in a background thread so that judges do not wait for
+    large workspaces to be deleted on teardown. Workspaces are renamed into
+    a trash directory right away and deleted later; at most
+    `WORKSPACE_CLEANUP_BACKLOG` of them wait for deletion, after which
+    `remove` blocks until the cleaner catches up.
+    """
+
+    def __init__(self, config: BaseConfig):
+        self._config = config
+        self._queue = queue.Queue(maxsize=config.WORKSPACE_CLEANUP_BACKLOG)
+        self._thread = None
+
+    @property
+    def _roots(self):
+        return [root for root in (self._config.HOST_WORKSPACE_ROOT,
+                                  self._config.TMPFS_WORKSPACE_ROOT) if root]
+
+    @property
+    def _trash_dir(self):
+        return os.path.join(self._config.HOST_WORKSPACE_ROOT, TRASH_DIR_NAME)
+
+    def start(self):
+        if self._thread is None:
+            os.makedirs(self._trash_dir, mode=0o755, exist_ok=True)
+            self._thread = threading.Thread(
+                target=self._clean_forever,
+                name='treadmill-workspace-cleaner',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stops the cleaner after every queued workspace has been deleted"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    @staticmethod
+    def claim(workspace_path):
+        """Marks the workspace as owned by this worker process"""
+        with open(os.path.join(workspace_path, OWNER_FILE_NAME), 'w') as f:
+            f.write(str(os.getpid()))
+
+    def remove(self, workspace_path):
+        if self._thread is None:
+            shutil.rmtree(workspace_path)
+            return
+        os.makedirs(self._trash_dir, mode=0o755, exist_ok=True)
+        trash_path = os.path.join(self._trash_dir, uuid.uuid4().hex)
+        os.rename(workspace_path, trash_path)
+        self._queue.put(trash_path)  # Blocks while the backlog is full
+
+    def _clean_forever(self):
+        while True:
+            trash_path = self._queue.get()
+            if trash_path is None:
+                return
+            shutil.rmtree(trash_path, ignore_errors=True)
+
+    def _is_orphan(self, workspace_path):
+        try:
+            with open(os.path.join(workspace_path, OWNER_FILE_NAME)) as f:
+                return not _is_alive(int(f.read()))
+        except (FileNotFoundError, ValueError):
+            try:
+                age = time.time() - os.lstat(workspace_path).st_mtime
+            except FileNotFoundError:
+                return False
+            return age > _UNCLAIMED_GRACE_SECONDS
+
+    def sweep(self):
+        """
+        Empties the trash and deletes the workspaces left behind by dead
+        worker processes (e.g. after a crash). Returns the number of
+        workspaces deleted. The trash directory itself stays, as other
+        processes may be moving workspaces into it.
+        """
+        if os.path.isdir(self._trash_dir):
+            for name in os.listdir(self._trash_dir):
+                shutil.rmtree(os.path.join(self._trash_dir, name), ignore_errors=True)
+        removed = 0
+        for root in self._roots:
+            if not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                workspace_path = os.path.join(root, name)
+                if name.startswith('.') or not self._is_orphan(workspace_path):
+                    continue
+                _logger.info(f'Removing orphan workspace {workspace_path}')
+                if os.path.islink(workspace_path):
+                    os.unlink(workspace_path)  # Its tmpfs directory is swept too
+                else:
+                    shutil.rmtree(workspace_path, ignore_errors=True)
+                removed += 1
+        return removed
@@ -0,0 +1,310 @@
+import collections
+import logging
+import os
+import queue
+import subprocess
+import threading
+import uuid
+
+import docker
+
+from treadmill.clients import EngineContainer
+from treadmill.config import BaseConfig
+from treadmill.models import Lang
+from .reaper import worker_labels
+
+
+__all__ = [
+    'run_container',
+    'exec_streaming',
+    'ContainerPool'
+]
+
+
+_logger = logging.getLogger('treadmill.services.containers')
+
+
+# Directory under HOST_WORKSPACE_ROOT of the mount points of pooled containers
+POOL_SLOTS_DIR_NAME = '.pool'
+
+# Workspace location expected by `treadmill.tasks.path.AFP`
+CONTAINER_WORKSPACE = '/workspace'
+
+# Test data cache location expected by `treadmill.tasks.path.SharedTestDataFile`
+CONTAINER_TESTDATA = '/testdata'
+
+
+def run_container(docker_client, container_tag, *, volumes=None, privileged=False,
+                  cpuset=None, request_id=None):
+    kwargs = dict(
+        command='/bin/sh',  # Assume alpine based image (bash not installed)
+        stdin_open=True,     # Keep /bin/sh alive
+        remove=True,         # Discard changes made in image after run
+        detach=True,         # Run in background
+        labels=worker_labels(request_id)  # Lets the reaper sweep orphans
+    )
+    if volumes:
+        kwargs.update(volumes=volumes)
+    if privileged:
+        kwargs.update(privileged=True)
+    if cpuset:
+        kwargs.update(cpuset_cpus=cpuset.cpuset_cpus, cpuset_mems=cpuset.cpuset_mems)
+    return docker_client.containers.run(container_tag, **kwargs)
+
+
+def exec_streaming(container, cmd, on_output, *, privileged=False):
+    """
+    Runs `cmd` in the container, passing output chunks to `on_output` as
+    they arrive instead of buffering the whole output. Returns the exit code.
+    """
+    if isinstance(container, EngineContainer):
+        return container.exec_stream(cmd, on_output, privileged=privileged)
+
+    # `Container.exec_run(stream=True)` does not report the exit code
+    api = container.client.api
+    exec_id = api.exec_create(container.id, cmd, privileged=privileged)['Id']
+    for chunk in api.exec_start(exec_id, stream=True):
+        on_output(chunk)
+    return api.exec_inspect(exec_id)['ExitCode']
+
+
+class ContainerPool(object):
+    """
+    Pool of pre-started containers keyed by (image tag, privileged).
+
+    Each pooled container mounts an empty slot directory of its own at
+    `/workspace`, with slave propagation. When a container is leased, the
+    workspace of the leasing request is bind-mounted onto its slot on the
+    host, so the container sees that workspace and no other. The workspace
+    is unmounted again (and isolate boxes cleaned up) before the container
+    is reused. This takes a worker running as root, with the slots on a
+    shared mount (the default on systemd hosts).
+    Resets, refills and health checks run in a background thread.
+    Evicted containers are handed to `reaper` when given.
+    """
+
+    def __init__(self, config: BaseConfig, docker_client, reaper=None):
+        self._config = config
+        self._docker_client = docker_client
+        self._reaper = reaper
+        self._size = config.CONTAINER_POOL_SIZE
+        self._interval = config.CONTAINER_POOL_REFILL_INTERVAL
+        self._idle = collections.defaultdict(collections.deque)
+        self._leased = {}
+        self._slots = {}  # Container id to slot directory
+        self._dirty = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def warm_keys(self):
+        keys = set()
+        for lang in Lang:
+            if lang == Lang.UNKNOWN:
+                continue
+            profile = lang.profile
+            keys.add((profile.builder_image_tag(self._config), False))
+            keys.add((profile.sandbox_image_tag(self._config), True))
+        return keys
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._maintain,
+                name='treadmill-container-pool',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            idle = [c for containers in self._idle.values() for c in containers]
+            self._idle.clear()
+        for container in idle:
+            self._evict(container)
+
+    def lease(self, container_tag, *, privileged=False, workspace_id, cpuset=None):
+        key = (container_tag, privileged)
+        while True:
+            with self._lock:
+                idle = self._idle[key]
+                container = idle.popleft() if idle else None
+            if container is None:
+                container = self._start(key)
+            elif not self._is_healthy(container):
+                self._evict(container)
+                continue
+            if self._attach(container, workspace_id) and self._pin(container, cpuset):
+                break
+            self._evict(container)
+
+        with self._lock:
+            self._leased[container.id] = key
+        return container
+
+    def release(self, container):
+        with self._lock:
+            key = self._leased.pop(container.id, None)
+        if key is None:
+            self._evict(container)
+        else:
+            self._dirty.put((key, container))
+
+    def _start(self, key):
+        container_tag, privileged = key
+        slot = os.path.join(self._config.HOST_WORKSPACE_ROOT, POOL_SLOTS_DIR_NAME,
+                            uuid.uuid4().hex)
+        os.makedirs(slot, mode=0o755)
+        volumes = {
+            slot: {
+                'bind': CONTAINER_WORKSPACE,
+                'mode': 'rw,rslave'  # Sees the workspace mounted on the slot later
+            }
+        }
+        if self._config.SHARED_TESTDATA and self._config.TESTDATA_CACHE_ROOT:
+            volumes[self._config.TESTDATA_CACHE_ROOT] = {
+                'bind': CONTAINER_TESTDATA,
+                'mode': 'ro'
+            }
+        try:
+            container = run_container(
+                self._docker_client,
+                container_tag,
+                volumes=volumes,
+                privileged=privileged
+            )
+        except BaseException:
+            os.rmdir(slot)
+            raise
+        with self._lock:
+            self._slots[container.id] = slot
+        return container
+
+    @staticmethod
+    def _exec(container, script):
+        return container.exec_run(['/bin/sh', '-c', script])
+
+    @staticmethod
+    def _mount(*args):
+        process = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            _logger.warning(f'{" ".join(args)} failed: {process.stderr.decode(errors="replace")}')
+        return process.returncode == 0
+
+    def _attach(self, container, workspace_id):
+        with self._lock:
+            slot = self._slots.get(container.id)
+        workspace_path = os.path.join(self._config.HOST_WORKSPACE_ROOT, workspace_id)
+        # A workspace moved to the tmpfs is a link, which the bind follows
+        return slot is not None and self._mount('mount', '--bind', workspace_path, slot)
+
+    @staticmethod
+    def _pin(container, cpuset):
+        if cpuset is None:
+            return True
+        try:
+            container.update(cpuset_cpus=cpuset.cpuset_cpus,
+                             cpuset_mems=cpuset.cpuset_mems)
+        except docker.errors.APIError:
+            return False
+        return True
+
+    def _reset(self, key, container):
+        _, privileged = key
+        if privileged:
+            script = ' && '.join(f'isolate --cg --box-id={box_id} --cleanup'
+                                 for box_id in range(self._config.ISOLATE_BOX_COUNT))
+            if self._exec(container, script).exit_code != 0:
+                return False
+        with self._lock:
+            slot = self._slots.get(container.id)
+        return slot is not None and self._mount('umount', slot)
+
+    @staticmethod
+    def _is_healthy(container):
+        try:
+            container.reload()
+        except docker.errors.APIError:
+            return False
+        return container.status == 'running'
+
+    def _evict(self, container):
+        with self._lock:
+            slot = self._slots.pop(container.id, None)
+        if slot is not None:
+            if os.path.ismount(slot):
+                self._mount('umount', '--lazy', slot)
+            try:
+                os.rmdir(slot)  # Never deletes a workspace still mounted on it
+            except OSError:
+                _logger.warning(f'Failed to remove pool slot {slot}')
+        if self._reaper:
+            self._reaper.reap(container)
+            return
+        try:
+            container.kill()
+        except docker.errors.APIError:
+            _logger.warning(f'Failed to kill pooled container {container.id}')
+
+    def _put_idle(self, key, container):
+        with self._lock:
+            idle = self._idle[key]
+            if len(idle) < self._size:
+                idle.append(container)
+                return
+        self._evict(container)
+
+    def _recycle_dirty(self):
+        while True:
+            try:
+                key, container = self._dirty.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                reset = self._is_healthy(container) and self._reset(key, container)
+            except docker.errors.APIError:
+                reset = False
+            if reset:
+                self._put_idle(key, container)
+            else:
+                self._evict(container)
+
+    def _evict_unhealthy(self):
+        with self._lock:
+            snapshot = {key: list(idle) for key, idle in self._idle.items()}
+        for key, containers in snapshot.items():
+            for container in containers:
+                if not self._is_healthy(container):
+                    with self._lock:
+                        try:
+                            self._idle[key].remove(container)
+                        except ValueError:
+                            continue  # Leased in the meantime
+                    self._evict(container)
+
+    def _refill(self):
+        for key in self.warm_keys:
+            while not self._stopped.is_set():
+                with self._lock:
+                    if len(self._idle[key]) >= self._size:
+                        break
+                try:
+                    container = self._start(key)
+                except docker.errors.APIError:
+                    _logger.exception(f'Failed to start pooled container {key}')
+                    break
+                self._put_idle(key, container)
+
+    def _maintain(self):
+        while not self._stopped.wait(self._interval):
+            try:
+                self._recycle_dirty()
+                self._evict_unhealthy()
+                self._refill()
+            except Exception:
+                _logger.exception('Container pool maintenance failed')
@@ -0,0 +1,131 @@
+import fcntl
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+from docker.utils import parse_repository_tag
+
+from treadmill.config import BaseConfig
+
+
+__all__ = [
+    'ImageRegistry'
+]
+
+
+_logger = logging.getLogger('treadmill.services.images')
+
+
+class ImageRegistry(object):
+    """
+    Makes sure every image tag in the config is present on this node and
+    remembers the digest (image id) each tag currently resolves to.
+    """
+
+    def __init__(self, config: BaseConfig, docker_client):
+        self._config = config
+        self._docker_client = docker_client
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def tags(self):
+        return sorted({
+            getattr(self._config, name)
+            for name in dir(self._config)
+            if name.endswith('_TAG') and getattr(self._config, name)
+        })
+
+    def digest(self, tag):
+        with self._lock:
+            return self._digests.get(tag)
+
+    def _pull(self, tag):
+        repository, version = parse_repository_tag(tag)
+        image = self._docker_client.images.pull(repository, tag=version)
+        self._record(tag, image)
+        return image
+
+    def _ensure(self, tag):
+        try:
+            image = self._docker_client.images.get(tag)
+        except docker.errors.ImageNotFound:
+            _logger.info(f'Pulling missing image {tag}')
+            return self._pull(tag)
+        self._record(tag, image)
+        return image
+
+    def _record(self, tag, image):
+        with self._lock:
+            previous = self._digests.get(tag)
+            self._digests[tag] = image.id
+        if previous and previous != image.id:
+            _logger.info(f'Image {tag} updated: {previous} -> {image.id}')
+
+    def _for_each_tag(self, fn):
+        tags = self.tags
+        with ThreadPoolExecutor(max_workers=self._config.IMAGE_PULL_CONCURRENCY) as executor:
+            # Consume results so that the first failure is raised
+            list(executor.map(fn, tags))
+
+    def prepare(self):
+        """Pulls missing images concurrently. Blocks until all of them are present."""
+        self._for_each_tag(self._ensure)
+        _logger.info(f'{len(self.tags)} images ready')
+
+    def refresh(self):
+        """Pulls every tag again to pick up images re-pushed under the same tag"""
+        self._for_each_tag(self._pull)
+
+    def refresh_once_per_host(self):
+        """
+        Refreshes images unless another process of this host did within the
+        interval, in which case only the digests of the images it pulled are
+        picked up.
+        """
+        lock_file = self._config.IMAGE_REFRESH_LOCK_FILE
+        os.makedirs(os.path.dirname(lock_file), exist_ok=True)
+        fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass  # Being refreshed by another process
+            else:
+                # The lock file holds the time of the last refresh
+                with open(fd, closefd=False) as f:
+                    last_refresh = float(f.read() or 0)
+                if time.time() - last_refresh >= self._config.IMAGE_REFRESH_INTERVAL:
+                    self.refresh()
+                    os.pwrite(fd, str(time.time()).encode('ascii').ljust(32), 0)
+                    return
+        finally:
+            os.close(fd)
+        self._for_each_tag(self._ensure)
+
+    def start_refresh(self):
+        if self._thread is None and self._config.IMAGE_REFRESH_INTERVAL > 0:
+            self._thread = threading.Thread(
+                target=self._refresh_periodically,
+                name='treadmill-image-refresh',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _refresh_periodically(self):
+        while not self._stopped.wait(self._config.IMAGE_REFRESH_INTERVAL):
+            try:
+                self.refresh_once_per_host()
+            except docker.errors.APIError:
+                _logger.exception('Failed to refresh images')
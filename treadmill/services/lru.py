@@ -0,0 +1,72 @@
+import fcntl
+import os
+import shutil
+
+
+__all__ = [
+    'evict_lru'
+]
+
+
+LOCK_FILE_NAME = '.lock'
+
+
+def _scan(root):
+    """
+    Returns (mtime, entry path, size) of the entries `root/<xx>/<name>`,
+    oldest access first. Entries are files or directories of files; names
+    starting with a dot (unfinished writes, pins, the lock file) are skipped.
+    """
+    entries = []
+    for shard in os.scandir(root):
+        if shard.name.startswith('.') or not shard.is_dir(follow_symlinks=False):
+            continue
+        for entry in os.scandir(shard.path):
+            if entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+                size = (sum(f.stat().st_size for f in os.scandir(entry.path))
+                        if entry.is_dir(follow_symlinks=False) else stat.st_size)
+            except FileNotFoundError:
+                continue  # Evicted concurrently
+            entries.append((stat.st_mtime_ns, entry.path, size))
+    return sorted(entries)
+
+
+def _remove(entry_path):
+    if os.path.isdir(entry_path):
+        shutil.rmtree(entry_path, ignore_errors=True)
+        return
+    try:
+        os.unlink(entry_path)
+    except FileNotFoundError:
+        pass
+
+
+def evict_lru(root, max_bytes, is_pinned=None):
+    """
+    Evicts the least recently used (by mtime) entries under `root` until
+    they take at most `max_bytes`, skipping those `is_pinned` returns true
+    for. The entry used last is never evicted, however large it is. Worker
+    processes sharing `root` evict one at a time, from what is on disk.
+
+    Returns (number of entries left, their size, evicted entry paths).
+    """
+    lock_fd = os.open(os.path.join(root, LOCK_FILE_NAME), os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        entries = _scan(root)
+        size = sum(entry_size for _, _, entry_size in entries)
+        evicted = []
+        for _, entry_path, entry_size in entries[:-1]:
+            if size <= max_bytes:
+                break
+            if is_pinned and is_pinned(entry_path):
+                continue
+            _remove(entry_path)
+            size -= entry_size
+            evicted.append(entry_path)
+    finally:
+        os.close(lock_fd)
+    return len(entries) - len(evicted), size, evicted
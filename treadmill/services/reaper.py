@@ -0,0 +1,120 @@
+import logging
+import os
+import queue
+import socket
+import threading
+
+import docker
+
+from treadmill.config import BaseConfig
+
+
+__all__ = [
+    'worker_labels',
+    'is_alive',
+    'ContainerReaper'
+]
+
+
+_logger = logging.getLogger('treadmill.services.reaper')
+
+
+HOST_LABEL = 'treadmill.host'
+PID_LABEL = 'treadmill.pid'
+WORKER_LABEL = 'treadmill.worker'
+REQUEST_LABEL = 'treadmill.request'
+
+
+def worker_labels(request_id=None):
+    """Labels identifying the worker process (and request) owning a container"""
+    host, pid = socket.gethostname(), os.getpid()
+    labels = {
+        HOST_LABEL: host,
+        PID_LABEL: str(pid),
+        WORKER_LABEL: f'{host}:{pid}'
+    }
+    if request_id is not None:
+        labels[REQUEST_LABEL] = str(request_id)
+    return labels
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # Exists, but owned by another user
+    return True
+
+
+class ContainerReaper(object):
+    """
+    Kills containers in a background thread so that judges do not wait for
+    docker on teardown. Containers are started with `remove=True`, so killing
+    them is enough to get rid of them.
+    """
+
+    def __init__(self, config: BaseConfig, docker_client):
+        self._config = config
+        self._docker_client = docker_client
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._reap_forever,
+                name='treadmill-container-reaper',
+                daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Stops the reaper after every queued container has been killed"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def reap(self, container):
+        if self._thread is None:
+            self._kill(container)
+        else:
+            self._queue.put(container)
+
+    @staticmethod
+    def _kill(container):
+        try:
+            container.kill()
+        except docker.errors.NotFound:
+            pass  # Already gone
+        except docker.errors.APIError:
+            _logger.exception(f'Failed to kill container {container.id}')
+
+    def _reap_forever(self):
+        while True:
+            container = self._queue.get()
+            if container is None:
+                return
+            self._kill(container)
+
+    def sweep(self):
+        """
+        Kills containers left behind by dead worker processes of this host
+        (e.g. after a crash). Returns the number of containers killed.
+        """
+        host = socket.gethostname()
+        containers = self._docker_client.containers.list(
+            filters={'label': f'{HOST_LABEL}={host}'}
+        )
+        orphans = [
+            container for container in containers
+            if PID_LABEL in container.labels
+            and not is_alive(int(container.labels[PID_LABEL]))
+        ]
+        for container in orphans:
+            _logger.info(f'Killing orphan container {container.id} of '
+                         f'{container.labels.get(WORKER_LABEL)}')
+            self._kill(container)
+        return len(orphans)
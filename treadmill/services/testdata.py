@@ -0,0 +1,202 @@
+import collections
+import errno
+import glob
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from treadmill.config import BaseConfig
+from treadmill.utils import ObjectDict
+from .lru import evict_lru
+from .reaper import is_alive as _is_alive
+
+
+__all__ = [
+    'TestDataCache'
+]
+
+
+_logger = logging.getLogger('treadmill.services.testdata')
+
+
+class TestDataCache(object):
+    """
+    Node-local cache of S3 objects, shared by every request.
+
+    Entries are addressed by the S3 key and a version (the `updated_at` of
+    the judge spec), so updating a problem never serves stale data. Entries
+    are read-only and hard-linked into workspaces (copied when the cache is
+    on another filesystem). The least recently used entries are evicted once
+    the cache exceeds `TESTDATA_CACHE_MAX_BYTES`; workspaces linking an
+    evicted entry keep their own link to the data. Eviction measures the
+    entries on disk (see `evict_lru`), since every worker process of the
+    node fetches into the same cache.
+
+    Requests reading entries in place (see `SHARED_TESTDATA`) pin them with
+    a hard link under `.pins/<pid>/<owner>/`. Pinned entries are not
+    evicted, by any worker process sharing the cache.
+    """
+
+    __test__ = False  # Not a test class despite its name
+
+    def __init__(self, config: BaseConfig, fetcher):
+        self._root = config.TESTDATA_CACHE_ROOT
+        self._fetcher = fetcher
+        self._etags = {}  # S3 key -> (latest entry path, its ETag)
+        self._max_bytes = config.TESTDATA_CACHE_MAX_BYTES
+        self._entry_count = 0  # As of the last eviction
+        self._size = 0
+        self._lock = threading.Lock()
+        self._fetch_locks = collections.defaultdict(threading.Lock)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self._root, mode=0o755, exist_ok=True)
+        self._load()
+
+    @property
+    def stats(self):
+        with self._lock:
+            return ObjectDict(hits=self.hits, misses=self.misses,
+                              evictions=self.evictions, entries=self._entry_count,
+                              size_bytes=self._size)
+
+    @property
+    def root(self):
+        return self._root
+
+    def entry_path(self, s3_key, version):
+        digest = hashlib.sha1(f'{s3_key}@{version}'.encode('utf-8')).hexdigest()
+        return os.path.join(self._root, digest[:2], digest)
+
+    def _pins_dir(self, pid):
+        return os.path.join(self._root, '.pins', str(pid))
+
+    def _load(self):
+        """Drops the pins of dead worker processes and trims the cache"""
+        pins_root = os.path.join(self._root, '.pins')
+        if os.path.isdir(pins_root):
+            for pid in os.listdir(pins_root):
+                if not _is_alive(int(pid)):
+                    shutil.rmtree(self._pins_dir(pid), ignore_errors=True)
+        self._evict()
+
+    def link(self, s3_key, version, dest_path, fetcher=None):
+        """
+        Places the file of `s3_key` at `dest_path`, fetching it on a miss
+        (with `fetcher` instead of the default one when given).
+        """
+        entry_path = self.entry_path(s3_key, version)
+        with self._lock:
+            fetch_lock = self._fetch_locks[entry_path]
+
+        # Concurrent misses of the same entry fetch it only once
+        with fetch_lock:
+            if self._touch(entry_path):
+                try:
+                    self._place(entry_path, dest_path)
+                except FileNotFoundError:
+                    pass  # Evicted by another worker process
+                else:
+                    with self._lock:
+                        self.hits += 1
+                    return
+            with self._lock:
+                self.misses += 1
+            self._fetch(s3_key, entry_path, fetcher or self._fetcher)
+            self._place(entry_path, dest_path)
+
+    def pin(self, s3_key, version, owner, fetcher=None):
+        """Keeps the entry of `s3_key` (fetched on a miss) until `unpin(owner)`"""
+        entry_path = self.entry_path(s3_key, version)
+        self.link(s3_key, version,
+                  os.path.join(self._pins_dir(os.getpid()), str(owner),
+                               os.path.basename(entry_path)),
+                  fetcher=fetcher)
+        return entry_path
+
+    def unpin(self, owner):
+        shutil.rmtree(os.path.join(self._pins_dir(os.getpid()), str(owner)),
+                      ignore_errors=True)
+
+    @staticmethod
+    def _touch(entry_path):
+        try:
+            os.utime(entry_path)  # The LRU order, across worker processes
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _fetch(self, s3_key, entry_path, fetcher):
+        entry_dir = os.path.dirname(entry_path)
+        os.makedirs(entry_dir, mode=0o755, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix='.')
+        os.close(fd)
+        with self._lock:
+            previous_path, previous_etag = self._etags.get(s3_key, (None, None))
+        if not (previous_path and os.path.exists(previous_path)):
+            previous_etag = None
+        try:
+            # A new version of the spec often leaves most objects unchanged
+            written, etag = fetcher.fetch(s3_key, tmp_path, etag=previous_etag)
+            if not written:
+                try:
+                    os.link(previous_path, entry_path)
+                except FileNotFoundError:
+                    # Evicted since, by another worker process
+                    written, etag = fetcher.fetch(s3_key, tmp_path)
+            if written:
+                os.chmod(tmp_path, 0o444)
+                os.rename(tmp_path, entry_path)
+            else:
+                os.unlink(tmp_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        if etag:
+            with self._lock:
+                self._etags[s3_key] = (entry_path, etag)
+        self._evict()
+
+    def _evict(self):
+        entry_count, size, evicted = evict_lru(self._root, self._max_bytes, self._is_pinned)
+        with self._lock:
+            self._entry_count = entry_count
+            self._size = size
+            self.evictions += len(evicted)
+            for entry_path in evicted:
+                self._fetch_locks.pop(entry_path, None)
+
+    def _is_pinned(self, entry_path):
+        pattern = os.path.join(self._root, '.pins', '*', '*', os.path.basename(entry_path))
+        return bool(glob.glob(pattern))
+
+    @staticmethod
+    def _place(entry_path, dest_path):
+        """Links (or copies) the entry to `dest_path`, replacing any file there"""
+        dest_dir = os.path.dirname(dest_path)
+        os.makedirs(dest_dir, mode=0o755, exist_ok=True)
+        tmp_path = os.path.join(
+            dest_dir,
+            f'.{os.path.basename(dest_path)}.{os.getpid()}.{threading.get_ident()}'
+        )
+        try:
+            try:
+                os.link(entry_path, tmp_path)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                _logger.debug(f'Cannot link {entry_path}, copying instead: {e}')
+                shutil.copyfile(entry_path, tmp_path)
+            os.replace(tmp_path, dest_path)
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)  # Already linked there, which rename leaves alone
+        except BaseException:
+            if os.path.lexists(tmp_path):
+                os.unlink(tmp_path)
+            raise
@@ -0,0 +1,196 @@
+import contextlib
+import fcntl
+import logging
+import os
+import shutil
+import threading
+
+from treadmill.config import BaseConfig
+from treadmill.utils import ObjectDict
+from .reaper import is_alive as _is_alive
+
+
+__all__ = [
+    'TmpfsWorkspaces'
+]
+
+
+_logger = logging.getLogger('treadmill.services.workspaces')
+
+
+def directory_size(dir_path):
+    """Bytes used by the files under `dir_path` (each hard-linked file once)"""
+    size = 0
+    seen = set()
+    for dirpath, _, filenames in os.walk(dir_path):
+        for filename in filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, filename))
+            except FileNotFoundError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                size += stat.st_size
+    return size
+
+
+class TmpfsWorkspaces(object):
+    """
+    Places request workspaces on the tmpfs at `TMPFS_WORKSPACE_ROOT` while
+    they fit into `TMPFS_WORKSPACE_BUDGET_BYTES`.
+
+    Each request is charged the larger of its reservation and the bytes it
+    was last measured to use, in a ledger on the tmpfs itself (one file per
+    workspace under `.ledger`, updated under an `flock`) shared by every
+    worker process of the host. A request is placed on tmpfs only when its
+    estimate fits into what the other requests leave of the budget and
+    into the free space of the tmpfs; otherwise its workspace falls back
+    to disk.
+
+    A workspace outgrowing its reservation takes more of the budget when
+    it is left, and is marked `exhausted` otherwise. So is every workspace
+    once the tmpfs runs low on space, since outputs written meanwhile may
+    have been cut short. Exhausted requests are retried on disk.
+    """
+
+    def __init__(self, config: BaseConfig):
+        self._root = config.TMPFS_WORKSPACE_ROOT
+        self._budget = config.TMPFS_WORKSPACE_BUDGET_BYTES
+        # Space an execution may need without running out of it
+        self._min_free = config.TMPFS_TESTCASE_ALLOWANCE_BYTES
+        self._ledger_dir = os.path.join(self._root, '.ledger')
+        self._spill_dir = os.path.join(self._root, '.spill')
+        self._lock = threading.Lock()
+        self.spills = 0
+        os.makedirs(self._ledger_dir, mode=0o755, exist_ok=True)
+        os.makedirs(self._spill_dir, mode=0o755, exist_ok=True)
+
+    def workspace_path(self, request_id):
+        return os.path.join(self._root, str(request_id))
+
+    def _ledger_path(self, request_id, pid=None):
+        return os.path.join(self._ledger_dir, f'{pid or os.getpid()}.{request_id}')
+
+    def _spill_path(self, request_id):
+        return os.path.join(self._spill_dir, str(request_id))
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Holds the ledger lock, across threads and worker processes"""
+        fd = os.open(os.path.join(self._ledger_dir, '.lock'), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def _read_ledger(self):
+        """Returns ledger file name -> (reserved, live) bytes, dropping dead processes' entries"""
+        ledger = {}
+        for name in os.listdir(self._ledger_dir):
+            if name.startswith('.'):
+                continue
+            ledger_path = os.path.join(self._ledger_dir, name)
+            if not _is_alive(int(name.split('.', 1)[0])):
+                os.unlink(ledger_path)
+                continue
+            with open(ledger_path) as f:
+                reserved, live = f.read().split()
+            ledger[name] = (int(reserved), int(live))
+        return ledger
+
+    def _write_ledger(self, request_id, reserved, live):
+        with open(self._ledger_path(request_id), 'w') as f:
+            f.write(f'{reserved} {live}')
+
+    def _free_bytes(self):
+        stat = os.statvfs(self._root)
+        return stat.f_bavail * stat.f_frsize
+
+    @property
+    def used_bytes(self):
+        with self._locked():
+            return sum(max(charge) for charge in self._read_ledger().values())
+
+    @property
+    def stats(self):
+        with self._locked():
+            ledger = self._read_ledger()
+        with self._lock:
+            spills = self.spills
+        return ObjectDict(
+            workspaces=len(ledger),
+            used_bytes=sum(max(charge) for charge in ledger.values()),
+            live_bytes={name.split('.', 1)[1]: live for name, (_, live) in ledger.items()},
+            spills=spills
+        )
+
+    def _spill(self, request_id, estimate, reason):
+        with self._lock:
+            self.spills += 1
+        _logger.info(f'Workspace of request {request_id} ({estimate} bytes) spills to disk: '
+                     f'{reason}')
+
+    def allocate(self, request_id, estimate):
+        """Returns the tmpfs workspace directory, or None if it does not fit"""
+        with self._locked():
+            if os.path.exists(self._spill_path(request_id)):
+                os.unlink(self._spill_path(request_id))
+                self._spill(request_id, estimate, 'exhausted the tmpfs before')
+                return None
+            used = sum(max(charge) for charge in self._read_ledger().values())
+            if used + estimate > self._budget:
+                self._spill(request_id, estimate, f'{used}/{self._budget} bytes in use')
+                return None
+            free = self._free_bytes()
+            if estimate + self._min_free > free:
+                self._spill(request_id, estimate, f'{free} bytes free')
+                return None
+            self._write_ledger(request_id, estimate, 0)
+        workspace_path = self.workspace_path(request_id)
+        os.makedirs(workspace_path, mode=0o755)
+        return workspace_path
+
+    def account(self, request_id):
+        """
+        Measures the live bytes of the workspace, growing its reservation
+        to them when the budget allows. Returns them.
+        """
+        live = directory_size(self.workspace_path(request_id))
+        with self._locked():
+            ledger = self._read_ledger()
+            name = os.path.basename(self._ledger_path(request_id))
+            if name not in ledger:
+                return live
+            reserved, _ = ledger.pop(name)
+            others = sum(max(charge) for charge in ledger.values())
+            if live > reserved and others + live <= self._budget:
+                reserved = live
+            self._write_ledger(request_id, reserved, live)
+        return live
+
+    def exhausted(self, request_id):
+        """
+        Whether the tmpfs workspace outgrew its reservation beyond the
+        budget, or the tmpfs is running out of space. The request is then
+        placed on disk the next time.
+        """
+        with self._locked():
+            charge = self._read_ledger().get(os.path.basename(self._ledger_path(request_id)))
+            if charge is None:
+                return False  # Not on tmpfs
+            reserved, live = charge
+            if live <= reserved and self._free_bytes() >= self._min_free:
+                return False
+            open(self._spill_path(request_id), 'w').close()
+        _logger.warning(f'Workspace of request {request_id} exhausted the tmpfs '
+                        f'({live}/{reserved} bytes reserved)')
+        return True
+
+    def release(self, request_id):
+        shutil.rmtree(self.workspace_path(request_id), ignore_errors=True)
+        with self._locked():
+            try:
+                os.unlink(self._ledger_path(request_id))
+            except FileNotFoundError:
+                pass
@@ -22,6 +22,16 @@ class InternalApiError(RetryableError):
     pass
 
 
+class ObjectStoreError(RetryableError):
+    """ S3 is unreachable or refused a request """
+    pass
+
+
+class WorkspaceExhausted(RetryableError):
+    """ tmpfs workspace ran out of space; outputs may have been cut short """
+    pass
+
+
 # =========================================================
 # Server fault signals
 # =========================================================
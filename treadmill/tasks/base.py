@@ -3,10 +3,11 @@ import inspect
 import logging
 import threading
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 
 from dramatiq.middleware import TimeLimitExceeded
 
-from treadmill.context import ContextMixin
+from treadmill.context import ContextMixin, get_current_context, set_current_context
 from treadmill.utils import ReprMixin
 from .logger import IndentLogger
 
@@ -16,7 +17,8 @@ __all__ = [
     'push_environ',
     'pop_environ',
     'get_active_environs',
-    'get_task_stack'
+    'get_task_stack',
+    'TaskExecutor'
 ]
 
 
@@ -89,6 +91,41 @@ class Task(ContextMixin, ReprMixin):
         pass
 
 
+class TaskExecutor(object):
+    """
+    Runs tasks on a thread pool. Worker threads share the judge context and
+    see the submitting task stack, so subtasks behave as if they were run
+    in the submitting thread.
+    """
+
+    def __init__(self, max_workers):
+        self._context = get_current_context()
+        self._task_stack = list(getattr(_global_task, 'stack', []))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='treadmill-task')
+
+    def _run_task(self, task):
+        set_current_context(self._context)
+        _global_task.stack = list(self._task_stack)
+        try:
+            return task.run()
+        finally:
+            _global_task.stack = []
+            set_current_context(None)
+
+    def submit(self, task):
+        return self._executor.submit(self._run_task, task)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(wait=True)
+
+
 _global_environs = threading.local()
 
 
@@ -1,4 +1,6 @@
+import contextlib
 import os
+import shlex
 import uuid
 from typing import Optional
 
@@ -6,23 +8,82 @@ from docker.models.containers import Container
 
 from treadmill.context import ContextMixin
 from treadmill.models import Lang, IsolateExecMeta
-from treadmill.signal import UnsupportedLanguage, IsolateInitFail
-from treadmill.utils import ObjectDict
+from treadmill.services import CpuSet
+from treadmill.signal import UnsupportedLanguage, IsolateInitFail, IsolateExecutionError
+from treadmill.utils import ObjectDict, ResourcePool
 from .base import Environ, Task
 from . import ops
 from . import path
 
 __all__ = [
+    'ContainerEnviron',
     'BuilderEnviron',
     'SandboxEnviron',
     'CompileTask',
     'ExecuteResult',
     'ExecuteSubmissionTask',
+    'ExecuteTestSetTask',
     'ExecuteGraderTask'
 ]
 
 
-class BuilderEnviron(Environ):
+_BATCH_RECORD_MARKER = '@@treadmill:'
+
+# Shell function used by the batched execution driver. Arguments are the
+# run key, the container paths of stdout/stderr/meta files and the isolate
+# command. Prints a single record line: key, exit code, sha1 of stdout,
+# meta and isolate output (newlines in the last two are replaced by \037).
+_BATCH_DRIVER_PRELUDE = r'''
+run() {
+    key=$1; stdout=$2; stderr=$3; meta=$4; shift 4
+    mkdir -p "$(dirname "$stdout")"
+    : > "$stdout"; : > "$stderr"; : > "$meta"
+    chmod 666 "$stdout" "$stderr" "$meta"
+    out=$("$@" 2>&1)
+    code=$?
+    digest=$(sha1sum "$stdout" | cut -d ' ' -f 1)
+    printf '@@treadmill:%s\t%s\t%s\t%s\t%s\n' "$key" "$code" "$digest" \
+        "$(tr '\n' '\037' < "$meta")" "$(printf '%s' "$out" | tr '\n\t' '\037 ')"
+    return $code
+}
+'''
+
+
+class BatchRun(ObjectDict):
+    key: str
+    exec_id: str
+    stdin_file: path.AFP
+    stdout_file: path.AFP
+    stderr_file: path.AFP
+    meta_file: path.AFP
+
+
+class ContainerEnviron(Environ):
+    container: Container = None
+
+    def _start_container(self, container_tag, privileged=False, cpuset=None):
+        if self.context.container_pool:
+            container = yield ops.LeaseDockerContainerOp(
+                container_tag=container_tag,
+                privileged=privileged,
+                cpuset=cpuset
+            )
+        else:
+            container = yield ops.RunDockerContainerOp(
+                container_tag=container_tag,
+                privileged=privileged,
+                cpuset=cpuset
+            )
+        return container
+
+    def _stop_container(self):
+        if self.context.container_pool:
+            yield ops.ReleaseDockerContainerOp(self.container)
+        else:
+            yield ops.KillDockerContainerOp(self.container)
+
+
+class BuilderEnviron(ContainerEnviron):
     def __init__(self, *, lang):
         self.lang = lang
         self.container: Container = None
@@ -31,13 +92,12 @@ class BuilderEnviron(Environ):
         container_tag = self.lang.profile.builder_image_tag(self.context.config)
         if container_tag is None:
             raise UnsupportedLanguage(self.lang)
-        self.container = yield ops.RunDockerContainerOp(
-            container_tag=container_tag,
-        )
+        cpuset = self.context.cpu_allocator and self.context.cpu_allocator.builder_cpuset()
+        self.container = yield from self._start_container(container_tag, cpuset=cpuset)
 
     def _teardown(self):
         if self.container:
-            yield ops.KillDockerContainerOp(self.container)
+            yield from self._stop_container()
 
     def compile(self, src_file, out_file):
         src_file = src_file.container_path
@@ -50,7 +110,7 @@ class BuilderEnviron(Environ):
         return result
 
 
-class SandboxEnviron(Environ):
+class SandboxEnviron(ContainerEnviron):
     # `dir_in` in container is seen as `dir_out` in isolated sandbox
     _sandbox_mapping_opt = '--dir={dir_in}={dir_out}:rw'.format(
         dir_in=path.SANDBOX_ROOT.sandbox_path,
@@ -65,28 +125,64 @@ class SandboxEnviron(Environ):
         self.lang = lang
         self.container = None
         self.isolated = isolated
+        self.boxes: ResourcePool = None
+        self.cpuset: CpuSet = None
+        self._cpuset_allocated = False
 
     def _setup(self):
         container_tag = self.lang.profile.sandbox_image_tag(self.context.config)
         if container_tag is None:
             raise UnsupportedLanguage(self.lang)
 
-        self.container = yield ops.RunDockerContainerOp(
-            container_tag=self.context.config.sandbox_container_tag(self.lang),
-            privileged=self.isolated
+        cpu_allocator = self.context.cpu_allocator
+        if cpu_allocator and self.isolated:
+            # Blocks until enough cores are free, which throttles admission
+            config = self.context.config
+            self.cpuset = yield ops.AllocateCpuSetOp(
+                count=max(1, min(config.TESTCASE_PARALLELISM, config.ISOLATE_BOX_COUNT))
+            )
+            self._cpuset_allocated = True
+        elif cpu_allocator:
+            self.cpuset = cpu_allocator.builder_cpuset()
+
+        self.container = yield from self._start_container(
+            self.context.config.sandbox_container_tag(self.lang),
+            privileged=self.isolated,
+            cpuset=self.cpuset
         )
 
         if self.isolated:
+            box_ids = range(self.context.config.ISOLATE_BOX_COUNT)
+            init_cmd = []
+            for box_id in box_ids:
+                if init_cmd:
+                    init_cmd.append('&&')
+                init_cmd += ['isolate', '--cg', f'--box-id={box_id}', '--init']
             init_result = yield ops.ExecInDockerContainerOp(
                 container=self.container,
-                cmd=['isolate', '--cg', '--init']
+                cmd=init_cmd
             )
             if init_result.exit_code != 0:
                 raise IsolateInitFail(init_result.output)
+            self.boxes = ResourcePool(box_ids)
 
     def _teardown(self):
         if self.container:
-            yield ops.KillDockerContainerOp(self.container)
+            yield from self._stop_container()
+        if self._cpuset_allocated:
+            yield ops.ReleaseCpuSetOp(self.cpuset)
+
+    @contextlib.contextmanager
+    def lease_box(self):
+        """Leases an initialized isolate box id for a single execution"""
+        assert self.isolated
+        with self.boxes.lease() as (box_id,):
+            yield box_id
+
+    def box_cpu(self, box_id):
+        """Host cpu the given isolate box is pinned to, if any"""
+        if self.cpuset:
+            return self.cpuset.cpus[box_id % len(self.cpuset.cpus)]
 
     def _exec_normal(self, *, bin_file, stdout_file, args=()):
         result = yield ops.ExecInDockerContainerOp(
@@ -99,8 +195,8 @@ class SandboxEnviron(Environ):
         )
         return result
 
-    def _exec_in_isolate(self, *, bin_file, stdin_file, stdout_file, stderr_file,
-                         meta_file, limits, args=()):
+    def _isolate_cmd(self, *, box_id, bin_file, stdin_file, stdout_file,
+                     stderr_file, meta_file, limits, args=()):
         pid_limits = limits.pid_limits
         if self.lang == Lang.JAVA:
             # For not-yet-known reason JVM requires at least 11 processes to run
@@ -110,34 +206,45 @@ class SandboxEnviron(Environ):
         if self.lang == Lang.PYTHON3:
             mapping_opts += [self._etc_mapping_opt]  # Python requires /etc/passwd file
 
+        pin_cmd = []
+        box_cpu = self.box_cpu(box_id)
+        if box_cpu is not None:
+            pin_cmd = ['taskset', '-c', str(box_cpu)]
+
+        return [
+            *pin_cmd,
+            'isolate',
+            *mapping_opts,
+            '--cg',
+            f'--box-id={box_id}',
+            f'--meta={meta_file}',
+            f'--cg-mem={limits.mem_limit_bytes // 1024 * 2}',
+            f'--time={limits.time_limit_seconds}',
+            f'--wall-time={limits.time_limit_seconds * 3}',
+            f'--extra-time=1.0',
+            f'--fsize={limits.file_size_limit_kilos}',
+            f'--processes={pid_limits}',
+            f'--stdin={stdin_file}',
+            f'--stdout={stdout_file}',
+            f'--stderr={stderr_file}',
+            '--run',
+            '--',
+            *self.lang.profile.get_exec_cmd(bin_file, args)
+        ]
+
+    def _exec_in_isolate(self, **isolate_args):
         result = yield ops.ExecInDockerContainerOp(
             container=self.container,
-            cmd=[
-                'isolate',
-                *mapping_opts,
-                '--cg',
-                f'--meta={meta_file}',
-                f'--cg-mem={limits.mem_limit_bytes // 1024 * 2}',
-                f'--time={limits.time_limit_seconds}',
-                f'--wall-time={limits.time_limit_seconds * 3}',
-                f'--extra-time=1.0',
-                f'--fsize={limits.file_size_limit_kilos}',
-                f'--processes={pid_limits}',
-                f'--stdin={stdin_file}',
-                f'--stdout={stdout_file}',
-                f'--stderr={stderr_file}',
-                '--run',
-                '--',
-                *self.lang.profile.get_exec_cmd(bin_file, args)
-            ],
+            cmd=self._isolate_cmd(**isolate_args),
             privileged=True
         )
         return result
 
-    def exec_subm(self, *, bin_file, stdin_file, stdout_file, stderr_file,
-                  meta_file, limits):
+    def exec_subm(self, *, box_id, bin_file, stdin_file, stdout_file,
+                  stderr_file, meta_file, limits):
         assert self.isolated
         result = yield from self._exec_in_isolate(
+            box_id=box_id,
             bin_file=bin_file.sandbox_path,
             stdin_file=stdin_file.sandbox_path,
             stdout_file=stdout_file.sandbox_path,
@@ -147,6 +254,65 @@ class SandboxEnviron(Environ):
         )
         return result
 
+    def exec_subm_batch(self, *, box_id, bin_file, runs, limits):
+        """
+        Runs the submission once per `BatchRun` in a single docker exec.
+
+        A driver script written to the workspace runs isolate for each run,
+        stops after the first failed run and prints one record per run.
+        Returns a dict of run keys to (exit code, stdout digest, meta,
+        isolate output) tuples, plus the output of the exec itself.
+        """
+        assert self.isolated
+        lines = [_BATCH_DRIVER_PRELUDE]
+        for run in runs:
+            isolate_cmd = self._isolate_cmd(
+                box_id=box_id,
+                bin_file=bin_file.sandbox_path,
+                stdin_file=run.stdin_file.sandbox_path,
+                stdout_file=run.stdout_file.sandbox_path,
+                stderr_file=run.stderr_file.sandbox_path,
+                meta_file=run.meta_file.container_path,
+                limits=limits
+            )
+            lines.append(' '.join(shlex.quote(str(arg)) for arg in [
+                'run',
+                run.key,
+                run.stdout_file.container_path,
+                run.stderr_file.container_path,
+                run.meta_file.container_path,
+                *isolate_cmd
+            ]) + ' || exit 0')
+
+        driver_file = path.AFP(path=['driver', f'{uuid.uuid4()}.sh'],
+                               sandbox_visible=False)
+        yield ops.WriteFileOp(driver_file, '\n'.join(lines) + '\n')
+        exit_code, output = yield ops.ExecInDockerContainerOp(
+            container=self.container,
+            cmd=['/bin/sh', driver_file.container_path],
+            privileged=True,
+            capped=False  # Records must reach the parser intact
+        )
+        output = output.decode('utf-8')
+        return exit_code, output, self._parse_batch_records(output)
+
+    @staticmethod
+    def _parse_batch_records(output):
+        records = {}
+        for line in output.split('\n'):
+            if not line.startswith(_BATCH_RECORD_MARKER):
+                continue
+            key, exit_code, digest, meta, isolate_output = (
+                line[len(_BATCH_RECORD_MARKER):].split('\t', 4)
+            )
+            records[key] = (
+                int(exit_code),
+                digest,
+                meta.replace('\x1f', '\n'),
+                isolate_output.replace('\x1f', '\n')
+            )
+        return records
+
     def exec_grader(self, *, bin_file, stdout_file, test_input_file,
                     test_output_file, solution_file):
         assert not self.isolated
@@ -180,11 +346,14 @@ class CompileTask(Task):
             src_file=self.src_file,
             out_file=self.out_file
         )
-        return self.Result(exit_code=exit_code, output=output)
+        # Output may be cut in the middle of a multi-byte sequence when truncated
+        return self.Result(exit_code=exit_code, output=output.decode('utf-8', errors='replace'))
 
 
 class ExecuteResult(ObjectDict, ContextMixin):
     exec_id: int
+    box_id: Optional[int]
+    stdout_digest: Optional[str]
     exit_code: int
     output: str
     meta: Optional[IsolateExecMeta]
@@ -233,12 +402,18 @@ class ExecuteSubmissionTask(Task):
         self.stdin_file = stdin_file
 
     def _run(self):
+        with self.sandbox.lease_box() as box_id:
+            result = yield from self._run_in_box(box_id)
+        return result
+
+    def _run_in_box(self, box_id):
         exec_id = str(uuid.uuid4())
-        stdout_file = path.AFP(path=['logs', f'{exec_id}.stdout'])
-        stderr_file = path.AFP(path=['logs', f'{exec_id}.stderr'])
-        meta_file = path.AFP(path=['logs', f'{exec_id}.meta'])
+        stdout_file = path.exec_log_file(box_id, exec_id, 'stdout')
+        stderr_file = path.exec_log_file(box_id, exec_id, 'stderr')
+        meta_file = path.exec_log_file(box_id, exec_id, 'meta')
         result = ExecuteResult(
             exec_id=exec_id,
+            box_id=box_id,
             stdout_file=stdout_file,
             stderr_file=stderr_file
         )
@@ -250,6 +425,7 @@ class ExecuteSubmissionTask(Task):
         yield ops.CreateFileOp(meta_file, mode=0o666)
 
         exit_code, output = yield from self.sandbox.exec_subm(
+            box_id=box_id,
             bin_file=self.bin_file,
             stdin_file=self.stdin_file,
             stdout_file=stdout_file,
@@ -258,7 +434,7 @@ class ExecuteSubmissionTask(Task):
             limits=self.sandbox.isolated and self.context.judge_spec
         )
         result.exit_code = exit_code
-        result.output = output.decode('utf-8')
+        result.output = output.decode('utf-8', errors='replace')
 
         if not result.is_fatal:
             meta_str = yield ops.ReadFileOp(meta_file)
@@ -267,6 +443,69 @@ class ExecuteSubmissionTask(Task):
         return result
 
 
+class ExecuteTestSetTask(Task):
+    """
+    Executes the submission over every testcase of the testset with a single
+    docker exec (see `SandboxEnviron.exec_subm_batch`). Returns a dict of
+    testcase ids to `ExecuteResult`; testcases after the first failed
+    execution are missing from it.
+    """
+
+    def __init__(self, *,
+                 sandbox: SandboxEnviron,
+                 bin_file: path.AFP,
+                 testset):
+        self.sandbox = sandbox
+        self.bin_file = bin_file
+        self.testset = testset
+
+    def _run(self):
+        yield ops.CheckFileExistsOp(self.bin_file)
+        with self.sandbox.lease_box() as box_id:
+            results = yield from self._run_in_box(box_id)
+        return results
+
+    def _run_in_box(self, box_id):
+        runs = []
+        for testcase in self.testset.testcases:
+            exec_id = str(uuid.uuid4())
+            runs.append(BatchRun(
+                key=str(testcase.id),
+                exec_id=exec_id,
+                stdin_file=path.test_input_file(self.testset, testcase),
+                stdout_file=path.exec_log_file(box_id, exec_id, 'stdout'),
+                stderr_file=path.exec_log_file(box_id, exec_id, 'stderr'),
+                meta_file=path.exec_log_file(box_id, exec_id, 'meta')
+            ))
+
+        exit_code, output, records = yield from self.sandbox.exec_subm_batch(
+            box_id=box_id,
+            bin_file=self.bin_file,
+            runs=runs,
+            limits=self.context.judge_spec
+        )
+        if exit_code != 0:
+            raise IsolateExecutionError(output)
+
+        results = {}
+        for testcase, run in zip(self.testset.testcases, runs):
+            if run.key not in records:
+                break
+            run_exit_code, digest, meta_str, isolate_output = records[run.key]
+            result = ExecuteResult(
+                exec_id=run.exec_id,
+                box_id=box_id,
+                exit_code=run_exit_code,
+                output=isolate_output,
+                stdout_file=run.stdout_file,
+                stderr_file=run.stderr_file,
+                stdout_digest=digest,
+                meta=IsolateExecMeta.parse(meta_str)
+            )
+            results[testcase.id] = result
+        return results
+
+
 class ExecuteGraderTask(Task):
     def __init__(self, *,
                  sandbox: SandboxEnviron,
@@ -302,6 +541,6 @@ class ExecuteGraderTask(Task):
             solution_file=self.solution_file
         )
         result.exit_code = exit_code
-        result.output = output.decode('utf-8')
+        result.output = output.decode('utf-8', errors='replace')
 
         return result
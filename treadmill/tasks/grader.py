@@ -0,0 +1,158 @@
+import errno
+import logging
+import os
+import select
+import threading
+import time
+
+from .base import Environ, TaskExecutor
+from .container import SandboxEnviron
+from . import ops
+from . import path
+
+
+__all__ = [
+    'PersistentGraderEnviron',
+    'PersistentGraderError'
+]
+
+
+_logger = logging.getLogger('treadmill.tasks.grader')
+
+
+class PersistentGraderError(Exception):
+    pass
+
+
+class PersistentGraderEnviron(Environ):
+    """
+    Grader started once per judge instead of once per testcase, for graders
+    speaking the persistent protocol (`Grader.persistent`).
+
+    The grader is run with a single `--persistent` argument. It reads one
+    request per line from stdin, the container paths of the testcase input,
+    the submission output and the solution separated by tabs, and answers
+    each with a line of its own on stdout: '1' (correct) or '0' (incorrect).
+    Both ends are FIFOs in the workspace.
+
+    Once the grader fails to start, exits or does not answer within
+    `GRADER_CALL_TIMEOUT_SECONDS`, it is considered broken and judges fall
+    back to one-shot grader executions (`ExecuteGraderTask`).
+    """
+
+    def __init__(self, *, sandbox: SandboxEnviron, bin_file: path.AFP):
+        self.sandbox = sandbox
+        self.bin_file = bin_file
+        self.broken = False
+        self._request_file = path.AFP(path=['pipes', 'grader.in'], sandbox_visible=False)
+        self._response_file = path.AFP(path=['pipes', 'grader.out'], sandbox_visible=False)
+        self._request_fd = None
+        self._response_fd = None
+        self._buffer = b''
+        self._lock = threading.Lock()
+        self._executor = None
+        self._exec_future = None
+
+    def _setup(self):
+        try:
+            self._start()
+        except (OSError, PersistentGraderError) as e:
+            _logger.warning(f'Persistent grader failed to start, grading one-shot: {e}')
+            self._break()
+        self.context.persistent_grader = self
+
+    def _teardown(self):
+        self.context.persistent_grader = None
+        self._break()
+        if self._exec_future:
+            # The grader exits once the request FIFO is closed
+            try:
+                self._exec_future.result(timeout=self.context.config.GRADER_CALL_TIMEOUT_SECONDS)
+            except Exception as e:
+                _logger.warning(f'Persistent grader did not exit cleanly: {e}')
+        if self._executor:
+            self._executor.shutdown(wait=False)
+
+    def _start(self):
+        for afp in (self._request_file, self._response_file):
+            os.makedirs(os.path.dirname(afp.host_path), mode=0o755, exist_ok=True)
+            os.mkfifo(afp.host_path, 0o666)
+            os.chmod(afp.host_path, 0o666)
+
+        self._executor = TaskExecutor(1)
+        self._exec_future = self._executor.submit(ops.ExecInDockerContainerOp(
+            self.sandbox.container,
+            cmd=[
+                *self.sandbox.lang.profile.get_exec_cmd(self.bin_file.container_path,
+                                                        ['--persistent']),
+                '<', self._request_file.container_path,
+                '>', self._response_file.container_path
+            ],
+            privileged=False
+        ))
+
+        self._response_fd = os.open(self._response_file.host_path, os.O_RDONLY | os.O_NONBLOCK)
+        deadline = time.monotonic() + self.context.config.GRADER_CALL_TIMEOUT_SECONDS
+        while self._request_fd is None:
+            try:
+                self._request_fd = os.open(self._request_file.host_path,
+                                           os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                # No reader yet
+                if self._exec_future.done():
+                    raise PersistentGraderError('Grader exited before reading requests')
+                if time.monotonic() > deadline:
+                    raise PersistentGraderError('Grader did not open its input')
+                time.sleep(0.01)
+
+    def _break(self):
+        self.broken = True
+        for fd in (self._request_fd, self._response_fd):
+            if fd is not None:
+                os.close(fd)
+        self._request_fd = self._response_fd = None
+
+    def _read_line(self, timeout):
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PersistentGraderError(f'Grader did not answer within {timeout}s')
+            readable, _, _ = select.select([self._response_fd], [], [], remaining)
+            if not readable:
+                continue
+            chunk = os.read(self._response_fd, 4096)
+            if not chunk:
+                if self._exec_future.done():
+                    raise PersistentGraderError('Grader exited')
+                time.sleep(0.01)  # Output not opened by the grader yet
+                continue
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line.decode('utf-8', errors='replace').strip()
+
+    def grade(self, *, testcase_input_file, testcase_output_file, solution_file):
+        """
+        Returns whether the submission output is correct. Raises
+        `PersistentGraderError` (and breaks the grader) on failures.
+        """
+        request = '\t'.join([
+            testcase_input_file.container_path,
+            testcase_output_file.container_path,
+            solution_file.container_path
+        ]) + '\n'
+        with self._lock:
+            if self.broken:
+                raise PersistentGraderError('Grader is broken')
+            try:
+                os.write(self._request_fd, request.encode('utf-8'))
+                verdict = self._read_line(self.context.config.GRADER_CALL_TIMEOUT_SECONDS)
+                if verdict not in ('0', '1'):
+                    raise PersistentGraderError(f'Unexpected grader output {verdict!r}')
+            except (OSError, PersistentGraderError) as e:
+                _logger.warning(f'Persistent grader broke, grading one-shot: {e}')
+                self._break()
+                raise PersistentGraderError(str(e))
+        return verdict == '1'
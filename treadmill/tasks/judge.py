@@ -2,8 +2,12 @@ from treadmill.models import *
 from treadmill.signal import *
 from . import ops
 from . import path
-from .base import Task
-from .container import SandboxEnviron, ExecuteResult, ExecuteSubmissionTask, ExecuteGraderTask
+from .base import Task, TaskExecutor
+from .grader import PersistentGraderError
+from .workspace import verifies_by_digest
+from .container import (
+    SandboxEnviron, ExecuteResult, ExecuteSubmissionTask, ExecuteTestSetTask, ExecuteGraderTask
+)
 
 
 class JudgeTask(Task):
@@ -18,65 +22,202 @@ class JudgeTask(Task):
                 testset_id=testset.id,
                 score=score
             )
+            yield ops.AccountWorkspaceOp()
         if self.context.total_score == self.context.judge_spec.total_score:
             yield ops.UpdateJudgeResultOp(status=JudgeStatus.PASSED)
         else:
             yield ops.UpdateJudgeResultOp(status=JudgeStatus.FAILED)
 
+    @property
+    def parallelism(self):
+        """Number of testcases of a testset judged at the same time"""
+        return max(1, min(self.context.config.TESTCASE_PARALLELISM,
+                          self.subm_sandbox.boxes.size))
+
     def _judge_testset(self, testset):
-        for testcase in testset.testcases:
+        if self.context.config.BATCHED_EXECUTION:
+            passed = yield from self._judge_testcases_batched(testset)
+        elif self.parallelism > 1:
+            passed = yield from self._judge_testcases_concurrently(testset)
+        else:
+            passed = yield from self._judge_testcases(testset)
+        return testset.score if passed else 0
+
+    def _prefetch(self, testset, start):
+        """Stages testcases from `start` on in the background (lazy staging only)"""
+        if self.context.testdata_stager:
+            end = start + 1 + self.context.config.STAGING_LOOKAHEAD
+            if start < len(testset.testcases):
+                yield ops.PrefetchTestCasesOp(testset, testset.testcases[start:end])
+
+    def _cancel_prefetch(self, testset):
+        if self.context.testdata_stager:
+            yield ops.CancelPrefetchOp(testset)
+
+    def _judge_testcases(self, testset):
+        for index, testcase in enumerate(testset.testcases):
+            yield from self._prefetch(testset, index)
             try:
-                meta = yield from self._judge_testcase(testset, testcase)
-                yield ops.UpdateJudgeResultOp(
-                    testset_id=testset.id,
-                    testcase_id=testcase.id,
-                    testcase_status=TestCaseJudgeStatus.PASSED,
-                    mem=meta.cg_mem,
-                    time=meta.time
-                )
-                continue
-            except ServerFault as e:
-                yield ops.UpdateJudgeResultOp(
-                    testset_id=testset.id,
-                    testcase_id=testcase.id,
-                    testcase_status=TestCaseJudgeStatus.NOT_JUDGED,
-                    error=e.message
+                meta = yield JudgeTestCaseTask(
+                    subm_sandbox=self.subm_sandbox,
+                    grader_sandbox=self.grader_sandbox,
+                    testset=testset,
+                    testcase=testcase
                 )
-                raise
-            except Timeout:
-                yield ops.UpdateJudgeResultOp(
-                    testset_id=testset.id,
-                    testcase_id=testcase.id,
-                    testcase_status=TestCaseJudgeStatus.TIME_LIMIT_EXCEEDED
-                )
-            except OutOfMemory:
-                yield ops.UpdateJudgeResultOp(
-                    testset_id=testset.id,
-                    testcase_id=testcase.id,
-                    testcase_status=TestCaseJudgeStatus.MEMORY_LIMIT_EXCEEDED
-                )
-            except SubmissionRuntimeError as e:
-                yield ops.UpdateJudgeResultOp(
-                    testset_id=testset.id,
-                    testcase_id=testcase.id,
-                    testcase_status=TestCaseJudgeStatus.RUNTIME_ERROR,
-                    error=e.message
-                )
-            except WrongAnswer:
-                yield ops.UpdateJudgeResultOp(
-                    testset_id=testset.id,
-                    testcase_id=testcase.id,
-                    testcase_status=TestCaseJudgeStatus.WRONG_ANSWER
-                )
-            return 0
-        return testset.score
+                error = None
+            except (ServerFault, UserFault) as e:
+                meta, error = None, e
+            passed = yield from self._report_testcase(testset, testcase, meta, error)
+            if not passed:
+                yield from self._cancel_prefetch(testset)
+                return False
+        return True
 
-    def _judge_testcase(self, testset, testcase):
-        result = yield ExecuteSubmissionTask(
+    def _judge_testcases_batched(self, testset):
+        """
+        Executes the whole testset with a single docker exec, then checks the
+        outputs testcase by testcase on the host.
+        """
+        if self.context.testdata_stager:
+            yield ops.PrefetchTestCasesOp(testset, testset.testcases)
+            for testcase in testset.testcases:
+                yield ops.StageTestCaseOp(testset, testcase)
+
+        results = yield ExecuteTestSetTask(
             sandbox=self.subm_sandbox,
-            stdin_file=path.test_input_file(testset, testcase),
-            bin_file=path.subm_bin_file()
+            bin_file=path.subm_bin_file(),
+            testset=testset
         )
+        for testcase in testset.testcases:
+            try:
+                if testcase.id not in results:
+                    raise IsolateExecutionError('Batched execution stopped unexpectedly')
+                meta = yield JudgeTestCaseTask(
+                    subm_sandbox=self.subm_sandbox,
+                    grader_sandbox=self.grader_sandbox,
+                    testset=testset,
+                    testcase=testcase,
+                    result=results[testcase.id]
+                )
+                error = None
+            except (ServerFault, UserFault) as e:
+                meta, error = None, e
+            passed = yield from self._report_testcase(testset, testcase, meta, error)
+            if not passed:
+                return False
+        return True
+
+    def _judge_testcases_concurrently(self, testset):
+        """
+        Runs testcases on separate isolate boxes but reports them in testcase
+        order. Runs that have not started yet are cancelled as soon as a
+        testcase fails, since the testset cannot score anymore.
+        """
+        with TaskExecutor(self.parallelism) as executor:
+            futures = [
+                executor.submit(JudgeTestCaseTask(
+                    subm_sandbox=self.subm_sandbox,
+                    grader_sandbox=self.grader_sandbox,
+                    testset=testset,
+                    testcase=testcase
+                ))
+                for testcase in testset.testcases
+            ]
+            try:
+                for index, (testcase, future) in enumerate(zip(testset.testcases, futures)):
+                    # Testcases up to `index + parallelism` stage themselves
+                    yield from self._prefetch(testset, index + self.parallelism)
+                    try:
+                        meta, error = future.result(), None
+                    except (ServerFault, UserFault) as e:
+                        meta, error = None, e
+                    passed = yield from self._report_testcase(testset, testcase, meta, error)
+                    if not passed:
+                        yield from self._cancel_prefetch(testset)
+                        return False
+                return True
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    @staticmethod
+    def _report_testcase(testset, testcase, meta, error):
+        if error is None:
+            yield ops.UpdateJudgeResultOp(
+                testset_id=testset.id,
+                testcase_id=testcase.id,
+                testcase_status=TestCaseJudgeStatus.PASSED,
+                mem=meta.cg_mem,
+                time=meta.time
+            )
+            return True
+
+        try:
+            raise error
+        except ServerFault as e:
+            yield ops.UpdateJudgeResultOp(
+                testset_id=testset.id,
+                testcase_id=testcase.id,
+                testcase_status=TestCaseJudgeStatus.NOT_JUDGED,
+                error=e.message
+            )
+            raise
+        except Timeout:
+            yield ops.UpdateJudgeResultOp(
+                testset_id=testset.id,
+                testcase_id=testcase.id,
+                testcase_status=TestCaseJudgeStatus.TIME_LIMIT_EXCEEDED
+            )
+        except OutOfMemory:
+            yield ops.UpdateJudgeResultOp(
+                testset_id=testset.id,
+                testcase_id=testcase.id,
+                testcase_status=TestCaseJudgeStatus.MEMORY_LIMIT_EXCEEDED
+            )
+        except SubmissionRuntimeError as e:
+            yield ops.UpdateJudgeResultOp(
+                testset_id=testset.id,
+                testcase_id=testcase.id,
+                testcase_status=TestCaseJudgeStatus.RUNTIME_ERROR,
+                error=e.message
+            )
+        except WrongAnswer as e:
+            yield ops.UpdateJudgeResultOp(
+                testset_id=testset.id,
+                testcase_id=testcase.id,
+                testcase_status=TestCaseJudgeStatus.WRONG_ANSWER,
+                error=e.message
+            )
+        return False
+
+
+class JudgeTestCaseTask(Task):
+    def __init__(self, *, subm_sandbox, grader_sandbox, testset, testcase,
+                 result: ExecuteResult = None):
+        """
+        Args:
+            result: Result of an execution done in advance (e.g. batched
+                execution). The submission is executed when omitted.
+        """
+        self.subm_sandbox: SandboxEnviron = subm_sandbox
+        self.grader_sandbox: SandboxEnviron = grader_sandbox
+        self.testset = testset
+        self.testcase = testcase
+        self.result = result
+
+    def _run(self):
+        testset, testcase = self.testset, self.testcase
+        result = self.result
+        if result is None:
+            if self.context.testdata_stager:
+                yield ops.StageTestCaseOp(testset, testcase)
+            result = yield ExecuteSubmissionTask(
+                sandbox=self.subm_sandbox,
+                stdin_file=path.test_input_file(testset, testcase),
+                bin_file=path.subm_bin_file()
+            )
+        # Before any verdict, which a cut short output would make up
+        yield ops.CheckWorkspaceSpaceOp()
         subm_exec_meta = result.meta
 
         if not result.ok:
@@ -96,26 +237,62 @@ class JudgeTask(Task):
                 }))
 
         if self.grader_sandbox:
-            result = ExecuteGraderTask(
-                sandbox=self.grader_sandbox,
-                bin_file=path.grader_bin_file(),
-                testcase_input_file=path.test_input_file(testset, testcase),
-                testcase_output_file=result.stdout_file,
-                solution_file=path.test_output_file(testset, testcase)
-            ).run()
-
-            if not result.ok:
-                raise GraderRuntimeError(result.stderr)
-
-            grader_output = yield ops.ReadFileOp(result.stdout_file)
-            is_correct = grader_output == '1'  # '1': Correct, '0': Incorrect
+            is_correct = yield from self._grade(result.stdout_file)
         else:
-            is_correct = yield ops.CompareFileOp(
-                target=result.stdout_file,
-                expected=path.test_output_file(testset, testcase)
-            )
+            is_correct = False
+            if verifies_by_digest(testcase):
+                is_correct = yield ops.CheckOutputDigestOp(
+                    result.stdout_file,
+                    digest=testcase.output_digest,
+                    length=testcase.output_length
+                )
+                if not is_correct and not self.context.config.DETAILED_FEEDBACK:
+                    # The expected output is not even staged
+                    raise WrongAnswer('Output digest differs')
+            if not is_correct and result.stdout_digest:
+                is_correct = yield ops.CheckFileDigestOp(
+                    path.test_output_file(testset, testcase),
+                    digest=result.stdout_digest
+                )
+            if not is_correct:
+                comparison = yield ops.CompareFileOp(
+                    target=result.stdout_file,
+                    expected=path.test_output_file(testset, testcase),
+                    checker=self.context.judge_spec.checker
+                )
+                if not comparison:
+                    raise WrongAnswer(f'Output differs at line {comparison.line} '
+                                      f'(byte {comparison.offset})')
+                is_correct = True
 
         if not is_correct:
             raise WrongAnswer()
 
         return subm_exec_meta
+
+    def _grade(self, stdout_file):
+        testset, testcase = self.testset, self.testcase
+        persistent_grader = self.context.persistent_grader
+        if persistent_grader and not persistent_grader.broken:
+            try:
+                return persistent_grader.grade(
+                    testcase_input_file=path.test_input_file(testset, testcase),
+                    testcase_output_file=stdout_file,
+                    solution_file=path.test_output_file(testset, testcase)
+                )
+            except PersistentGraderError:
+                pass  # Falls back to a one-shot execution
+
+        result = ExecuteGraderTask(
+            sandbox=self.grader_sandbox,
+            bin_file=path.grader_bin_file(),
+            testcase_input_file=path.test_input_file(testset, testcase),
+            testcase_output_file=stdout_file,
+            solution_file=path.test_output_file(testset, testcase)
+        ).run()
+
+        if not result.ok:
+            raise GraderRuntimeError(result.stderr)
+
+        grader_output = yield ops.ReadFileOp(result.stdout_file)
+        return grader_output == '1'  # '1': Correct, '0': Incorrect
@@ -1,61 +1,94 @@
 from typing import List
 
-import docker
-from docker.models.containers import Container
+from docker.models.containers import Container, ExecResult
 
+from treadmill.services.containers import run_container, exec_streaming
 from treadmill.tasks.base import Task
-from treadmill.tasks.path import ROOT
+from treadmill.tasks.path import ROOT, SharedTestDataFile
+from treadmill.utils import BoundedBuffer
 
 
 __all__ = [
     'RunDockerContainerOp',
+    'LeaseDockerContainerOp',
     'ExecInDockerContainerOp',
-    'KillDockerContainerOp'
+    'KillDockerContainerOp',
+    'ReleaseDockerContainerOp',
+    'AllocateCpuSetOp',
+    'ReleaseCpuSetOp'
 ]
 
 
-docker_client: docker.DockerClient = docker.from_env()
-
-
 class RunDockerContainerOp(Task):
-    def __init__(self, container_tag, mount_workspace=True, privileged=False):
+    def __init__(self, container_tag, mount_workspace=True, privileged=False, cpuset=None):
         self.container_tag = container_tag
         self.mount_workspace = mount_workspace
         self.privileged = privileged
+        self.cpuset = cpuset
 
     def _run(self):
-        kwargs = dict(
-            command='/bin/sh',  # Assume alpine based image (bash not installed)
-            stdin_open=True,     # Keep /bin/sh alive
-            remove=True,         # Discard changes made in image after run
-            detach=True          # Run in background
-        )
-
+        volumes = None
         if self.mount_workspace:
-            kwargs.update(volumes={
+            volumes = {
                 ROOT.host_path: {
                     'bind': ROOT.container_path,
                     'mode': 'rw'
                 }
-            })
+            }
+            if self.context.config.SHARED_TESTDATA and self.context.testdata_cache:
+                volumes[self.context.testdata_cache.root] = {
+                    'bind': SharedTestDataFile.mount_root,
+                    'mode': 'ro'
+                }
+
+        return run_container(
+            self.context.docker_client,
+            self.container_tag,
+            volumes=volumes,
+            privileged=self.privileged,
+            cpuset=self.cpuset,
+            request_id=self.context.request and self.context.request.id
+        )
 
-        if self.privileged:
-            kwargs.update(privileged=True)
 
-        return docker_client.containers.run(self.container_tag, **kwargs)
+class LeaseDockerContainerOp(Task):
+    def __init__(self, container_tag, privileged=False, cpuset=None):
+        self.container_tag = container_tag
+        self.privileged = privileged
+        self.cpuset = cpuset
+
+    def _run(self):
+        return self.context.container_pool.lease(
+            self.container_tag,
+            privileged=self.privileged,
+            workspace_id=str(self.context.request.id),
+            cpuset=self.cpuset
+        )
 
 
 class ExecInDockerContainerOp(Task):
-    def __init__(self, container: Container, cmd: List[str], **kwargs):
+    def __init__(self, container: Container, cmd: List[str], privileged=False,
+                 capped=True):
+        """
+        Args:
+            capped: Truncate the output to `EXEC_OUTPUT_LIMIT_BYTES`. Only
+                disable it for output that is parsed as a whole.
+        """
         self.container = container
         self.cmd = cmd
-        self.kwargs = kwargs
+        self.privileged = privileged
+        self.capped = capped
 
     def _run(self):
-        return self.container.exec_run(
+        output = BoundedBuffer(self.context.config.EXEC_OUTPUT_LIMIT_BYTES
+                               if self.capped else 0)
+        exit_code = exec_streaming(
+            self.container,
             ['/bin/sh', '-c', ' '.join(self.cmd)],
-            **self.kwargs
+            output.write,
+            privileged=self.privileged
         )
+        return ExecResult(exit_code, output.getvalue())
 
 
 class KillDockerContainerOp(Task):
@@ -64,4 +97,31 @@ class KillDockerContainerOp(Task):
 
     def _run(self):
         if self.container and self.container.status != 'end':
-            self.container.kill()
+            if self.context.container_reaper:
+                self.context.container_reaper.reap(self.container)
+            else:
+                self.container.kill()
+
+
+class ReleaseDockerContainerOp(Task):
+    def __init__(self, container: Container):
+        self.container = container
+
+    def _run(self):
+        self.context.container_pool.release(self.container)
+
+
+class AllocateCpuSetOp(Task):
+    def __init__(self, count):
+        self.count = count
+
+    def _run(self):
+        return self.context.cpu_allocator.allocate(self.count)
+
+
+class ReleaseCpuSetOp(Task):
+    def __init__(self, cpuset):
+        self.cpuset = cpuset
+
+    def _run(self):
+        self.context.cpu_allocator.release(self.cpuset)
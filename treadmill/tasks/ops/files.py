@@ -1,22 +1,48 @@
 import filecmp
+import hashlib
+import logging
 import os
 import shutil
 
+from treadmill.bundle import Bundle, BundleError
 from treadmill.tasks.base import Task
-from treadmill.tasks.path import AFP
+from treadmill.models import Checker, CheckerType
+from treadmill.signal import WorkspaceExhausted
+from treadmill.utils import compare_files, normalized_digest, run_checker
+from treadmill.tasks.path import AFP, ROOT, SharedTestDataFile
 
 
 __all__ = [
     'CheckFileExistsOp',
     'CreateFileOp',
+    'WriteFileOp',
     'MakeDirectoryOp',
     'CopyFileOp',
+    'StageFileOp',
+    'OpenBundleOp',
+    'PrefetchTestCasesOp',
+    'StageTestCaseOp',
+    'CancelPrefetchOp',
     'ReadFileOp',
+    'ListDirectoryOp',
     'CompareFileOp',
-    'RemoveDirectoryOp'
+    'CheckFileDigestOp',
+    'CheckOutputDigestOp',
+    'RemoveDirectoryOp',
+    'CreateWorkspaceOp',
+    'AccountWorkspaceOp',
+    'CheckWorkspaceSpaceOp',
+    'RemoveWorkspaceOp',
+    'CompileOnHostOp',
+    'ArtifactKeyOp',
+    'RestoreArtifactOp',
+    'SaveArtifactOp'
 ]
 
 
+_logger = logging.getLogger('treadmill.tasks.ops.files')
+
+
 class CheckFileExistsOp(Task):
     def __init__(self, afp: AFP):
         self.afp = afp
@@ -41,6 +67,22 @@ class CreateFileOp(Task):
             os.chmod(self.afp.host_path, self.mode)
 
 
+class WriteFileOp(Task):
+    def __init__(self, afp: AFP, content: str, mode=None):
+        self.afp = afp
+        self.content = content
+        self.mode = mode
+
+    def _run(self):
+        dest_dir = os.path.dirname(self.afp.host_path)
+        if not os.path.exists(dest_dir):
+            os.makedirs(dest_dir, mode=0o755)
+        with open(self.afp.host_path, 'w') as f:
+            f.write(self.content)
+        if self.mode:
+            os.chmod(self.afp.host_path, self.mode)
+
+
 class MakeDirectoryOp(Task):
     def __init__(self, afp: AFP, mode=0o755, exist_ok=False):
         self.afp = afp
@@ -63,6 +105,108 @@ class CopyFileOp(Task):
         shutil.copyfile(self.src_path, self.dest_path)
 
 
+class StageFileOp(Task):
+    """
+    Places the S3 file of `afp` in the workspace, through the node-local test
+    data cache when there is one and the data is versioned. Shared test data
+    files are pinned in the cache instead. Files packed in the test data
+    bundle of the request are extracted from it rather than fetched one by
+    one, unless their member is corrupt. Returns the size of the file.
+    """
+
+    def __init__(self, afp: AFP, version=None):
+        self.afp = afp
+        self.version = version
+
+    def _run(self):
+        s3_key = os.path.join(*self.afp.s3_key)
+        bundle = self.context.testdata_bundle
+        if bundle and s3_key in bundle:
+            try:
+                return self._stage(s3_key, bundle)
+            except BundleError as e:
+                _logger.warning(f'Fetching {s3_key} by itself: {e}')
+        return self._stage(s3_key, self.context.s3_fetcher)
+
+    def _stage(self, s3_key, fetcher):
+        if isinstance(self.afp, SharedTestDataFile):
+            self.context.testdata_cache.pin(
+                s3_key,
+                self.version,
+                owner=self.context.request.id,
+                fetcher=fetcher
+            )
+        elif self.context.testdata_cache and self.version:
+            self.context.testdata_cache.link(
+                s3_key,
+                self.version,
+                self.afp.host_path,
+                fetcher=fetcher
+            )
+        else:
+            dest_dir = os.path.dirname(self.afp.host_path)
+            os.makedirs(dest_dir, mode=0o755, exist_ok=True)
+            fetcher.fetch(s3_key, self.afp.host_path)
+        return os.path.getsize(self.afp.host_path)
+
+
+class OpenBundleOp(Task):
+    """
+    Fetches the test data bundle at `afp` and maps it. The bundle is pinned
+    in the test data cache when there is one and the data is versioned,
+    and fetched into the workspace otherwise. Returns the `Bundle`, or None
+    when it is missing or corrupt (test data is then fetched file by file).
+    """
+
+    def __init__(self, afp: AFP, version=None):
+        self.afp = afp
+        self.version = version
+
+    def _run(self):
+        s3_key = os.path.join(*self.afp.s3_key)
+        try:
+            if self.context.testdata_cache and self.version:
+                bundle_path = self.context.testdata_cache.pin(
+                    s3_key,
+                    self.version,
+                    owner=self.context.request.id
+                )
+            else:
+                bundle_path = self.afp.host_path
+                os.makedirs(os.path.dirname(bundle_path), mode=0o755, exist_ok=True)
+                self.context.s3_fetcher.fetch(s3_key, bundle_path)
+            return Bundle(bundle_path)
+        except (FileNotFoundError, BundleError) as e:
+            _logger.warning(f'Not using test data bundle {s3_key}: {e}')
+            return None
+
+
+class PrefetchTestCasesOp(Task):
+    def __init__(self, testset, testcases):
+        self.testset = testset
+        self.testcases = testcases
+
+    def _run(self):
+        return self.context.testdata_stager.prefetch(self.testset, self.testcases)
+
+
+class StageTestCaseOp(Task):
+    def __init__(self, testset, testcase):
+        self.testset = testset
+        self.testcase = testcase
+
+    def _run(self):
+        self.context.testdata_stager.stage(self.testset, self.testcase)
+
+
+class CancelPrefetchOp(Task):
+    def __init__(self, testset):
+        self.testset = testset
+
+    def _run(self):
+        self.context.testdata_stager.cancel(self.testset)
+
+
 class ReadFileOp(Task):
     def __init__(self, afp):
         self.afp = afp
@@ -72,15 +216,71 @@ class ReadFileOp(Task):
             return f.read()
 
 
+class ListDirectoryOp(Task):
+    """Returns the names of the files in the directory"""
+
+    def __init__(self, afp: AFP):
+        self.afp = afp
+
+    def _run(self):
+        return sorted(name for name in os.listdir(self.afp.host_path)
+                      if os.path.isfile(os.path.join(self.afp.host_path, name)))
+
+
 class CompareFileOp(Task):
-    def __init__(self, target: AFP, expected: AFP):
+    """
+    Compares the files with `checker`, or ignoring surrounding whitespace
+    without one. Returns a `Comparison`, falsy with the location of the
+    first difference when they differ.
+    """
+
+    def __init__(self, target: AFP, expected: AFP, checker: Checker = None):
         self.target = target
         self.expected = expected
+        self.checker = checker
+
+    def _run(self):
+        if not self.checker:
+            return compare_files(self.target.host_path, self.expected.host_path)
+        options = {}
+        if self.checker.type is CheckerType.FLOAT:
+            options = dict(abs_epsilon=self.checker.abs_epsilon,
+                           rel_epsilon=self.checker.rel_epsilon)
+        return run_checker(self.checker.type.value, self.target.host_path,
+                           self.expected.host_path, **options)
+
+
+class CheckFileDigestOp(Task):
+    """Checks whether the sha1 hex digest of the file equals to `digest`"""
+
+    chunk_size = 1 << 16
+
+    def __init__(self, afp: AFP, digest: str):
+        self.afp = afp
+        self.digest = digest
 
     def _run(self):
-        a = open(self.target.host_path, 'r').read().strip()
-        b = open(self.expected.host_path, 'r').read().strip()
-        return a == b
+        sha1 = hashlib.sha1()
+        with open(self.afp.host_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest() == self.digest
+
+
+class CheckOutputDigestOp(Task):
+    """
+    Checks whether the normalized digest and length of the output (see
+    `normalized_digest`) equal to those of the expected output
+    """
+
+    def __init__(self, afp: AFP, digest: str, length: int):
+        self.afp = afp
+        self.digest = digest
+        self.length = length
+
+    def _run(self):
+        digest, length = normalized_digest(self.afp.host_path, max_length=self.length)
+        return (digest, length) == (self.digest, self.length)
 
 
 class RemoveDirectoryOp(Task):
@@ -90,3 +290,164 @@ class RemoveDirectoryOp(Task):
     def _run(self):
         if os.path.isdir(self.target.host_path):
             shutil.rmtree(self.target.host_path)
+
+
+class CreateWorkspaceOp(Task):
+    """
+    Creates the workspace of the request, on tmpfs if it fits there. A tmpfs
+    workspace is linked from `HOST_WORKSPACE_ROOT` so that every path stays
+    the same. Returns whether the workspace is on tmpfs.
+    """
+
+    def __init__(self, estimate=0):
+        self.estimate = estimate
+
+    def _run(self):
+        workspace_path = os.path.normpath(ROOT.host_path)
+        tmpfs_workspaces = self.context.tmpfs_workspaces
+        tmpfs_path = tmpfs_workspaces and tmpfs_workspaces.allocate(
+            self.context.request.id, self.estimate
+        )
+        if tmpfs_path:
+            os.makedirs(os.path.dirname(workspace_path), mode=0o755, exist_ok=True)
+            os.symlink(tmpfs_path, workspace_path)
+        else:
+            os.makedirs(workspace_path, mode=0o755)
+        if self.context.workspace_cleaner:
+            self.context.workspace_cleaner.claim(workspace_path)
+        return bool(tmpfs_path)
+
+
+class AccountWorkspaceOp(Task):
+    """
+    Updates the live bytes of a tmpfs workspace. Raises `WorkspaceExhausted`
+    like `CheckWorkspaceSpaceOp`.
+    """
+
+    def _run(self):
+        tmpfs_workspaces = self.context.tmpfs_workspaces
+        if tmpfs_workspaces:
+            live = tmpfs_workspaces.account(self.context.request.id)
+            if tmpfs_workspaces.exhausted(self.context.request.id):
+                raise WorkspaceExhausted()
+            return live
+
+
+class CheckWorkspaceSpaceOp(Task):
+    """
+    Raises `WorkspaceExhausted` once a tmpfs workspace ran out of space, as
+    outputs written meanwhile cannot be trusted for a verdict
+    """
+
+    def _run(self):
+        tmpfs_workspaces = self.context.tmpfs_workspaces
+        if tmpfs_workspaces and tmpfs_workspaces.exhausted(self.context.request.id):
+            raise WorkspaceExhausted()
+
+
+class RemoveWorkspaceOp(Task):
+    """
+    Removes the workspace of the request. tmpfs workspaces are deleted right
+    away to return their budget; others are left to the workspace cleaner.
+    """
+
+    def _run(self):
+        workspace_path = os.path.normpath(ROOT.host_path)
+        if os.path.islink(workspace_path):
+            os.unlink(workspace_path)
+            self.context.tmpfs_workspaces.release(self.context.request.id)
+        elif os.path.isdir(workspace_path):
+            if self.context.workspace_cleaner:
+                self.context.workspace_cleaner.remove(workspace_path)
+            else:
+                shutil.rmtree(workspace_path)
+
+
+class CompileOnHostOp(Task):
+    """
+    Compiles on the worker, for languages that can (see
+    `LangProfile.compile_on_host`). Returns (exit code, output), or None.
+    """
+
+    def __init__(self, lang, src_file: AFP):
+        self.lang = lang
+        self.src_file = src_file
+
+    def _run(self):
+        return self.lang.profile.compile_on_host(
+            self.context.config,
+            self.src_file.host_path,
+            self.src_file.container_path
+        )
+
+
+class ArtifactKeyOp(Task):
+    """
+    Key of the artifacts built from `src_file` by the builder of `lang`:
+    a digest of the source, the language version, the builder image
+    digest and `extra`. Returns None when artifacts are not stored or the
+    builder image digest is unknown.
+    """
+
+    def __init__(self, src_file: AFP, lang, extra=()):
+        self.src_file = src_file
+        self.lang = lang
+        self.extra = extra
+
+    def _run(self):
+        image_registry = self.context.image_registry
+        if not (self.context.artifact_store and image_registry):
+            return None
+        image_digest = image_registry.digest(
+            self.lang.profile.builder_image_tag(self.context.config)
+        )
+        if not image_digest:
+            return None
+
+        src_digest = hashlib.sha256()
+        with open(self.src_file.host_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                src_digest.update(chunk)
+        key = hashlib.sha256()
+        for part in (src_digest.hexdigest(), self.lang.profile.version, image_digest,
+                     *self.extra):
+            key.update(str(part).encode('utf-8') + b'\0')
+        return key.hexdigest()
+
+
+class RestoreArtifactOp(Task):
+    """
+    Copies the artifacts stored under `key` to `files`, a dict of artifact
+    names to `AFP`s. Returns whether they were found.
+    """
+
+    def __init__(self, key, files):
+        self.key = key
+        self.files = files
+
+    def _run(self):
+        entry_path = self.key and self.context.artifact_store.lookup(self.key)
+        if not entry_path:
+            return False
+        try:
+            for name, afp in self.files.items():
+                os.makedirs(os.path.dirname(afp.host_path), mode=0o755, exist_ok=True)
+                shutil.copy2(os.path.join(entry_path, name), afp.host_path)
+        except FileNotFoundError:
+            return False  # Evicted in the meantime
+        return True
+
+
+class SaveArtifactOp(Task):
+    """Stores `files`, a dict of artifact names to `AFP`s, under `key`"""
+
+    def __init__(self, key, files):
+        self.key = key
+        self.files = files
+
+    def _run(self):
+        if self.key:
+            self.context.artifact_store.store(
+                self.key,
+                {name: afp.host_path for name, afp in self.files.items()}
+            )
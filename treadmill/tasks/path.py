@@ -48,6 +48,10 @@ class AFP(ContextMixin):
                 *self._s3fs_path
             )
 
+    @property
+    def s3_key(self):
+        return self._s3fs_path
+
     @property
     def container_path(self):
         return os.path.join(
@@ -69,6 +73,40 @@ class AFP(ContextMixin):
         return repr(self._path)
 
 
+class SharedTestDataFile(AFP):
+    """
+    Test data file read in place from the node-level test data cache, which
+    is mounted read-only at the same location in containers. Isolate boxes
+    never see it, as it holds the expected outputs of every problem.
+    """
+    mount_root = '/testdata'
+
+    def __init__(self, *, s3fs_path: List[str]):
+        super().__init__(path=[], sandbox_visible=False, s3fs_path=s3fs_path)
+
+    @property
+    def host_path(self):
+        context = self.context
+        return context.testdata_cache.entry_path(
+            os.path.join(*self.s3_key),
+            context.judge_spec.updated_at.isoformat()
+        )
+
+    @property
+    def container_path(self):
+        cache_root = self.context.testdata_cache.root
+        return os.path.join(self.mount_root, os.path.relpath(self.host_path, cache_root))
+
+    def __repr__(self):
+        return f'SharedTestDataFile({self.s3_key!r})'
+
+
+def shared_test_data_enabled():
+    context = get_current_context()
+    return bool(context.config.SHARED_TESTDATA and context.testdata_cache
+                and context.judge_spec.updated_at)
+
+
 ROOT = AFP(path=[], sandbox_visible=False)
 SANDBOX_ROOT = AFP(path=[], sandbox_visible=True)
 ETC = AFP(path=[], sandbox_dirname='etc')
@@ -96,12 +134,29 @@ def grader_bin_file():
     return AFP(path=['grader', bin_file_name])
 
 
+def compile_result_file(kind):
+    return AFP(path=['logs', f'{kind}.compile.json'], sandbox_visible=False)
+
+
+def test_data_bundle_file():
+    context = get_current_context()
+    return AFP(path=['testdata.bundle'], sandbox_visible=False,
+               s3fs_path=[context.judge_spec.bundle])
+
+
+def exec_log_file(box_id, exec_id, ext):
+    return AFP(path=['logs', f'box{box_id}', f'{exec_id}.{ext}'])
+
+
 def test_input_file(testset, testcase):
+    # Linked into the sandbox even with shared test data, for isolate boxes
     return AFP(path=['data', str(testset.id), os.path.basename(testcase.input_file)],
                s3fs_path=[testcase.input_file])
 
 
 def test_output_file(testset, testcase):
+    if shared_test_data_enabled():
+        return SharedTestDataFile(s3fs_path=[testcase.output_file])
     return AFP(path=['data', str(testset.id), os.path.basename(testcase.output_file)],
                s3fs_path=[testcase.output_file],
                sandbox_visible=False)
@@ -1,6 +1,6 @@
 from treadmill.models import JudgeStatus
 from treadmill.signal import SubmissionCompileError
-from .workspace import WorkspaceEnviron
+from .workspace import WorkspaceEnviron, StageTestDataTask
 from .base import Task, get_task_stack
 from .stage import CompileStage, JudgeStage
 from . import ops
@@ -15,7 +15,11 @@ class JudgePipeline(Task):
             )
             yield ops.UpdateJudgeResultOp(status=JudgeStatus.IN_PROGRESS)
             with WorkspaceEnviron():
+                # Test data is staged in the background while compiling
                 yield CompileStage()
+                if not self.context.config.LAZY_STAGING:
+                    yield StageTestDataTask()
+                    yield ops.AccountWorkspaceOp()
                 yield JudgeStage()
         except SubmissionCompileError as e:
             yield ops.UpdateJudgeResultOp(
@@ -1,3 +1,5 @@
+import json
+import os
 from contextlib import ExitStack
 
 from treadmill.signal import SubmissionCompileError, GraderCompileError
@@ -5,6 +7,8 @@ from treadmill.tasks.judge import JudgeTask
 
 from .base import Task
 from .container import BuilderEnviron, CompileTask, SandboxEnviron
+from .grader import PersistentGraderEnviron
+from . import ops
 from . import path
 
 
@@ -15,33 +19,125 @@ __all__ = [
 
 
 class CompileStage(Task):
+    """
+    Compiles the submission and the grader. Builds are kept in the artifact
+    store and reused whenever the same source is compiled by the same
+    builder image again: graders across the submissions of a problem, and
+    submissions (compile errors included) on rejudges and resubmissions.
+    Languages the worker can compile itself (e.g. Python, which is only
+    syntax-checked) never start a builder.
+    """
+
     def _run(self):
+        grader_key = None
+        build_grader = bool(self.context.grader and self.context.grader_lang.profile.need_compile)
+        if build_grader:
+            build_grader = not (yield from self._compile_on_host('grader'))
+        if build_grader:
+            grader_key = yield from self._build_key('grader')
+            build_grader = (yield from self._restore_build('grader', grader_key)) is None
+
+        subm_key = None
         subm_lang = self.context.subm_lang
-        if subm_lang.profile.need_compile:
-            with BuilderEnviron(lang=self.context.subm_lang) as subm_builder:
-                yield from self._build_subm(subm_builder)
-                if self.context.grader and self.context.subm_lang == self.context.grader_lang:
-                    yield from self._build_grader(subm_builder)
+        build_subm = subm_lang.profile.need_compile
+        if build_subm:
+            build_subm = not (yield from self._compile_on_host('subm'))
+        if build_subm:
+            subm_key = yield from self._build_key('subm')
+            result = yield from self._restore_build('subm', subm_key)
+            if result is not None:
+                build_subm = False
+                if result.exit_code != 0:
+                    raise SubmissionCompileError(result.output)
+
+        if build_subm:
+            with BuilderEnviron(lang=subm_lang) as subm_builder:
+                yield from self._build_subm(subm_builder, subm_key)
+                if build_grader and subm_lang == self.context.grader_lang:
+                    yield from self._build_grader(subm_builder, grader_key)
                     return
 
-        if self.context.grader:
-            grader_lang = self.context.grader_lang
-            if grader_lang.profile.need_compile:
-                with BuilderEnviron(lang=self.context.grader_lang) as grader_builder:
-                    yield from self._build_grader(grader_builder)
+        if build_grader:
+            with BuilderEnviron(lang=self.context.grader_lang) as grader_builder:
+                yield from self._build_grader(grader_builder, grader_key)
+
+    def _build_files(self, kind):
+        """Language, source file, binary file and directory of the build"""
+        if kind == 'subm':
+            return self.context.subm_lang, path.subm_src_file(), path.subm_bin_file(), 'subm'
+        return self.context.grader_lang, path.grader_src_file(), path.grader_bin_file(), 'grader'
+
+    def _compile_on_host(self, kind):
+        """Returns whether the worker compiled the source itself"""
+        lang, src_file, _, _ = self._build_files(kind)
+        compiled = yield ops.CompileOnHostOp(lang, src_file)
+        if compiled is None:
+            return False
+        exit_code, output = compiled
+        if exit_code != 0:
+            output = output.decode('utf-8', errors='replace')
+            if kind == 'subm':
+                raise SubmissionCompileError(output)
+            raise GraderCompileError(output)
+        return True
+
+    def _build_key(self, kind):
+        lang, src_file, bin_file, _ = self._build_files(kind)
+        compile_cmd = lang.profile.get_compile_cmd(src_file.container_path,
+                                                   bin_file.container_path)
+        key = yield ops.ArtifactKeyOp(src_file, lang, extra=[kind, *compile_cmd])
+        return key
+
+    def _restore_build(self, kind, key):
+        """Restores a stored build. Returns its `CompileTask.Result`, or None."""
+        if not key:
+            return None
+        result_file = path.compile_result_file(kind)
+        restored = yield ops.RestoreArtifactOp(key, {'result': result_file})
+        if not restored:
+            return None
+        stored = json.loads((yield ops.ReadFileOp(result_file)))
+
+        _, _, _, build_dir = self._build_files(kind)
+        restored = yield ops.RestoreArtifactOp(key, {
+            f'out.{name}': path.AFP(path=[build_dir, name]) for name in stored['outputs']
+        })
+        if not restored:
+            return None
+        return CompileTask.Result(exit_code=stored['exit_code'], output=stored['output'])
+
+    def _save_build(self, kind, key, result):
+        # Other exit codes may come from the environment (e.g. a killed compiler)
+        if not key or result.exit_code not in (0, 1):
+            return
+        _, src_file, _, build_dir = self._build_files(kind)
+        outputs = []
+        if result.exit_code == 0:
+            names = yield ops.ListDirectoryOp(path.AFP(path=[build_dir]))
+            outputs = [name for name in names if name != os.path.basename(src_file.host_path)]
+
+        result_file = path.compile_result_file(kind)
+        yield ops.WriteFileOp(result_file, json.dumps({
+            'exit_code': result.exit_code,
+            'output': result.output,
+            'outputs': outputs
+        }))
+        yield ops.SaveArtifactOp(key, {
+            'result': result_file,
+            **{f'out.{name}': path.AFP(path=[build_dir, name]) for name in outputs}
+        })
 
-    @staticmethod
-    def _build_subm(builder):
+    def _build_subm(self, builder, key):
         result = yield CompileTask(
             builder=builder,
             src_file=path.subm_src_file(),
             out_file=path.subm_bin_file()
         )
+        yield from self._save_build('subm', key, result)
         if result.exit_code != 0:
             raise SubmissionCompileError(result.output)
 
-    @staticmethod
-    def _build_grader(builder):
+    def _build_grader(self, builder, key):
         result = yield CompileTask(
             builder=builder,
             src_file=path.grader_src_file(),
@@ -49,6 +145,7 @@ class CompileStage(Task):
         )
         if result.exit_code != 0:
             raise GraderCompileError(result.output)
+        yield from self._save_build('grader', key, result)
 
 
 class JudgeStage(Task):
@@ -60,6 +157,11 @@ class JudgeStage(Task):
             if self.context.grader:
                 grader_sandbox = SandboxEnviron(lang=self.context.grader_lang, isolated=False)
                 stack.enter_context(grader_sandbox)
+                if self.context.grader.persistent:
+                    stack.enter_context(PersistentGraderEnviron(
+                        sandbox=grader_sandbox,
+                        bin_file=path.grader_bin_file()
+                    ))
 
             yield JudgeTask(
                 subm_sandbox=subm_sandbox,
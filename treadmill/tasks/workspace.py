@@ -1,47 +1,177 @@
-from .base import Environ
+import logging
+import threading
+import time
+from concurrent.futures import wait, CancelledError, FIRST_EXCEPTION
+
+from treadmill.context import ContextMixin, get_current_context
+from .base import Environ, Task, TaskExecutor
 from . import ops
 from . import path
 
 
 __all__ = [
-    'WorkspaceEnviron'
+    'WorkspaceEnviron',
+    'StageTestDataTask',
+    'TestDataStager',
+    'verifies_by_digest'
 ]
 
 
+_logger = logging.getLogger('treadmill.tasks.workspace')
+
+
 class WorkspaceEnviron(Environ):
+    """
+    Request workspace. Only sources are staged on setup; test data is
+    staged in the background by a `TestDataStager` so that it overlaps with
+    compiling, and the part not staged yet is skipped when the workspace
+    is left early (e.g. on compile errors). When the judge spec has a test
+    data bundle, it is fetched once on setup and test data is extracted
+    from it.
+    """
+
     directory_ready = False
+    stager = None
+    bundle = None
 
     def _setup(self):
-        yield ops.MakeDirectoryOp(path.ROOT, mode=0o755)
-        self.directory_ready = True
-
-        subm_src_file = path.subm_src_file()
-        yield ops.CopyFileOp(
-            src_path=subm_src_file.s3fs_path,
-            dest_path=subm_src_file.host_path
+        testcase_count = sum(len(testset.testcases)
+                             for testset in self.context.judge_spec.testsets)
+        yield ops.CreateWorkspaceOp(
+            estimate=testcase_count * self.context.config.TMPFS_TESTCASE_ALLOWANCE_BYTES
         )
+        self.directory_ready = True
 
-        for testset in self.context.judge_spec.testsets:
-            for testcase in testset.testcases:
-                test_input_file = path.test_input_file(testset, testcase)
-                yield ops.CopyFileOp(
-                    src_path=test_input_file.s3fs_path,
-                    dest_path=test_input_file.host_path
-                )
-
-                test_output_file = path.test_output_file(testset, testcase)
-                yield ops.CopyFileOp(
-                    src_path=test_output_file.s3fs_path,
-                    dest_path=test_output_file.host_path
-                )
+        judge_spec = self.context.judge_spec
+        if judge_spec.bundle:
+            self.bundle = yield ops.OpenBundleOp(
+                path.test_data_bundle_file(),
+                version=judge_spec.updated_at and judge_spec.updated_at.isoformat()
+            )
+            self.context.testdata_bundle = self.bundle
 
+        yield ops.StageFileOp(path.subm_src_file())
         if self.context.grader:
-            grader_src_file = path.grader_src_file()
-            yield ops.CopyFileOp(
-                src_path=grader_src_file.s3fs_path,
-                dest_path=grader_src_file.host_path
-            )
+            yield ops.StageFileOp(path.grader_src_file())
+
+        self.stager = TestDataStager()
+        self.context.testdata_stager = self.stager
+        if not self.context.config.LAZY_STAGING:
+            # Otherwise testcases are staged on demand while judging
+            for testset in self.context.judge_spec.testsets:
+                yield ops.PrefetchTestCasesOp(testset, testset.testcases)
 
     def _teardown(self):
+        if self.stager:
+            # In-flight copies must end before the workspace is removed
+            self.stager.shutdown()
+            self.context.testdata_stager = None
+        if self.bundle:
+            self.bundle.close()
+            self.context.testdata_bundle = None
         if self.directory_ready:
-            yield ops.RemoveDirectoryOp(path.ROOT)
+            yield ops.RemoveWorkspaceOp()
+
+
+def verifies_by_digest(testcase):
+    """
+    Whether outputs of the testcase are verified against its output digest
+    rather than compared with its output file. Only the default comparison
+    has a digest to verify against.
+    """
+    context = get_current_context()
+    return bool(testcase.output_digest and testcase.output_length is not None
+                and not context.grader and not context.judge_spec.checker)
+
+
+def testcase_files(testset, testcase):
+    """Test data files of the testcase to stage"""
+    if verifies_by_digest(testcase) and not get_current_context().config.DETAILED_FEEDBACK:
+        return path.test_input_file(testset, testcase),
+    return path.test_input_file(testset, testcase), path.test_output_file(testset, testcase)
+
+
+class StageTestDataTask(Task):
+    """
+    Waits until the test data of every testset is staged, with up to
+    `STAGING_CONCURRENCY` files in flight since per-file latency dominates
+    over s3fs. Fails as soon as any file fails, without starting the
+    remaining ones. Returns the staged bytes.
+    """
+
+    def _run(self):
+        futures = []
+        for testset in self.context.judge_spec.testsets:
+            futures += yield ops.PrefetchTestCasesOp(testset, testset.testcases)
+
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        for future in pending:
+            future.cancel()
+        staged_bytes = sum(future.result() for future in done)
+
+        elapsed = time.monotonic() - self.context.testdata_stager.started_at
+        _logger.info(f'Staged {len(futures)} files ({staged_bytes} bytes) in {elapsed:.3f}s')
+        return staged_bytes
+
+
+class TestDataStager(ContextMixin):
+    """
+    Stages testcases in the background. Judges ask for testcases ahead of
+    the one being judged (`prefetch`), wait for the one they are about to
+    judge (`stage`) and drop the rest of a testset once it failed (`cancel`).
+    """
+
+    __test__ = False  # See TestDataCache
+
+    def __init__(self):
+        updated_at = self.context.judge_spec.updated_at
+        self._version = updated_at and updated_at.isoformat()
+        self._executor = TaskExecutor(self.context.config.STAGING_CONCURRENCY)
+        self._futures = {}  # (testset id, testcase id) -> futures of its files
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+
+    def prefetch(self, testset, testcases):
+        """Returns the futures of the testcase files, each resulting in its size"""
+        futures = []
+        with self._lock:
+            for testcase in testcases:
+                key = (testset.id, testcase.id)
+                files = testcase_files(testset, testcase)
+                previous = self._futures.get(key) or [None] * len(files)
+                # Only files never staged or cancelled before being staged
+                self._futures[key] = [
+                    future if future and not future.cancelled()
+                    else self._executor.submit(ops.StageFileOp(afp, version=self._version))
+                    for afp, future in zip(files, previous)
+                ]
+                futures += self._futures[key]
+        return futures
+
+    def stage(self, testset, testcase):
+        """Blocks until the files of the testcase are staged"""
+        while True:
+            futures = self.prefetch(testset, [testcase])
+            try:
+                for future in futures:
+                    future.result()
+                return
+            except CancelledError:
+                continue  # Cancelled in the meantime, stage it again
+
+    def cancel(self, testset):
+        with self._lock:
+            for (testset_id, _), futures in self._futures.items():
+                if testset_id == testset.id:
+                    for future in futures:
+                        future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            for futures in self._futures.values():
+                for future in futures:
+                    future.cancel()
+        self._executor.shutdown(wait=True)
+        if self.context.testdata_cache:
+            # Shared test data files and the bundle are pinned
+            self.context.testdata_cache.unpin(self.context.request.id)
@@ -0,0 +1,42 @@
+import asyncio
+import struct
+from unittest.mock import Mock
+
+import pytest
+
+from treadmill.clients.engine import _EngineContainerCollection, read_multiplexed_stream
+
+
+def frame(stream_type, payload):
+    return struct.pack('>BxxxL', stream_type, len(payload)) + payload
+
+
+def test_read_multiplexed_stream():
+    async def read(data):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        chunks = []
+        await read_multiplexed_stream(reader, chunks.append)
+        return chunks
+
+    data = frame(1, b'hello ') + frame(2, b'') + frame(2, b'world\n')
+    loop = asyncio.new_event_loop()
+    assert loop.run_until_complete(read(data)) == [b'hello ', b'world\n']
+    assert loop.run_until_complete(read(b'')) == []
+    loop.close()
+
+
+def test_run_container_honours_arguments():
+    client = Mock(call=lambda coro: coro)
+    containers = _EngineContainerCollection(client)
+    containers.run('alpine', '/bin/sh', stdin_open=True, remove=True, detach=True)
+    client.engine.run_container.assert_called_once_with(
+        'alpine', command='/bin/sh', stdin_open=True, auto_remove=True,
+        volumes=None, privileged=False, labels=None, cpuset_cpus=None, cpuset_mems=None
+    )
+
+    with pytest.raises(TypeError):
+        containers.run('alpine', '/bin/sh')  # Attached
+    with pytest.raises(TypeError):
+        containers.run('alpine', detach=True, network_mode='none')
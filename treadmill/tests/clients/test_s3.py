@@ -0,0 +1,125 @@
+import hashlib
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from treadmill.clients.s3 import S3Client
+from treadmill.config import TestConfig
+from treadmill.signal import ObjectStoreError
+
+
+class FakeS3Handler(BaseHTTPRequestHandler):
+    """Minimal S3 stand-in serving `objects` of a single bucket"""
+
+    objects = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append(self.headers)
+        key = self.path.split('/', 2)[2]
+        if key == 'stalled.in':
+            time.sleep(0.5)
+        if key not in self.objects:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = self.objects[key]
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        if self.headers.get('If-Match', etag) != etag:
+            self.send_response(412)
+            self.end_headers()
+            return
+
+        status, headers = 200, {}
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(body) - 1)
+            if start >= len(body):
+                self.send_response(416)
+                self.end_headers()
+                return
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(body)}'
+            body = body[start:end + 1]
+
+        self.send_response(status)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def s3():
+    FakeS3Handler.objects = {
+        'small.in': b'hello',
+        'large.in': bytes(range(256)) * 10,
+        'empty.in': b''
+    }
+    FakeS3Handler.requests = []
+    server = HTTPServer(('127.0.0.1', 0), FakeS3Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield S3Client(TestConfig(
+        S3_ENDPOINT=f'http://127.0.0.1:{server.server_port}',
+        S3_BUCKET='testdata',
+        S3_ACCESS_KEY_ID='key',
+        S3_SECRET_ACCESS_KEY='secret',
+        S3_PART_BYTES=1000,
+        S3_READ_TIMEOUT_SECONDS=0.2
+    ))
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_small_object_with_single_request(s3, tmpdir):
+    dest_path = str(tmpdir.join('small.in'))
+    written, etag = s3.fetch('small.in', dest_path)
+
+    assert written and etag
+    assert open(dest_path, 'rb').read() == b'hello'
+    assert len(FakeS3Handler.requests) == 1
+    assert FakeS3Handler.requests[0]['Authorization'].startswith(
+        'AWS4-HMAC-SHA256 Credential=key/'
+    )
+
+
+def test_fetch_large_object_with_ranged_requests(s3, tmpdir):
+    dest_path = str(tmpdir.join('large.in'))
+    s3.fetch('large.in', dest_path)
+
+    assert open(dest_path, 'rb').read() == FakeS3Handler.objects['large.in']
+    assert sorted(request['Range'] for request in FakeS3Handler.requests) == [
+        'bytes=0-999', 'bytes=1000-1999', 'bytes=2000-2559'
+    ]
+
+
+def test_conditional_fetch_and_edge_cases(s3, tmpdir):
+    dest_path = str(tmpdir.join('small.in'))
+    _, etag = s3.fetch('small.in', dest_path)
+    assert s3.fetch('small.in', str(tmpdir.join('again.in')), etag=etag) == (False, etag)
+    assert not tmpdir.join('again.in').exists()
+
+    s3.fetch('empty.in', str(tmpdir.join('empty.in')))
+    assert tmpdir.join('empty.in').read_binary() == b''
+
+    with pytest.raises(FileNotFoundError):
+        s3.fetch('missing.in', str(tmpdir.join('missing.in')))
+
+
+def test_stalled_request_times_out(s3, tmpdir):
+    with pytest.raises(ObjectStoreError):
+        s3.fetch('stalled.in', str(tmpdir.join('stalled.in')))
@@ -0,0 +1,43 @@
+import os
+
+from treadmill.config import TestConfig
+from treadmill.services.artifacts import ArtifactStore
+
+
+def new_store(tmpdir, node, max_bytes=1024):
+    return ArtifactStore(TestConfig(
+        ARTIFACT_CACHE_ROOT=str(tmpdir.join(node)),
+        ARTIFACT_CACHE_MAX_BYTES=max_bytes,
+        ARTIFACT_SHARED_ROOT=str(tmpdir.join('shared'))
+    ))
+
+
+def test_store_and_share_across_nodes(tmpdir):
+    tmpdir.join('main').write('binary')
+    os.chmod(str(tmpdir.join('main')), 0o755)
+    first, second = new_store(tmpdir, 'node1'), new_store(tmpdir, 'node2')
+    assert first.lookup('ab12') is None
+
+    first.store('ab12', {'bin': str(tmpdir.join('main'))})
+    assert open(os.path.join(first.lookup('ab12'), 'bin')).read() == 'binary'
+
+    entry_path = second.lookup('ab12')
+    assert entry_path.startswith(str(tmpdir.join('node2')))
+    assert os.stat(os.path.join(entry_path, 'bin')).st_mode & 0o111
+    assert (second.stats.hits, second.stats.shared_hits) == (0, 1)
+    second.lookup('ab12')
+    assert second.stats.hits == 1
+
+
+def test_evict_least_recently_used(tmpdir):
+    tmpdir.join('main').write('x' * 400)
+    store = new_store(tmpdir, 'node', max_bytes=1300)
+    for mtime, key in enumerate(('aa01', 'bb02', 'cc03')):
+        store.store(key, {'bin': str(tmpdir.join('main'))})
+        os.utime(str(tmpdir.join('node', key[:2], key)), (mtime, mtime))
+    store.lookup('aa01')  # Now the most recently used
+
+    store.store('dd04', {'bin': str(tmpdir.join('main'))})
+    remaining = {key for key in ('aa01', 'bb02', 'cc03', 'dd04')
+                 if os.path.isdir(str(tmpdir.join('node', key[:2], key)))}
+    assert remaining == {'aa01', 'cc03', 'dd04'}
@@ -0,0 +1,65 @@
+import os
+import subprocess
+
+from treadmill.config import TestConfig
+from treadmill.services.cleaner import WorkspaceCleaner
+
+
+def new_cleaner(tmpdir):
+    return WorkspaceCleaner(TestConfig(
+        HOST_WORKSPACE_ROOT=str(tmpdir.join('workspaces')),
+        WORKSPACE_CLEANUP_BACKLOG=2
+    ))
+
+
+def new_workspace(tmpdir, name):
+    workspace = tmpdir.join('workspaces', name)
+    workspace.join('sandbox', 'data').ensure(dir=True)
+    workspace.join('sandbox', 'data', '1.in').write('1 2')
+    return str(workspace)
+
+
+def dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def test_remove_in_background(tmpdir):
+    cleaner = new_cleaner(tmpdir)
+    cleaner.start()
+    try:
+        for request_id in range(5):
+            workspace_path = new_workspace(tmpdir, str(request_id))
+            cleaner.remove(workspace_path)
+            assert not os.path.exists(workspace_path)
+    finally:
+        cleaner.stop()
+    assert os.listdir(str(tmpdir.join('workspaces', '.trash'))) == []
+
+
+def test_sweep_removes_orphan_workspaces(tmpdir):
+    cleaner = new_cleaner(tmpdir)
+    live, orphan = new_workspace(tmpdir, '1'), new_workspace(tmpdir, '2')
+    cleaner.claim(live)
+    cleaner.claim(orphan)
+    tmpdir.join('workspaces', '2', '.owner').write(str(dead_pid()))
+    unclaimed = new_workspace(tmpdir, '3')  # Possibly being created
+    tmpdir.join('workspaces', '.trash', 'old').ensure(dir=True)
+
+    assert cleaner.sweep() == 1
+    assert os.path.exists(live) and os.path.exists(unclaimed)
+    assert not os.path.exists(orphan)
+    assert tmpdir.join('workspaces', '.trash').listdir() == []
+
+
+def test_remove_after_another_process_swept(tmpdir):
+    cleaner = new_cleaner(tmpdir)
+    cleaner.start()
+    try:
+        tmpdir.join('workspaces', '.trash').remove()
+        new_cleaner(tmpdir).sweep()
+        cleaner.remove(new_workspace(tmpdir, '1'))
+    finally:
+        cleaner.stop()
+    assert tmpdir.join('workspaces').listdir() == [tmpdir.join('workspaces', '.trash')]
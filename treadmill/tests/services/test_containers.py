@@ -0,0 +1,114 @@
+import os
+from unittest.mock import Mock
+
+import pytest
+
+from treadmill.config import TestConfig
+from treadmill.services import containers
+from treadmill.services.containers import ContainerPool, exec_streaming
+
+
+@pytest.fixture
+def config(tmpdir):
+    return TestConfig(HOST_WORKSPACE_ROOT=str(tmpdir.mkdir('workspaces')),
+                      CONTAINER_POOL_SIZE=1)
+
+
+@pytest.fixture
+def mounts(monkeypatch):
+    """Host mount commands run by the pool"""
+    commands = []
+
+    def run(args, **kwargs):
+        commands.append(list(args))
+        return Mock(returncode=0)
+    monkeypatch.setattr(containers.subprocess, 'run', run)
+    return commands
+
+
+def new_container(container_id):
+    container = Mock(id=container_id, status='running')
+    container.exec_run.return_value = Mock(exit_code=0)
+    return container
+
+
+@pytest.fixture
+def docker_client():
+    client = Mock()
+    client.containers.run.side_effect = [new_container(f'c{i}') for i in range(10)]
+    return client
+
+
+@pytest.mark.usefixtures('mounts')
+class TestContainerPool(object):
+    def test_lease_cold_starts_and_mounts_only_its_workspace(self, config, docker_client,
+                                                              mounts):
+        pool = ContainerPool(config, docker_client)
+        container = pool.lease(config.GCC_BUILDER_TAG, workspace_id='42')
+
+        assert container.id == 'c0'
+        docker_client.containers.run.assert_called_once()
+        args, kwargs = docker_client.containers.run.call_args
+        assert args == (config.GCC_BUILDER_TAG,)
+        (slot, volume), = kwargs['volumes'].items()
+        assert volume == {'bind': '/workspace', 'mode': 'rw,rslave'}
+        assert os.path.dirname(slot) == os.path.join(config.HOST_WORKSPACE_ROOT, '.pool')
+        assert os.listdir(slot) == []
+        assert mounts == [
+            ['mount', '--bind', os.path.join(config.HOST_WORKSPACE_ROOT, '42'), slot]
+        ]
+
+    def test_released_container_is_reused_after_reset(self, config, docker_client, mounts):
+        pool = ContainerPool(config, docker_client)
+        container = pool.lease(config.NATIVE_SANDBOX_TAG, privileged=True,
+                               workspace_id='1')
+        pool.release(container)
+        pool._recycle_dirty()
+
+        container.exec_run.assert_called_with([
+            '/bin/sh', '-c', 'isolate --cg --box-id=0 --cleanup'
+        ])
+        slot, = docker_client.containers.run.call_args[1]['volumes']
+        assert mounts[-1] == ['umount', slot]
+        assert pool.lease(config.NATIVE_SANDBOX_TAG, privileged=True,
+                          workspace_id='2') is container
+        assert docker_client.containers.run.call_count == 1
+
+    def test_failed_reset_evicts_container(self, config, docker_client):
+        pool = ContainerPool(config, docker_client)
+        container = pool.lease(config.NATIVE_SANDBOX_TAG, privileged=True,
+                               workspace_id='1')
+        container.exec_run.return_value = Mock(exit_code=1)
+        pool.release(container)
+        pool._recycle_dirty()
+
+        container.kill.assert_called_once()
+        assert os.listdir(os.path.join(config.HOST_WORKSPACE_ROOT, '.pool')) == []
+        assert pool.lease(config.GCC_BUILDER_TAG, workspace_id='2') is not container
+
+    def test_unhealthy_idle_container_is_evicted(self, config, docker_client):
+        pool = ContainerPool(config, docker_client)
+        container = pool.lease(config.GCC_BUILDER_TAG, workspace_id='1')
+        pool.release(container)
+        pool._recycle_dirty()
+
+        container.status = 'exited'
+        pool._evict_unhealthy()
+
+        container.kill.assert_called_once()
+        assert pool.lease(config.GCC_BUILDER_TAG, workspace_id='2') is not container
+
+
+def test_exec_streaming_reports_chunks_and_exit_code():
+    container = Mock(id='c0')
+    api = container.client.api
+    api.exec_create.return_value = {'Id': 'e0'}
+    api.exec_start.return_value = iter([b'foo', b'bar'])
+    api.exec_inspect.return_value = {'ExitCode': 3}
+
+    chunks = []
+    exit_code = exec_streaming(container, ['ls'], chunks.append, privileged=True)
+
+    assert exit_code == 3
+    assert chunks == [b'foo', b'bar']
+    api.exec_create.assert_called_once_with('c0', ['ls'], privileged=True)
@@ -0,0 +1,60 @@
+import multiprocessing
+import threading
+
+from treadmill.config import TestConfig
+from treadmill.services.cpus import CpuAllocator
+
+
+def new_allocator(tmpdir):
+    return CpuAllocator(TestConfig(SANDBOX_CPUS=[2, 3, 4, 5], BUILDER_CPUS=[0, 1],
+                                   CPU_LOCK_DIR=str(tmpdir.join('cpus'))))
+
+
+def test_sandbox_cpusets_are_exclusive(tmpdir):
+    allocator = new_allocator(tmpdir)
+
+    first = allocator.allocate(3)
+    assert first.cpus == [2, 3, 4]
+    assert first.cpuset_cpus == '2,3,4'
+    assert allocator.builder_cpuset().cpus == [0, 1]
+
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(allocator.allocate(2)))
+    waiter.start()
+    waiter.join(0.2)
+    assert not acquired
+
+    allocator.release(first)
+    waiter.join()
+    assert acquired[0].cpus == [2, 3]
+
+
+def _hold_cpus(tmpdir, count, leased, release):
+    allocator = new_allocator(tmpdir)
+    cpuset = allocator.allocate(count)
+    leased.send(cpuset.cpus)
+    release.wait()
+    allocator.release(cpuset)
+
+
+def test_sandbox_cpusets_are_exclusive_across_processes(tmpdir):
+    leased, child_end = multiprocessing.Pipe()
+    release = multiprocessing.Event()
+    holder = multiprocessing.Process(target=_hold_cpus, args=(tmpdir, 3, child_end, release))
+    holder.start()
+    try:
+        assert leased.recv() == [2, 3, 4]
+
+        allocator = new_allocator(tmpdir)
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(allocator.allocate(2)))
+        waiter.start()
+        waiter.join(0.2)
+        assert not acquired
+
+        release.set()
+        waiter.join()
+        assert acquired[0].cpus == [2, 3]
+    finally:
+        release.set()
+        holder.join()
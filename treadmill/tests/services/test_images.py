@@ -0,0 +1,60 @@
+from unittest.mock import Mock
+
+import docker
+import pytest
+
+from treadmill.config import TestConfig
+from treadmill.services.images import ImageRegistry
+
+
+@pytest.fixture
+def config(tmpdir):
+    return TestConfig(IMAGE_REFRESH_INTERVAL=3600,
+                      IMAGE_REFRESH_LOCK_FILE=str(tmpdir.join('images.lock')))
+
+
+def test_prepare_pulls_only_missing_images(config):
+    present = {config.GCC_BUILDER_TAG, config.NATIVE_SANDBOX_TAG}
+    docker_client = Mock()
+
+    def get_image(tag):
+        if tag not in present:
+            raise docker.errors.ImageNotFound(tag)
+        return Mock(id=f'sha256:{tag}')
+
+    docker_client.images.get.side_effect = get_image
+    docker_client.images.pull.side_effect = (
+        lambda repository, tag: Mock(id=f'sha256:pulled:{repository}:{tag}')
+    )
+
+    registry = ImageRegistry(config, docker_client)
+    registry.prepare()
+
+    assert registry.digest(config.GCC_BUILDER_TAG) == f'sha256:{config.GCC_BUILDER_TAG}'
+    assert registry.digest(config.JRE_SANDBOX_TAG) == f'sha256:pulled:{config.JRE_SANDBOX_TAG}'
+    pulled = {call[0][0] + ':' + call[1]['tag']
+              for call in docker_client.images.pull.call_args_list}
+    assert pulled == set(registry.tags) - present
+
+
+def test_prepare_fails_when_pull_fails(config):
+    docker_client = Mock()
+    docker_client.images.get.side_effect = docker.errors.ImageNotFound('missing')
+    docker_client.images.pull.side_effect = docker.errors.APIError('denied')
+
+    with pytest.raises(docker.errors.APIError):
+        ImageRegistry(config, docker_client).prepare()
+
+
+def test_refresh_pulls_once_per_host(config):
+    docker_client = Mock()
+    docker_client.images.get.side_effect = lambda tag: Mock(id=f'sha256:{tag}')
+    docker_client.images.pull.side_effect = lambda repository, tag: Mock(id='sha256:new')
+
+    registries = [ImageRegistry(config, docker_client) for _ in range(2)]
+    for registry in registries:
+        registry.refresh_once_per_host()
+
+    assert docker_client.images.pull.call_count == len(registries[0].tags)
+    assert docker_client.images.get.call_count == len(registries[0].tags)
+    assert registries[0].digest(config.GCC_BUILDER_TAG) == 'sha256:new'
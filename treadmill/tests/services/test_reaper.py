@@ -0,0 +1,37 @@
+import os
+from unittest.mock import Mock
+
+from treadmill.config import TestConfig
+from treadmill.services.reaper import ContainerReaper, worker_labels
+
+
+def new_container(container_id, labels):
+    return Mock(id=container_id, labels=labels)
+
+
+def test_reaped_containers_are_killed_in_background():
+    reaper = ContainerReaper(TestConfig(), Mock())
+    reaper.start()
+    containers = [new_container(f'c{i}', {}) for i in range(3)]
+    for container in containers:
+        reaper.reap(container)
+    reaper.stop()
+
+    for container in containers:
+        container.kill.assert_called_once()
+
+
+def test_sweep_kills_only_containers_of_dead_workers():
+    dead_pid = 2 ** 22 + 1  # Above the default pid_max
+    alive = new_container('alive', worker_labels(request_id=1))
+    orphan = new_container('orphan', {
+        **worker_labels(request_id=2),
+        'treadmill.pid': str(dead_pid)
+    })
+    docker_client = Mock()
+    docker_client.containers.list.return_value = [alive, orphan]
+
+    assert ContainerReaper(TestConfig(), docker_client).sweep() == 1
+    orphan.kill.assert_called_once()
+    alive.kill.assert_not_called()
+    assert alive.labels['treadmill.pid'] == str(os.getpid())
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+from treadmill.config import TestConfig
+from treadmill.services.fetchers import S3fsFetcher
+from treadmill.services.testdata import TestDataCache
+
+
+@pytest.fixture
+def s3fs_root(tmpdir):
+    root = tmpdir.mkdir('s3fs')
+    for name in ('a.in', 'b.in', 'c.in'):
+        root.join(name).write(name * 100)
+    return str(root)
+
+
+def new_cache(tmpdir, s3fs_root, max_bytes=1024):
+    config = TestConfig(
+        S3FS_ROOT=s3fs_root,
+        TESTDATA_CACHE_ROOT=str(tmpdir.join('cache')),
+        TESTDATA_CACHE_MAX_BYTES=max_bytes
+    )
+    return TestDataCache(config, S3fsFetcher(config))
+
+
+def test_second_request_links_cached_file(tmpdir, s3fs_root):
+    cache = new_cache(tmpdir, s3fs_root)
+    first, second = str(tmpdir.join('1', 'a.in')), str(tmpdir.join('2', 'a.in'))
+    cache.link('a.in', 'v1', first)
+    cache.link('a.in', 'v1', second)
+
+    assert open(second).read() == 'a.in' * 100
+    assert os.stat(first).st_ino == os.stat(second).st_ino
+    assert os.stat(second).st_mode & 0o777 == 0o444
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+
+    cache.link('a.in', 'v2', str(tmpdir.join('3', 'a.in')))
+    assert cache.stats.misses == 2
+
+
+def test_least_recently_used_entry_is_evicted(tmpdir, s3fs_root):
+    cache = new_cache(tmpdir, s3fs_root, max_bytes=1000)
+    cache.link('a.in', 'v1', str(tmpdir.join('1', 'a.in')))
+    cache.link('b.in', 'v1', str(tmpdir.join('1', 'b.in')))
+    cache.link('a.in', 'v1', str(tmpdir.join('2', 'a.in')))
+    cache.link('c.in', 'v1', str(tmpdir.join('2', 'c.in')))
+
+    assert cache.stats.evictions == 1
+    assert cache.stats.size_bytes == 800
+    cache.link('a.in', 'v1', str(tmpdir.join('3', 'a.in')))
+    assert cache.stats.hits == 2
+    # Workspaces keep evicted data
+    assert open(str(tmpdir.join('1', 'b.in'))).read() == 'b.in' * 100
+
+
+def test_pinned_entry_is_not_evicted(tmpdir, s3fs_root):
+    cache = new_cache(tmpdir, s3fs_root, max_bytes=500)
+    a_path = cache.pin('a.in', 'v1', owner=1)
+    cache.pin('a.in', 'v1', owner=1)
+    cache.link('b.in', 'v1', str(tmpdir.join('1', 'b.in')))
+    cache.link('c.in', 'v1', str(tmpdir.join('1', 'c.in')))
+
+    assert os.path.exists(a_path)
+    assert cache.stats.evictions == 1  # b.in
+
+    cache.unpin(1)
+    cache.link('b.in', 'v1', str(tmpdir.join('2', 'b.in')))
+    assert not os.path.exists(a_path)
+
+
+def test_eviction_counts_entries_of_every_process(tmpdir, s3fs_root):
+    # Worker processes sharing the cache root, each fetching its own entries
+    first = new_cache(tmpdir, s3fs_root, max_bytes=1000)
+    second = new_cache(tmpdir, s3fs_root, max_bytes=1000)
+    a_path = first.entry_path('a.in', 'v1')
+    first.link('a.in', 'v1', str(tmpdir.join('1', 'a.in')))
+    second.link('b.in', 'v1', str(tmpdir.join('2', 'b.in')))
+    second.link('c.in', 'v1', str(tmpdir.join('2', 'c.in')))
+
+    assert not os.path.exists(a_path)
+    assert (second.stats.evictions, second.stats.size_bytes) == (1, 800)
+
+
+def test_link_replaces_staged_file(tmpdir, s3fs_root):
+    cache = new_cache(tmpdir, s3fs_root)
+    dest = str(tmpdir.join('1', 'a.in'))
+    cache.link('a.in', 'v1', dest)
+    cache.link('a.in', 'v1', dest)  # Staged again, e.g. after a cancel
+    assert open(dest).read() == 'a.in' * 100
+    assert os.listdir(str(tmpdir.join('1'))) == ['a.in']
+
+
+def test_refetch_when_unchanged_entry_was_evicted(tmpdir, s3fs_root):
+    cache = new_cache(tmpdir, s3fs_root)
+    v1_path = cache.entry_path('a.in', 'v1')
+
+    class EvictingFetcher(S3fsFetcher):
+        """Reports the object unchanged after another process evicted its entry"""
+
+        def fetch(self, key, dest_path, etag=None):
+            if etag:
+                os.unlink(v1_path)
+                return False, etag
+            super().fetch(key, dest_path)
+            return True, 'etag'
+
+    fetcher = EvictingFetcher(TestConfig(S3FS_ROOT=s3fs_root))
+    cache.link('a.in', 'v1', str(tmpdir.join('1', 'a.in')), fetcher=fetcher)
+    cache.link('a.in', 'v2', str(tmpdir.join('2', 'a.in')), fetcher=fetcher)
+    assert open(str(tmpdir.join('2', 'a.in'))).read() == 'a.in' * 100
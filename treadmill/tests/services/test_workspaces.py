@@ -0,0 +1,49 @@
+import os
+
+from treadmill.config import TestConfig
+from treadmill.services.workspaces import TmpfsWorkspaces
+
+
+def test_workspaces_spill_to_disk_beyond_budget(tmpdir):
+    workspaces = TmpfsWorkspaces(TestConfig(
+        TMPFS_WORKSPACE_ROOT=str(tmpdir.join('tmpfs')),
+        TMPFS_WORKSPACE_BUDGET_BYTES=1000
+    ))
+    first = workspaces.allocate(1, estimate=400)
+    assert os.path.isdir(first)
+
+    # Charged by live bytes once they exceed the estimate
+    with open(os.path.join(first, 'stdout'), 'wb') as f:
+        f.write(b'x' * 700)
+    assert workspaces.account(1) == 700
+    assert workspaces.allocate(2, estimate=400) is None
+    assert workspaces.stats.spills == 1
+
+    workspaces.release(1)
+    assert not os.path.exists(first)
+    assert workspaces.allocate(2, estimate=400) is not None
+    assert workspaces.used_bytes == 400
+
+
+def test_workspace_outgrowing_budget_is_exhausted(tmpdir):
+    config = TestConfig(
+        TMPFS_WORKSPACE_ROOT=str(tmpdir.join('tmpfs')),
+        TMPFS_WORKSPACE_BUDGET_BYTES=1000,
+        TMPFS_TESTCASE_ALLOWANCE_BYTES=0
+    )
+    # Worker processes of a host share the ledger on the tmpfs
+    first, second = TmpfsWorkspaces(config), TmpfsWorkspaces(config)
+    first.allocate(1, estimate=400)
+    assert second.allocate(2, estimate=700) is None
+    second_path = second.allocate(2, estimate=400)
+
+    with open(os.path.join(second_path, 'stdout'), 'wb') as f:
+        f.write(b'x' * 700)
+    assert second.account(2) == 700
+    assert second.exhausted(2)
+    assert not first.exhausted(1)
+
+    # Retried on disk
+    second.release(2)
+    assert second.allocate(2, estimate=400) is None
+    assert second.allocate(2, estimate=400) is not None
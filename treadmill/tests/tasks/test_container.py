@@ -1,3 +1,4 @@
+from datetime import datetime
 from unittest.mock import Mock
 
 import pytest
@@ -333,3 +334,68 @@ class TestSandboxEnviron(ContextMixin):
 
         exec_result = Mock(exit_code=0)
         util.assert_finished(exec_steps, send=exec_result)
+
+    def test_isolated_sandbox_initializes_every_box(self, monkeypatch):
+        monkeypatch.setattr(self.context.config, 'ISOLATE_BOX_COUNT', 2)
+        sandbox_env = util.Wrap(SandboxEnviron(lang=Lang.CPP, isolated=True))
+        setup_steps = sandbox_env.setup()
+        setup_steps.send(None)
+
+        container = Mock()
+        util.assert_props(setup_steps.send(container), ops.ExecInDockerContainerOp,
+                          container=container,
+                          cmd=['isolate', '--cg', '--box-id=0', '--init', '&&',
+                               'isolate', '--cg', '--box-id=1', '--init'])
+        util.assert_finished(setup_steps, send=Mock(exit_code=0))
+
+        with sandbox_env.lease_box() as first_box:
+            with sandbox_env.lease_box() as second_box:
+                assert (first_box, second_box) == (0, 1)
+        with sandbox_env.lease_box() as box_id:
+            assert box_id == 0
+
+    def test_parse_batch_records(self):
+        output = (
+            'some isolate noise\n'
+            '@@treadmill:0\t0\tda39a3ee\ttime:0.010\x1fmax-rss:548\x1f\tOK\n'
+            '@@treadmill:1\t1\tda39a3ee\tstatus:TO\x1fmessage:Time limit exceeded\x1f'
+            '\tTime limit exceeded\x1f\n'
+        )
+        records = SandboxEnviron._parse_batch_records(output)
+
+        assert records == {
+            '0': (0, 'da39a3ee', 'time:0.010\nmax-rss:548\n', 'OK'),
+            '1': (1, 'da39a3ee', 'status:TO\nmessage:Time limit exceeded\n',
+                  'Time limit exceeded\n')
+        }
+
+
+def test_isolate_cannot_see_shared_test_outputs(tmpdir):
+    factory = JudgeContextFactory(TestConfig(
+        HOST_WORKSPACE_ROOT=str(tmpdir.mkdir('workspaces')),
+        TESTDATA_CACHE_ROOT=str(tmpdir.mkdir('cache')),
+        SHARED_TESTDATA=True
+    ))
+    with factory.new(Mock(id=1)) as context:
+        context.judge_spec = Mock(updated_at=datetime(2018, 1, 1))
+        testset, testcase = Mock(id=1), Mock(input_file='1/1.in', output_file='1/1.out')
+        output_file = path.test_output_file(testset, testcase)
+        assert isinstance(output_file, path.SharedTestDataFile)
+        assert output_file.sandbox_path is None
+
+        sandbox = SandboxEnviron(lang=Lang.CPP, isolated=True)
+        cmd = sandbox._isolate_cmd(
+            box_id=0,
+            bin_file='/sandbox/main',
+            stdin_file=path.test_input_file(testset, testcase).sandbox_path,
+            stdout_file='/sandbox/out',
+            stderr_file='/sandbox/err',
+            meta_file='/workspace/meta',
+            limits=Mock(pid_limits=1, mem_limit_bytes=1024, time_limit_seconds=1,
+                        file_size_limit_kilos=0)
+        )
+        mapped = [opt[len('--dir='):].split(':')[0].split('=')[-1]
+                  for opt in cmd if opt.startswith('--dir=')]
+        assert mapped == [path.SANDBOX_ROOT.container_path]
+        assert not any(output_file.container_path.startswith(dir_out) for dir_out in mapped)
+        assert '--stdin=/sandbox/data/1/1.in' in cmd
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+from unittest.mock import Mock
+
+import pytest
+from docker.models.containers import ExecResult
+
+from treadmill.config import TestConfig
+from treadmill.context import JudgeContextFactory
+from treadmill.tasks import grader, ops, path
+from treadmill.tasks.base import Task
+from treadmill.tasks.grader import PersistentGraderEnviron, PersistentGraderError
+
+
+GRADER_SRC = '''
+import os, sys, time
+for line in sys.stdin:
+    line = line.replace('/workspace', os.environ['WORKSPACE'])
+    input_file, output_file, solution_file = line.rstrip('\\n').split('\\t')
+    if open(input_file).read() == 'hang':
+        time.sleep(10)
+    print(int(open(output_file).read() == open(solution_file).read()), flush=True)
+'''
+
+
+class FakeExecOp(Task):
+    """Runs the command on the host, with the workspace at its host path in $WORKSPACE"""
+
+    def __init__(self, container, cmd, privileged=False):
+        self.cmd = cmd
+
+    def _run(self):
+        workspace = path.ROOT.host_path.rstrip('/')
+        cmd = ' '.join(self.cmd).replace(path.AFP.container_root, workspace)
+        env = dict(os.environ, WORKSPACE=workspace)
+        return ExecResult(subprocess.call(['/bin/sh', '-c', cmd], env=env), b'')
+
+
+@pytest.fixture
+def context(tmpdir, monkeypatch):
+    monkeypatch.setattr(grader.ops, 'ExecInDockerContainerOp', FakeExecOp)
+    factory = JudgeContextFactory(TestConfig(
+        HOST_WORKSPACE_ROOT=str(tmpdir.mkdir('workspaces')),
+        GRADER_CALL_TIMEOUT_SECONDS=1
+    ))
+    with factory.new(Mock(id=1)) as context:
+        ops.CreateWorkspaceOp().run()
+        yield context
+
+
+def write_file(name, content):
+    afp = path.AFP(path=[name])
+    ops.WriteFileOp(afp, content).run()
+    return afp
+
+
+def new_grader_environ():
+    bin_file = write_file('grader.py', GRADER_SRC)
+    sandbox = Mock(lang=Mock(profile=Mock(
+        get_exec_cmd=lambda bin_file, args: [sys.executable, bin_file, *args]
+    )))
+    return PersistentGraderEnviron(sandbox=sandbox, bin_file=bin_file)
+
+
+def test_grade_over_pipes(context):
+    files = dict(testcase_input_file=write_file('1.in', '1 2'),
+                 solution_file=write_file('1.out', '3'))
+    with new_grader_environ() as environ:
+        assert context.persistent_grader is environ
+        assert environ.grade(testcase_output_file=write_file('a.out', '3'), **files)
+        assert not environ.grade(testcase_output_file=write_file('b.out', '4'), **files)
+    assert context.persistent_grader is None
+
+
+def test_break_on_timeout(context):
+    with new_grader_environ() as environ:
+        with pytest.raises(PersistentGraderError):
+            environ.grade(testcase_input_file=write_file('1.in', 'hang'),
+                          testcase_output_file=write_file('a.out', '3'),
+                          solution_file=write_file('1.out', '3'))
+        assert environ.broken
+        with pytest.raises(PersistentGraderError):
+            environ.grade(testcase_input_file=write_file('2.in', '1 2'),
+                          testcase_output_file=write_file('a.out', '3'),
+                          solution_file=write_file('1.out', '3'))
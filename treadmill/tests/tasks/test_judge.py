@@ -0,0 +1,96 @@
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from treadmill.config import TestConfig
+from treadmill.context import JudgeContextFactory
+from treadmill.models import TestCaseJudgeStatus
+from treadmill.signal import WrongAnswer
+from treadmill.tasks import judge, ops
+from treadmill.tasks.base import Task
+from treadmill.tasks.judge import JudgeTask
+
+
+@pytest.fixture
+def context():
+    factory = JudgeContextFactory(TestConfig(TESTCASE_PARALLELISM=3))
+    with factory.new(None) as context:
+        yield context
+
+
+class FakeJudgeTestCaseTask(Task):
+    started = []
+
+    def __init__(self, *, testcase, **kwargs):
+        self.testcase = testcase
+
+    def _run(self):
+        self.started.append(self.testcase.id)
+        time.sleep(self.testcase.delay)
+        if self.testcase.wrong:
+            raise WrongAnswer(self.testcase.message)
+        return Mock(cg_mem=1024, time=0.1)
+
+
+@pytest.fixture
+def fake_testcase_task(monkeypatch):
+    FakeJudgeTestCaseTask.started = []
+    monkeypatch.setattr(judge, 'JudgeTestCaseTask', FakeJudgeTestCaseTask)
+
+
+def new_testcase(testcase_id, delay=0.0, wrong=False, message=None):
+    return Mock(id=testcase_id, delay=delay, wrong=wrong, message=message)
+
+
+@pytest.mark.usefixtures('context', 'fake_testcase_task')
+class TestJudgeTask(object):
+    def run_testset(self, testset):
+        task = JudgeTask(subm_sandbox=Mock(boxes=Mock(size=3)), grader_sandbox=None)
+        steps = task._judge_testset(testset)
+        reported, self.errors = [], []
+        try:
+            op = steps.send(None)
+            while True:
+                assert isinstance(op, ops.UpdateJudgeResultOp)
+                reported.append((op.testcase_id, op.testcase_status))
+                self.errors.append(op.error)
+                op = steps.send(None)
+        except StopIteration as end:
+            return end.value, reported
+
+    def test_concurrent_results_are_reported_in_order(self):
+        testset = Mock(id=0, score=10, testcases=[
+            new_testcase(0, delay=0.2),
+            new_testcase(1, delay=0.1),
+            new_testcase(2)
+        ])
+        score, reported = self.run_testset(testset)
+
+        assert score == 10
+        assert reported == [
+            (0, TestCaseJudgeStatus.PASSED),
+            (1, TestCaseJudgeStatus.PASSED),
+            (2, TestCaseJudgeStatus.PASSED)
+        ]
+
+    def test_first_failure_cancels_remaining_testcases(self):
+        testset = Mock(id=0, score=10, testcases=[
+            new_testcase(0, wrong=True),
+            new_testcase(1, delay=0.2),
+            new_testcase(2, delay=0.2),
+            *[new_testcase(i, delay=0.1) for i in range(3, 10)]
+        ])
+        score, reported = self.run_testset(testset)
+
+        assert score == 0
+        assert reported == [(0, TestCaseJudgeStatus.WRONG_ANSWER)]
+        assert len(FakeJudgeTestCaseTask.started) < 10
+
+    def test_wrong_answer_reports_where_output_differs(self):
+        message = 'Output differs at line 3 (byte 10)'
+        testset = Mock(id=0, score=10, testcases=[new_testcase(0, wrong=True, message=message)])
+        _, reported = self.run_testset(testset)
+
+        assert reported == [(0, TestCaseJudgeStatus.WRONG_ANSWER)]
+        assert self.errors == [message]
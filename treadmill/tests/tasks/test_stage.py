@@ -0,0 +1,162 @@
+import os
+import sys
+from contextlib import contextmanager
+from unittest.mock import Mock
+
+import pytest
+
+from treadmill.config import TestConfig
+from treadmill.context import JudgeContextFactory
+from treadmill.langs import Python36, python3
+from treadmill.signal import SubmissionCompileError
+from treadmill.tasks import ops, path, stage
+from treadmill.tasks.base import Task
+from treadmill.tasks.container import CompileTask
+
+
+class FakeCompileTask(Task):
+    """Compiles `ok` sources into a binary and an inner class file, fails others"""
+
+    Result = CompileTask.Result
+    calls = 0
+
+    def __init__(self, builder, src_file, out_file):
+        self.src_file = src_file
+        self.out_file = out_file
+
+    def _run(self):
+        FakeCompileTask.calls += 1
+        source = yield ops.ReadFileOp(self.src_file)
+        if source != 'ok':
+            return self.Result(exit_code=1, output='syntax error')
+        yield ops.WriteFileOp(self.out_file, 'binary', mode=0o755)
+        build_dir = os.path.dirname(self.out_file.host_path)
+        with open(os.path.join(build_dir, 'Main$Inner.class'), 'w') as f:
+            f.write('inner')
+        return self.Result(exit_code=0, output='')
+
+
+@contextmanager
+def fake_builder_environ(lang):
+    yield Mock()
+
+
+@pytest.fixture
+def factory(tmpdir, monkeypatch):
+    monkeypatch.setattr(stage, 'CompileTask', FakeCompileTask)
+    monkeypatch.setattr(stage, 'BuilderEnviron', fake_builder_environ)
+    FakeCompileTask.calls = 0
+    factory = JudgeContextFactory(TestConfig(
+        HOST_WORKSPACE_ROOT=str(tmpdir.mkdir('workspaces')),
+        ARTIFACT_CACHE_ROOT=str(tmpdir.join('artifacts')),
+        PY3_HOST_PYTHON=sys.executable
+    ))
+    factory.image_registry = Mock(digest=lambda tag: 'sha256:0123')
+    return factory
+
+
+JAVA = Mock(profile=Mock(
+    version='1', need_compile=True, src_file_name='Main.java', bin_file_name='Main',
+    get_compile_cmd=lambda src, out: ['javac', src],
+    compile_on_host=lambda config, src, display_src: None
+))
+
+PYTHON3 = Mock(profile=Python36.instance())
+
+
+def compile_subm(factory, request_id, source, lang=JAVA):
+    with factory.new(Mock(id=request_id)) as context:
+        context.subm_lang = lang
+        context.submission = Mock(src_file=f'1/{lang.profile.src_file_name}')
+        ops.CreateWorkspaceOp().run()
+        ops.WriteFileOp(path.subm_src_file(), source).run()
+        try:
+            stage.CompileStage().run()
+            return ops.ListDirectoryOp(path.AFP(path=['subm'])).run()
+        finally:
+            ops.RemoveWorkspaceOp().run()
+
+
+def compile_grader(factory, request_id):
+    with factory.new(Mock(id=request_id)) as context:
+        context.subm_lang = Mock(profile=Mock(need_compile=False))
+        context.grader_lang = JAVA
+        context.grader = Mock(src_file='1/Main.java')
+        ops.CreateWorkspaceOp().run()
+        ops.WriteFileOp(path.grader_src_file(), 'ok').run()
+        try:
+            stage.CompileStage().run()
+            return ops.ListDirectoryOp(path.AFP(path=['grader'])).run()
+        finally:
+            ops.RemoveWorkspaceOp().run()
+
+
+def test_reuse_grader_build(factory):
+    built = compile_grader(factory, 1)
+    assert compile_grader(factory, 2) == built == ['Main', 'Main$Inner.class', 'Main.java']
+    assert FakeCompileTask.calls == 1
+
+
+def test_reuse_submission_build(factory):
+    built = compile_subm(factory, 1, 'ok')
+    assert compile_subm(factory, 2, 'ok') == built
+    assert 'Main$Inner.class' in built
+    assert FakeCompileTask.calls == 1
+
+
+def test_replay_compile_error(factory):
+    for request_id in (1, 2):
+        with pytest.raises(SubmissionCompileError) as e:
+            compile_subm(factory, request_id, 'error')
+        assert 'syntax error' in str(e.value)
+    assert FakeCompileTask.calls == 1
+
+
+@pytest.fixture
+def host_python(monkeypatch):
+    """Takes the test interpreter for Python 3.6, as a worker would at startup"""
+    monkeypatch.setattr(python3, '_host_pythons', {})
+
+    def host_python(executable=sys.executable):
+        python3._host_pythons[executable] = True
+        return executable
+    return host_python
+
+
+def test_check_python_on_host(factory, host_python):
+    host_python()
+    compile_subm(factory, 1, 'print(1)\n', lang=PYTHON3)
+    with pytest.raises(SubmissionCompileError) as e:
+        compile_subm(factory, 2, 'print(1\n', lang=PYTHON3)
+    assert '/sandbox/subm/main.py", line 1' in str(e.value)
+    assert FakeCompileTask.calls == 0
+
+
+def test_check_python_in_builder_without_python36(factory, host_python):
+    assert Python36.instance().host_python(factory.config) is None
+    compile_subm(factory, 1, 'ok', lang=PYTHON3)
+    assert FakeCompileTask.calls == 1
+
+
+def failing_python(tmpdir, script):
+    executable = tmpdir.join('python3.6')
+    executable.write(f'#!/bin/sh\n{script}\n')
+    executable.chmod(0o755)
+    return str(executable)
+
+
+@pytest.mark.parametrize('script', ['kill -SEGV $$', 'sleep 5'])
+def test_check_python_in_builder_when_host_python_fails(factory, host_python, tmpdir, script):
+    factory.config.PY3_HOST_PYTHON = host_python(failing_python(tmpdir, script))
+    factory.config.PY3_HOST_COMPILE_TIMEOUT_SECONDS = 0.2
+    compile_subm(factory, 1, 'ok', lang=PYTHON3)
+    assert FakeCompileTask.calls == 1
+
+
+def test_check_python_in_subprocess_on_python36(factory, tmpdir, monkeypatch):
+    monkeypatch.setattr(python3, 'sys', Mock(version_info=(3, 6, 5),
+                                             executable=failing_python(tmpdir, 'sleep 5')))
+    factory.config.PY3_HOST_PYTHON = None
+    factory.config.PY3_HOST_COMPILE_TIMEOUT_SECONDS = 0.2
+    compile_subm(factory, 1, 'ok', lang=PYTHON3)
+    assert FakeCompileTask.calls == 1
@@ -0,0 +1,155 @@
+import os
+from concurrent.futures import Future
+from unittest.mock import Mock
+
+import pytest
+
+from treadmill.bundle import write_bundle
+from treadmill.config import TestConfig
+from treadmill.context import JudgeContextFactory
+from treadmill.services import TmpfsWorkspaces
+from treadmill.tasks import ops, path
+from treadmill.tasks.workspace import StageTestDataTask, TestDataStager
+
+
+@pytest.fixture
+def context(tmpdir):
+    s3fs_root = tmpdir.mkdir('s3fs')
+    for i in range(10):
+        s3fs_root.join(f'{i}.in').write('x' * i)
+    factory = JudgeContextFactory(TestConfig(
+        HOST_WORKSPACE_ROOT=str(tmpdir.mkdir('workspaces')),
+        S3FS_ROOT=str(s3fs_root),
+        STAGING_CONCURRENCY=4
+    ))
+    with factory.new(Mock(id=1)) as context:
+        context.judge_spec = Mock(updated_at=None)
+        yield context
+
+
+def new_testset(testcase_ids):
+    return Mock(id=0, testcases=[
+        Mock(id=i, input_file=f'{i}.in', output_file=f'{9 - i}.in')
+        for i in testcase_ids
+    ])
+
+
+def test_stage_every_testset(context):
+    testset = new_testset(range(5))
+    context.judge_spec.testsets = [testset]
+    context.testdata_stager = stager = TestDataStager()
+    try:
+        # Input i and output 9 - i are i and 9 - i bytes long
+        assert StageTestDataTask().run() == 5 * 9
+    finally:
+        stager.shutdown()
+    for testcase in testset.testcases:
+        assert os.path.exists(path.test_input_file(testset, testcase).host_path)
+
+
+def test_staging_fails_on_missing_file(context):
+    testset = new_testset(range(5))
+    testset.testcases[2].input_file = 'missing.in'
+    context.judge_spec.testsets = [testset]
+    context.testdata_stager = stager = TestDataStager()
+    try:
+        with pytest.raises(FileNotFoundError):
+            StageTestDataTask().run()
+    finally:
+        stager.shutdown()
+
+
+def test_stager_stages_on_demand_and_cancels_testset(context):
+    testset = new_testset(range(5))
+    testcases = testset.testcases
+    stager = TestDataStager()
+    try:
+        stager.stage(testset, testcases[0])
+        assert os.path.exists(path.test_input_file(testset, testcases[0]).host_path)
+        assert not os.path.exists(path.test_input_file(testset, testcases[1]).host_path)
+
+        stager.prefetch(testset, testcases[1:])
+        stager.cancel(testset)
+        stager.stage(testset, testcases[4])  # Staged again despite the cancel
+        assert os.path.exists(path.test_output_file(testset, testcases[4]).host_path)
+    finally:
+        stager.shutdown()
+
+
+def test_workspace_on_tmpfs_is_linked_from_workspace_root(context, tmpdir):
+    context.tmpfs_workspaces = TmpfsWorkspaces(TestConfig(
+        TMPFS_WORKSPACE_ROOT=str(tmpdir.join('tmpfs')),
+        TMPFS_WORKSPACE_BUDGET_BYTES=1000
+    ))
+    assert ops.CreateWorkspaceOp(estimate=100).run()
+    afp = path.AFP(path=['subm', 'main.cpp'])
+    ops.WriteFileOp(afp, 'int main() {}').run()
+    assert os.path.exists(tmpdir.join('tmpfs', '1', 'sandbox', 'subm', 'main.cpp'))
+
+    ops.RemoveWorkspaceOp().run()
+    assert not os.path.lexists(os.path.normpath(path.ROOT.host_path))
+    assert not os.path.exists(tmpdir.join('tmpfs', '1'))
+    assert context.tmpfs_workspaces.used_bytes == 0
+
+
+def test_stage_from_bundle(context, tmpdir):
+    s3fs_root = tmpdir.join('s3fs')
+    write_bundle({'0.in': str(s3fs_root.join('0.in')), '9.in': str(s3fs_root.join('9.in'))},
+                 str(s3fs_root.join('testdata.bundle')))
+    s3fs_root.join('9.in').remove()  # Only the bundle has it
+    context.judge_spec.bundle = 'testdata.bundle'
+
+    context.testdata_bundle = bundle = ops.OpenBundleOp(path.test_data_bundle_file()).run()
+    try:
+        testset = new_testset([0])
+        ops.StageFileOp(path.test_output_file(testset, testset.testcases[0])).run()
+        assert open(path.test_output_file(testset, testset.testcases[0]).host_path).read() == 'x' * 9
+    finally:
+        bundle.close()
+
+
+def test_skip_expected_outputs_verified_by_digest(context):
+    testset = new_testset(range(2))
+    testset.testcases[0].output_digest = 'digest'
+    testset.testcases[0].output_length = 9
+    testset.testcases[1].output_digest = None
+    context.judge_spec.checker = None
+    stager = TestDataStager()
+    try:
+        for testcase in testset.testcases:
+            stager.stage(testset, testcase)
+    finally:
+        stager.shutdown()
+    assert not os.path.exists(path.test_output_file(testset, testset.testcases[0]).host_path)
+    assert os.path.exists(path.test_output_file(testset, testset.testcases[1]).host_path)
+
+
+def test_stager_restages_cancelled_files_only(context):
+    testset = new_testset([0])
+    testcase = testset.testcases[0]
+    stager = TestDataStager()
+    try:
+        input_future, _ = stager.prefetch(testset, [testcase])
+        input_future.result()
+        cancelled = Future()
+        cancelled.cancel()
+        stager._futures[(testset.id, testcase.id)][1] = cancelled  # Cancelled before it ran
+
+        futures = stager.prefetch(testset, [testcase])
+        assert futures[0] is input_future
+        assert futures[1] is not cancelled
+        stager.stage(testset, testcase)
+    finally:
+        stager.shutdown()
+    assert os.path.exists(path.test_output_file(testset, testcase).host_path)
+
+
+def test_missing_or_corrupt_bundle_is_skipped(context, tmpdir):
+    tmpdir.join('s3fs', 'corrupt.bundle').write('not a bundle')
+    for bundle_key in ('missing.bundle', 'corrupt.bundle'):
+        context.judge_spec.bundle = bundle_key
+        assert ops.OpenBundleOp(path.test_data_bundle_file()).run() is None
+
+    testset = new_testset([0])
+    ops.StageFileOp(path.test_input_file(testset, testset.testcases[0])).run()
+    assert os.path.exists(path.test_input_file(testset, testset.testcases[0]).host_path)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from treadmill.bundle import Bundle, BundleError, write_bundle
+
+
+@pytest.fixture
+def bundle_path(tmpdir):
+    tmpdir.join('small.in').write('1 2\n')
+    tmpdir.join('large.out').write('0123456789\n' * 10000)
+    tmpdir.join('random.in').write_binary(os.urandom(1000))
+    files = {f'testdata/{name}': str(tmpdir.join(name))
+             for name in ('small.in', 'large.out', 'random.in')}
+    bundle_path = str(tmpdir.join('testdata.bundle'))
+    write_bundle(files, bundle_path)
+    return bundle_path
+
+
+def test_extract_members(bundle_path, tmpdir):
+    bundle = Bundle(bundle_path)
+    try:
+        assert 'testdata/small.in' in bundle
+        assert 'testdata/missing.in' not in bundle
+        for name in ('small.in', 'large.out', 'random.in'):
+            dest_path = str(tmpdir.join('extracted', name))
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            assert bundle.fetch(f'testdata/{name}', dest_path) == (True, None)
+            assert open(dest_path, 'rb').read() == tmpdir.join(name).read_binary()
+    finally:
+        bundle.close()
+
+    # Compressible members are packed smaller than they are
+    assert os.path.getsize(bundle_path) < 10000
+
+
+def test_reject_corrupted_bundle(bundle_path, tmpdir):
+    with open(bundle_path, 'r+b') as f:
+        f.seek(-10, os.SEEK_END)
+        f.write(b'\0' * 10)
+    bundle = Bundle(bundle_path)
+    try:
+        with pytest.raises(BundleError):
+            bundle.fetch('testdata/random.in', str(tmpdir.join('random.out')))
+        assert not tmpdir.join('random.out').exists()
+    finally:
+        bundle.close()
+
+    tmpdir.join('not.bundle').write('hello')
+    with pytest.raises(BundleError):
+        Bundle(str(tmpdir.join('not.bundle')))
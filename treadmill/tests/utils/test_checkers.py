@@ -0,0 +1,66 @@
+import pytest
+
+from treadmill.utils.checkers import run_checker
+
+
+@pytest.fixture
+def check(tmpdir):
+    def check(name, target, expected, **options):
+        tmpdir.join('target').write_binary(target)
+        tmpdir.join('expected').write_binary(expected)
+        return run_checker(name, str(tmpdir.join('target')), str(tmpdir.join('expected')),
+                           **options)
+    return check
+
+
+@pytest.mark.parametrize('name, target, expected, equal', [
+    ('exact', b'1 2\n', b'1 2\n', True),
+    ('exact', b'1 2\n', b'1 2', False),
+    ('line', b'1 2  \r\n3\n\n\n', b'1 2\n3', True),
+    ('line', b'1  2\n3\n', b'1 2\n3\n', False),
+    ('line', b'1 2\n\n3\n', b'1 2\n3\n', False),
+    ('token', b'  1\n\n2 \t3', b'1 2 3\n', True),
+    ('token', b'1 2 3 4', b'1 2 3', False),
+    ('case_insensitive', b'Yes\nNO', b'yes no', True),
+    ('case_insensitive', b'yes', b'yess', False),
+    ('float', b'0.3333334 x 1e9', b'0.333333 x 1000000999', True),
+    ('float', b'0.334', b'0.333', False),
+    ('float', b'x', b'0.333', False),
+    ('float', b'nan', b'0', False),
+    ('float', b'1_000', b'1000', False),
+    ('float', b'inf', b'infinity', False),
+    ('float', b'nan', b'NaN', False),
+    ('float', b'-.5e+3', b'-500', True)
+])
+def test_checkers(check, name, target, expected, equal):
+    assert bool(check(name, target, expected)) is equal
+
+
+def test_float_epsilons(check):
+    assert check('float', b'1.5', b'1', abs_epsilon=0.5, rel_epsilon=0)
+    assert not check('float', b'1.5', b'1', abs_epsilon=0.1, rel_epsilon=0.1)
+    assert check('float', b'110', b'100', abs_epsilon=0, rel_epsilon=0.1)
+
+
+def test_locate_difference_across_chunks(check, monkeypatch):
+    monkeypatch.setattr('treadmill.utils.checkers.CHUNK_SIZE', 5)
+    expected = b''.join(b'%d %d\n' % (i, i * i) for i in range(100))
+    target = expected.replace(b'50 2500', b'50 2501')
+
+    start = target.index(b'50 2501')
+    # Exact locates the byte, line the line and the others the token
+    for name, offset in [('exact', start + 6), ('line', start), ('token', start + 3),
+                         ('float', start + 3)]:
+        comparison = check(name, target, expected)
+        assert (comparison.offset, comparison.line) == (offset, 51)
+        assert check(name, expected, expected)
+
+
+def test_line_read_in_chunks(check, monkeypatch):
+    monkeypatch.setattr('treadmill.utils.checkers.CHUNK_SIZE', 4)
+    line = b'1 \t  2' * 10
+    assert check('line', line + b'   \t \r\n\n \n', line)
+    comparison = check('line', b'x\n' + line + b'3', b'x\n' + line)
+    assert (comparison.offset, comparison.line) == (2, 2)
+    comparison = check('line', b'x\n' + line + b'\n \n', b'x\n' + line + b'\n\n3')
+    assert (comparison.offset, comparison.line) == (len(line) + 3, 3)
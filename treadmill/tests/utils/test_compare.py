@@ -0,0 +1,67 @@
+import pytest
+
+from treadmill.utils import compare
+from treadmill.utils.compare import compare_files
+
+
+@pytest.fixture
+def files(tmpdir):
+    def write(target, expected):
+        tmpdir.join('target').write_binary(target)
+        tmpdir.join('expected').write_binary(expected)
+        return compare_files(str(tmpdir.join('target')), str(tmpdir.join('expected')))
+    return write
+
+
+@pytest.mark.parametrize('target, expected', [
+    (b'1 2\n3 4\n', b'1 2\n3 4'),
+    (b'\n  1 2\r\n3 4\r\n\r\n', b'1 2\n3 4\n'),
+    (b'1\r2', b'1\n2'),
+    (b'', b' \n\t'),
+    (b'', b'')
+])
+def test_equal_with_surrounding_whitespace(files, target, expected):
+    assert files(target, expected)
+
+
+def test_locate_first_difference(files):
+    comparison = files(b'\n1 2\r\n3 5\r\n', b'1 2\n3 4\n')
+    assert not comparison
+    assert (comparison.offset, comparison.line) == (8, 3)
+
+    comparison = files(b'1 2\n3', b'1 2\n3 4')
+    assert (comparison.offset, comparison.line) == (5, 2)  # Target ended early
+
+    assert not files(b'1 2\n 3', b'1 2\n3')
+
+
+def test_compare_across_chunks(files, monkeypatch):
+    monkeypatch.setattr(compare, 'CHUNK_SIZE', 7)
+    expected = b''.join(b'%d %d\n' % (i, i * i) for i in range(100))
+    assert files(expected.replace(b'\n', b'\r\n') + b'\r\n' * 10, expected)
+
+    target = expected.replace(b'50 2500', b'50 2501')
+    comparison = files(target, expected)
+    assert (comparison.offset, comparison.line) == (target.index(b'2501') + 3, 51)
+
+
+def test_normalized_digest_matches_comparison(tmpdir):
+    tmpdir.join('a').write_binary(b'\n 1 2\r\n3 4\r\n\r\n')
+    tmpdir.join('b').write_binary(b'1 2\n3 4')
+    digest, length = compare.normalized_digest(str(tmpdir.join('a')))
+    assert (digest, length) == compare.normalized_digest(str(tmpdir.join('b')))
+    assert length == 7
+    assert compare.normalized_digest(str(tmpdir.join('a')), max_length=5) == (None, 7)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 1 << 16])
+def test_carriage_returns_across_chunks(files, tmpdir, monkeypatch, chunk_size):
+    monkeypatch.setattr(compare, 'CHUNK_SIZE', chunk_size)
+    target, expected = b'x\r\r\ny\r\rz', b'x\n\ny\n\nz'
+    assert files(target, expected)
+    assert compare.normalized_digest(str(tmpdir.join('target'))) == \
+        compare.normalized_digest(str(tmpdir.join('expected')))
+
+    # A chunk ending in the first \r of \r\r\n
+    monkeypatch.setattr(compare, 'CHUNK_SIZE', 1 << 16)
+    assert files(b'x' * 65535 + b'\r\r\ny', b'x' * 65535 + b'\n\ny')
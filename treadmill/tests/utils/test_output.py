@@ -0,0 +1,24 @@
+from treadmill.utils import BoundedBuffer
+
+
+def test_output_within_limit_is_kept_whole():
+    buffer = BoundedBuffer(limit=16)
+    buffer.write(b'hello ')
+    buffer.write(b'world')
+    assert not buffer.truncated
+    assert buffer.getvalue() == b'hello world'
+
+
+def test_head_and_tail_are_kept_beyond_limit():
+    buffer = BoundedBuffer(limit=8)
+    for chunk in (b'abc', b'defghij', b'klmnop', b'qrstuvwxyz'):
+        buffer.write(chunk)
+
+    assert buffer.total == 26
+    assert buffer.getvalue() == b'abcd\n... [18 bytes truncated] ...\nwxyz'
+
+
+def test_zero_limit_disables_truncation():
+    buffer = BoundedBuffer()
+    buffer.write(b'x' * 100000)
+    assert buffer.getvalue() == b'x' * 100000
@@ -1,3 +1,7 @@
 from .datamodel import *
 from .objectdict import *
 from .misc import *
+from .pool import *
+from .output import *
+from .compare import *
+from .checkers import *
@@ -0,0 +1,180 @@
+"""
+Built-in output checkers, run on the host in place of a grader. Every
+checker streams both files and stops at the first difference, which is
+located in the target by the returned `Comparison`.
+"""
+import functools
+import hashlib
+import math
+import os
+import re
+
+from .compare import CHUNK_SIZE, Comparison
+
+__all__ = [
+    'CHECKERS',
+    'run_checker'
+]
+
+
+_TOKEN = re.compile(rb'[^ \t\n\r\x0b\x0c]+')
+# A newline, a run of other whitespace or a run of anything else
+_LINE_PART = re.compile(rb'(\n)|([ \t\r\x0b\x0c]+)|[^ \t\n\r\x0b\x0c]+')
+# Decimal or scientific notation only, unlike `float()` (e.g. no 1_000 or inf)
+_FLOAT = re.compile(rb'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?')
+
+
+def _read_chunks(f):
+    return iter(lambda: f.read(CHUNK_SIZE), b'')
+
+
+def _tokens(path):
+    """
+    Yields (token, offset, line) of the whitespace-separated tokens, then
+    (None, offset, line) of the end of the file.
+    """
+    with open(path, 'rb') as f:
+        buf, offset, line = b'', 0, 1  # `offset` and `line` are those of buf[0]
+        for chunk in _read_chunks(f):
+            buf += chunk
+            cut, pos = len(buf), 0
+            for match in _TOKEN.finditer(buf):
+                if match.end() == len(buf):
+                    cut = match.start()  # May go on in the next chunk
+                    break
+                line += buf.count(b'\n', pos, match.start())
+                pos = match.start()
+                yield match.group(), offset + pos, line
+            line += buf.count(b'\n', pos, cut)
+            offset += cut
+            buf = buf[cut:]
+        if buf:
+            yield buf, offset, line
+            offset += len(buf)
+        yield None, offset, line
+
+
+def _lines(path):
+    """
+    Yields (digest, offset, line number) of the lines without their trailing
+    whitespace, then (None, offset, line number) of the end of the file.
+    Blank lines at the end of the file are skipped. Lines are read in chunks
+    and stand for by their digest, so that no line is held in memory whole.
+    """
+    with open(path, 'rb') as f:
+        fd = f.fileno()
+        blanks = []  # (offset, line number) of blank lines not yielded yet
+        line_offset, number, last_number = 0, 1, 1
+        digest, blank = hashlib.sha1(), True
+        whitespace_offset = None  # Of the whitespace that may be trailing
+        offset = 0
+
+        def end_line():
+            if blank:
+                blanks.append((line_offset, number))
+                return
+            for blank_offset, blank_number in blanks:
+                yield _EMPTY_LINE, blank_offset, blank_number
+            blanks.clear()
+            yield digest.digest(), line_offset, number
+
+        for chunk in _read_chunks(f):
+            for match in _LINE_PART.finditer(chunk):
+                pos = offset + match.start()
+                if match.group(1):
+                    yield from end_line()
+                    last_number = number
+                    line_offset, number = pos + 1, number + 1
+                    digest, blank, whitespace_offset = hashlib.sha1(), True, None
+                elif match.group(2):
+                    if whitespace_offset is None:
+                        whitespace_offset = pos
+                else:
+                    if whitespace_offset is not None:
+                        # Not trailing after all, read it back
+                        for start in range(whitespace_offset, pos, CHUNK_SIZE):
+                            digest.update(os.pread(fd, min(CHUNK_SIZE, pos - start), start))
+                        whitespace_offset = None
+                    digest.update(match.group())
+                    blank = False
+            offset += len(chunk)
+        if line_offset < offset:
+            yield from end_line()  # Not ended by a newline
+            last_number = number
+        if blanks:
+            yield (None, *blanks[0])
+        else:
+            yield None, offset, last_number
+
+
+_EMPTY_LINE = hashlib.sha1().digest()
+
+
+def _compare(targets, expecteds, equal):
+    for (target, offset, line), (expected, _, _) in zip(targets, expecteds):
+        if target is None and expected is None:
+            return Comparison()
+        if target is None or expected is None or not equal(target, expected):
+            return Comparison(offset, line)
+
+
+def check_exact(target_path, expected_path):
+    """Files must be byte-for-byte identical"""
+    with open(target_path, 'rb') as target, open(expected_path, 'rb') as expected:
+        offset, line = 0, 1
+        while True:
+            a, b = target.read(CHUNK_SIZE), expected.read(CHUNK_SIZE)
+            if a != b:
+                index = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y),
+                             min(len(a), len(b)))
+                return Comparison(offset + index, line + a.count(b'\n', 0, index))
+            if not a:
+                return Comparison()
+            offset += len(a)
+            line += a.count(b'\n')
+
+
+def check_lines(target_path, expected_path):
+    """Lines must be equal but for trailing whitespace and blank lines at the end"""
+    return _compare(_lines(target_path), _lines(expected_path), bytes.__eq__)
+
+
+def check_tokens(target_path, expected_path, equal=bytes.__eq__):
+    """Whitespace-separated tokens must be equal"""
+    return _compare(_tokens(target_path), _tokens(expected_path), equal)
+
+
+def _float_equal(abs_epsilon, rel_epsilon, target, expected):
+    if target == expected:
+        return True
+    if not (_FLOAT.fullmatch(target) and _FLOAT.fullmatch(expected)):
+        return False
+    a, b = float(target), float(expected)
+    if not (math.isfinite(a) and math.isfinite(b)):
+        return a == b
+    diff = abs(a - b)
+    return diff <= abs_epsilon or diff <= rel_epsilon * abs(b)
+
+
+def check_floats(target_path, expected_path, abs_epsilon=1e-6, rel_epsilon=1e-6):
+    """
+    Tokens must be equal, except numbers which may differ by `abs_epsilon`
+    or by `rel_epsilon` relative to the expected one.
+    """
+    equal = functools.partial(_float_equal, abs_epsilon, rel_epsilon)
+    return check_tokens(target_path, expected_path, equal=equal)
+
+
+CHECKERS = {
+    'exact': check_exact,
+    'line': check_lines,
+    'token': check_tokens,
+    'case_insensitive': functools.partial(
+        check_tokens, equal=lambda target, expected: target.lower() == expected.lower()
+    ),
+    'float': check_floats
+}
+
+
+def run_checker(name, target_path, expected_path, **options) -> Comparison:
+    return CHECKERS[name](target_path, expected_path, **options)
@@ -0,0 +1,162 @@
+import hashlib
+import mmap
+
+__all__ = [
+    'Comparison',
+    'compare_files',
+    'normalized_digest'
+]
+
+
+# Bytes `str.strip` strips (non-ASCII whitespace is not)
+WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+CHUNK_SIZE = 1 << 16
+
+
+class Comparison(object):
+    """
+    Result of `compare_files`. Truthy when the files are equal; otherwise
+    `offset` and `line` (from 1) locate the first difference in the target.
+    """
+
+    def __init__(self, offset=None, line=None):
+        self.offset = offset
+        self.line = line
+
+    def __bool__(self):
+        return self.offset is None
+
+    def __repr__(self):
+        if self:
+            return 'Comparison(equal)'
+        return f'Comparison(offset={self.offset}, line={self.line})'
+
+
+def _normalize(raw):
+    return raw.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+class _Side(object):
+    """Whitespace-stripped content of a file, read in normalized chunks"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            f.seek(0, 2)
+            size = f.tell()
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.start, self.end = self._strip_bounds(size)
+        self.lines = 1 + sum(chunk.count(b'\n') for chunk, _ in self._chunks(0, self.start))
+        self._reader = self._chunks(self.start, self.end)
+        self._raw = b''  # Raw bytes of `pending`'s chunk
+        self._raw_start = self.start
+        self._normalized = b''
+        self.pending = b''  # Normalized bytes not compared yet
+
+    def _strip_bounds(self, size):
+        start = 0
+        while start < size:
+            chunk = self._data[start:start + CHUNK_SIZE]
+            stripped = chunk.lstrip(WHITESPACE)
+            start += len(chunk) - len(stripped)
+            if stripped:
+                break
+        end = size
+        while end > start:
+            chunk = self._data[max(start, end - CHUNK_SIZE):end]
+            stripped = chunk.rstrip(WHITESPACE)
+            end -= len(chunk) - len(stripped)
+            if stripped:
+                break
+        return start, end
+
+    def _chunks(self, start, end):
+        """Yields (normalized chunk, raw chunk) of the bytes in [start, end)"""
+        pos = start
+        while pos < end:
+            raw = self._data[pos:min(pos + CHUNK_SIZE, end)]
+            if raw.endswith(b'\r') and pos + len(raw) < end:
+                # Keeps \r\n together: the \r goes with the next chunk
+                if len(raw) > 1:
+                    raw = raw[:-1]
+                elif self._data[pos + 1:pos + 2] == b'\n':
+                    raw = b'\r\n'
+            yield _normalize(raw), raw
+            pos += len(raw)
+
+    def fill(self):
+        for normalized, raw in self._reader:
+            self._raw_start += len(self._raw)
+            self._raw, self._normalized, self.pending = raw, normalized, normalized
+            return
+
+    def consume(self, size):
+        self.lines += self.pending.count(b'\n', 0, size)
+        self.pending = self.pending[size:]
+
+    def offset(self, index=0):
+        """Raw file offset of the `index`-th pending byte"""
+        remaining = len(self._normalized) - len(self.pending) + index
+        pos = 0
+        while remaining > 0 and pos < len(self._raw):
+            pos += 2 if self._raw[pos:pos + 2] == b'\r\n' else 1
+            remaining -= 1
+        return self._raw_start + pos
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+
+
+def compare_files(target_path, expected_path) -> Comparison:
+    """
+    Compares two files ignoring leading and trailing whitespace and the
+    kind of line endings, with the files mapped rather than read so that
+    memory use stays constant. Stops at the first difference.
+    """
+    target, expected = _Side(target_path), _Side(expected_path)
+    try:
+        while True:
+            if not target.pending:
+                target.fill()
+            if not expected.pending:
+                expected.fill()
+            if not target.pending or not expected.pending:
+                if target.pending or expected.pending:
+                    # One of them ended early
+                    return Comparison(target.offset(), target.lines)
+                return Comparison()
+
+            size = min(len(target.pending), len(expected.pending))
+            if target.pending[:size] == expected.pending[:size]:
+                target.consume(size)
+                expected.consume(size)
+                continue
+
+            index = next(i for i in range(size) if target.pending[i] != expected.pending[i])
+            offset = target.offset(index)
+            target.consume(index)
+            return Comparison(offset, target.lines)
+    finally:
+        target.close()
+        expected.close()
+
+
+def normalized_digest(path, max_length=None):
+    """
+    Returns the sha1 hex digest and the length of the file as
+    `compare_files` sees it: without surrounding whitespace and with \\n
+    line endings. Stops early with None as the digest once it is longer
+    than `max_length`.
+    """
+    side = _Side(path)
+    try:
+        sha1, length = hashlib.sha1(), 0
+        for normalized, _ in side._chunks(side.start, side.end):
+            length += len(normalized)
+            if max_length is not None and length > max_length:
+                return None, length
+            sha1.update(normalized)
+        return sha1.hexdigest(), length
+    finally:
+        side.close()
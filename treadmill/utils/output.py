@@ -0,0 +1,47 @@
+__all__ = [
+    'BoundedBuffer'
+]
+
+
+class BoundedBuffer(object):
+    """
+    Output buffer holding at most `limit` bytes. Once the limit is exceeded
+    only the head and the tail of the output are kept, joined by a marker
+    telling how many bytes were dropped in between. A limit of 0 disables
+    truncation.
+    """
+
+    marker = b'\n... [%d bytes truncated] ...\n'
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.total = 0
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._head_limit = limit // 2
+        self._tail_limit = limit - self._head_limit
+
+    @property
+    def truncated(self):
+        return self.limit > 0 and self.total > self.limit
+
+    def write(self, chunk: bytes):
+        self.total += len(chunk)
+        if not self.limit:
+            self._head += chunk
+            return
+
+        room = self._head_limit - len(self._head)
+        if room > 0:
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+        if chunk:
+            self._tail += chunk
+            if len(self._tail) > self._tail_limit:
+                del self._tail[:len(self._tail) - self._tail_limit]
+
+    def getvalue(self) -> bytes:
+        if not self.truncated:
+            return bytes(self._head + self._tail)
+        dropped = self.total - len(self._head) - len(self._tail)
+        return bytes(self._head) + self.marker % dropped + bytes(self._tail)
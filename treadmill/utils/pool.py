@@ -0,0 +1,47 @@
+import contextlib
+import threading
+
+
+__all__ = [
+    'ResourcePool'
+]
+
+
+class ResourcePool(object):
+    """
+    Thread-safe pool of reusable resource tokens (isolate box ids, cpu ids).
+
+    `acquire()` blocks until enough tokens are free and hands out the lowest
+    free tokens first, so allocations stay deterministic.
+    """
+
+    def __init__(self, resources):
+        self._free = sorted(resources)
+        self._size = len(self._free)
+        self._cond = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    def acquire(self, count=1, timeout=None):
+        if count > self._size:
+            raise ValueError(f'Cannot acquire {count} of {self._size} resources')
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._free) >= count, timeout):
+                raise TimeoutError(f'No {count} free resources within {timeout}s')
+            acquired, self._free = self._free[:count], self._free[count:]
+            return acquired
+
+    def release(self, resources):
+        with self._cond:
+            self._free = sorted(self._free + list(resources))
+            self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def lease(self, count=1, timeout=None):
+        resources = self.acquire(count, timeout)
+        try:
+            yield resources
+        finally:
+            self.release(resources)
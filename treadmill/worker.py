@@ -6,6 +6,7 @@ from dramatiq.brokers.redis import RedisBroker
 
 from treadmill.config import BaseConfig, DevConfig
 from treadmill.context import JudgeContextFactory
+from treadmill.langs import Python36
 from treadmill.models import JudgeRequest
 from treadmill.tasks import JudgePipeline, EnqueuePipeline
 from treadmill.utils import cached
@@ -35,6 +36,22 @@ class WorkerFactory(object):
         dramatiq.set_broker(self.broker)
         self.context_factory = JudgeContextFactory(config)
 
+        # Accept messages only after every image is present on this node
+        self.context_factory.image_registry.prepare()
+        self.context_factory.image_registry.start_refresh()
+
+        # Containers of crashed workers would otherwise keep running forever
+        self.context_factory.container_reaper.sweep()
+        self.context_factory.container_reaper.start()
+        self.context_factory.workspace_cleaner.sweep()
+        self.context_factory.workspace_cleaner.start()
+
+        if self.context_factory.container_pool:
+            self.context_factory.container_pool.start()
+
+        # Probe the host interpreter once instead of on the first submission
+        Python36.instance().host_python(config)
+
     def _judge(self, request_data):
         request = JudgeRequest.load(request_data)
         _logger.info('Received ' + str(request))